@@ -1,7 +1,36 @@
-from .utils import *
-from .cli import *
-from .app import *
-from .utils.background import *
+from importlib import import_module
+
 from .global_var import *
+from .cli import *
 
 from ._version import __version__
+
+# Heavy modules pull in gradio, pandas and scraibe (torch, whisper, pyannote).
+# They are only imported on first access, so that e.g. `scraibe-webui version` stays fast.
+_LAZY_IMPORTS = {
+    "App": ".app",
+    "threadLimiter": ".utils.background",
+    "BoundedThread": ".utils.background",
+    "BackgroundThread": ".utils.background",
+    "normalize_filename": ".utils.background",
+}
+
+_LAZY_SUBMODULES = {"app", "ui", "utils"}
+
+def __getattr__(name):
+    if name in _LAZY_SUBMODULES:
+        return import_module(f".{name}", __name__)
+    
+    if name not in _LAZY_IMPORTS:
+        utils = import_module(".utils", __name__)
+        if name in utils._LAZY_IMPORTS:
+            return getattr(utils, name)
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    value = getattr(import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    utils = import_module(".utils", __name__)
+    return sorted(set(globals()) | set(_LAZY_IMPORTS) | set(utils._LAZY_IMPORTS))
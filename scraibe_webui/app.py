@@ -1,5 +1,23 @@
 from .utils.appconfigloader import AppConfigLoader
 from .ui import gradio_Interface
+from .utils.janitor import Janitor
+from .utils.warmup import start_preload
+from .utils.status import status_route
+from .utils.metrics import enable as enable_metrics, metrics_route
+from .utils.tracing import configure as configure_tracing
+from .utils.profiling import configure as configure_profiling
+from .utils.spool import Spool
+from .utils.pool import ModelPool
+from .utils.scheduler import JobScheduler
+from .utils.langdetect import configure as configure_language_detection
+from .utils.vad import configure as configure_vad
+from .utils.windowed import configure as configure_windowed_diarisation
+from .utils.eta import configure as configure_eta
+from .utils.cancel import configure as configure_cancellation, cancel_routes
+from .utils.resume import configure as configure_checkpoints
+from .utils.shutdown import GracefulShutdown
+from .utils.singleflight import configure as configure_single_flight
+import scraibe_webui.global_var as gv
 
 class App(AppConfigLoader):
     def __init__(self, config: str = None, **kwargs):
@@ -14,6 +32,9 @@ class App(AppConfigLoader):
                       respective section in `config.yaml`.
         """
         super(App, self).__init__(config, **kwargs)
+        
+        self.janitor = None
+        self.shutdown = None
 
     def start(self):
         """
@@ -21,15 +42,84 @@ class App(AppConfigLoader):
 
         Initializes the Gradio web interface with settings from a YAML configuration file
         and/or keyword arguments. The function manages AI models, handling their loading 
-        into RAM and unloading after a session or specified timeout.
+        into RAM and unloading after a session or specified timeout. If `advanced.preload_models`
+        is set the models are loaded and warmed up in the background while the server starts.
 
         Returns:
             None
         """
         print("Starting Gradio Web Interface")
+        
+        janitor_config = self.advanced.get("janitor") or {}
+        
+        if janitor_config.get("enabled"):
+            self.janitor = Janitor.from_config(janitor_config).start()
+        
+        spool_config = self.advanced.get("spool") or {}
+        
+        if spool_config.get("enabled") and self.interface_type == "async":
+            gv.SPOOL = Spool.from_config(spool_config)
+        
+        if self.interface_type == "async" and gv.SPOOL is None:
+            gv.SCHEDULER = JobScheduler.from_config(self.advanced, self.scraibe_params).start()
+        
+        shutdown_config = self.advanced.get("shutdown") or {}
+        
+        if shutdown_config.get("enabled"):
+            self.shutdown = GracefulShutdown.from_config(shutdown_config, self.mail).install()
+        
+        routing_config = self.advanced.get("model_routing") or {}
+        
+        if routing_config.get("enabled"):
+            gv.MODEL_POOL = ModelPool.from_config(routing_config, self.scraibe_params)
+        
+        if self.advanced.get("preload_models"):
+            # after the model pool, whose models are preloaded instead of a single pipeline
+            start_preload(self.scraibe_params, self.advanced.get("keep_model_alive"))
+        else:
+            gv.READY = True
+        
+        if self.advanced.get("status_endpoint"):
+            self.add_routes(status_route(self.advanced.get("status_endpoint")))
+        
+        configure_tracing(self.advanced.get("tracing"))
+        configure_profiling(self.advanced.get("profile_jobs"))
+        configure_language_detection(self.advanced.get("language_detection"))
+        configure_vad(self.advanced.get("vad"))
+        configure_windowed_diarisation(self.advanced.get("windowed_diarisation"))
+        configure_eta(self.advanced.get("eta"))
+        configure_checkpoints(self.advanced.get("checkpoints"), gv.SPOOL.path if gv.SPOOL is not None else None)
+        configure_single_flight(self.advanced.get("single_flight"))
+        
+        if self.shutdown is not None:
+            # after the model pool and checkpoints are configured, which the restored jobs use
+            self.shutdown.restore(self.scraibe_params, self.scraibe_params.get("num_threads"))
+        
+        cancellation_config = self.advanced.get("cancellation") or {}
+        configure_cancellation(cancellation_config)
+        
+        if cancellation_config.get("enabled") and gv.SCHEDULER is not None:
+            self.add_routes(*cancel_routes(cancellation_config.get("path") or "/cancel",
+                                           cancellation_config.get("admin_token")))
+        
+        if self.advanced.get("metrics_endpoint"):
+            enable_metrics()
+            self.add_routes(metrics_route(self.advanced.get("metrics_endpoint")))
 
         interface = gradio_Interface(self)
         interface.queue(**self.queue)
         interface.launch(**self.launch)
-    
-    
\ No newline at end of file
+
+    def add_routes(self, *routes) -> None:
+        """
+        Adds starlette routes to the FastAPI app created by Gradio.
+
+        The routes are passed to the app through the `app_kwargs` of the launch configuration,
+        so they are registered before the routes of Gradio itself.
+
+        Args:
+            *routes (Route): The routes to add.
+        """
+        app_kwargs = self.launch.get("app_kwargs") or {}
+        app_kwargs["routes"] = list(app_kwargs.get("routes") or []) + list(routes)
+        self.launch["app_kwargs"] = app_kwargs
@@ -7,16 +7,19 @@ output formats, and other options necessary for transcription.
 from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
 from .utils._parsekwargs import ParseKwargs
-from .app import App
 from ._version import __version__
 
 def start_command(args):
     """
     Function to start the Gradio Web Interface with the given configuration and server arguments.
     """
+    # imported here since the app pulls in gradio and the models
+    from .app import App
+    from .utils.tune import auto_tune
+    
     config = args.config
     server_kwargs = args.server_kwargs
-    app = App.load_config(config, **server_kwargs)
+    app = App.load_config(config, **{**auto_tune(config), **server_kwargs})
     app.start()
 
 def version_command(args):
@@ -25,6 +28,137 @@ def version_command(args):
     """
     print(f"Scraibe WebUI CLI version {__version__}")
 
+def profile_report_command(args):
+    """
+    Function to aggregate the collapsed stack files of profiled jobs into a hotspot report.
+    """
+    from .utils.profiling import aggregate_profiles
+    
+    report = aggregate_profiles(args.directory, top=args.top)
+    
+    for kind in ("self", "inclusive"):
+        print(f"Top {args.top} hotspots ({kind}):")
+        for entry in report[kind]:
+            print(f"{entry['share']:7.2%}  {entry['weight']:>12.0f}  {entry['frame']}")
+        print()
+
+def transcribe_command(args):
+    """
+    Function to transcribe media files from directories or glob patterns without the Web Interface.
+    """
+    from .utils.configloader import ConfigLoader
+    from .utils.batch import BatchTranscriber
+    
+    config = ConfigLoader.load_config(args.config)
+    scraibe_params = dict(config.config.get("scraibe_params") or {})
+    num_threads = scraibe_params.pop("num_threads", None)
+    if scraibe_params.get("device") is None:
+        from scraibe.misc import SCRAIBE_TORCH_DEVICE
+        scraibe_params["device"] = SCRAIBE_TORCH_DEVICE
+    
+    batch = BatchTranscriber(scraibe_params,
+                             workers=args.workers,
+                             threads_per_worker=num_threads if scraibe_params["device"] == "cpu" else None,
+                             output_dir=args.output_dir,
+                             manifest_path=args.manifest,
+                             pin_workers=not args.no_pin)
+    summary = batch.run(args.inputs, task=args.task,
+                        num_speakers=args.num_speakers,
+                        translate=args.translate,
+                        language=args.language)
+    
+    print(f"Done: {summary['done']}, failed: {summary['failed']}, skipped: {summary['skipped']}. "
+          f"Manifest: {batch.manifest.path}")
+
+def bench_command(args):
+    """
+    Function to benchmark the overhead of the WebUI with a stub transcription backend.
+    """
+    import json
+    from .utils.bench import run_benchmarks, compare_results
+    
+    results = run_benchmarks(args.suite, rounds=args.rounds, latency=args.latency,
+                             rtf=args.rtf, duration=args.duration)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+    
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        print(f"Comparison of the mean latency against {args.compare}:")
+        for entry in compare_results(baseline, results):
+            ratio = f"{entry['ratio']:.2f}x" if entry['ratio'] is not None else "n/a"
+            print(f"{entry['name']:<28} {entry['old']:>12.6f}s {entry['new']:>12.6f}s {ratio:>8}")
+
+def loadtest_command(args):
+    """
+    Function to load test the Web Interface with simulated users and a stub transcription backend.
+    """
+    import json
+    from .utils.loadtest import LoadTest
+    
+    results = {}
+    for interface_type in args.interface:
+        with LoadTest(interface_type, config=args.config, task=args.task, latency=args.latency,
+                      rtf=args.rtf, clip_duration=args.clip_duration, port=args.port) as test:
+            print(f"Load testing the {interface_type} interface at {test.url}")
+            print(f"{'users':>5} {'requests':>8} {'errors':>7} {'req/s':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'rss MiB':>8}")
+            stages = []
+            for users in args.users:
+                stage = test.run_stage(users, args.stage_duration).to_dict()
+                stages.append(stage)
+                latency = [f"{stage[k]:8.3f}" if stage[k] is not None else f"{'n/a':>8}" for k in ("p50", "p95", "p99")]
+                rss = f"{stage['rss_max'] / 2**20:8.1f}" if stage['rss_max'] else f"{'n/a':>8}"
+                print(f"{users:>5} {stage['requests']:>8} {stage['error_rate']:>7.1%} {stage['throughput']:>7.2f} {' '.join(latency)} {rss}")
+            results[interface_type] = stages
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+def worker_command(args):
+    """
+    Function to run jobs from the spool of the async interface with a resident model.
+    """
+    from .utils.worker import run_worker_processes
+    
+    run_worker_processes(args.config, processes=args.processes, pin=not args.no_pin,
+                         spool_path=args.spool, poll_interval=args.poll_interval,
+                         threads_per_model=args.threads, max_jobs=args.max_jobs)
+
+def tune_command(args):
+    """
+    Function to measure candidate backend configurations and write the fastest one into a config overlay.
+    """
+    import json
+    from .utils.configloader import ConfigLoader
+    from .utils.tune import get_candidates, tune, write_overlay
+    
+    scraibe_params = ConfigLoader.load_config(args.config).config.get("scraibe_params") or {}
+    device = args.device or scraibe_params.get("device")
+    if device is None:
+        from scraibe.misc import SCRAIBE_TORCH_DEVICE
+        device = SCRAIBE_TORCH_DEVICE
+    
+    candidates = get_candidates(str(device), backends=args.backends, workers=args.workers)
+    result = tune(model=args.model or scraibe_params.get("whisper_model"), device=str(device),
+                  clip=args.clip, clip_duration=args.clip_duration, repeats=args.repeats,
+                  max_memory=args.max_memory * 2**20 if args.max_memory else None,
+                  candidates=candidates)
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    if write_overlay(result, args.output) is not None:
+        # the overlay only holds the tuned settings, it is applied on top of the customized config
+        print(f"Best configuration: {result['best']}.\n"
+              f"Apply it by setting `advanced.auto_tune.enabled: true` and `advanced.auto_tune.overlay: {args.output}` "
+              f"in {args.config or 'your config.yaml'} and starting `scraibe-webui start` or `scraibe-webui worker` with it.")
+
 def create_parser():
     """
     Create the top-level parser and subparsers.
@@ -48,6 +182,128 @@ def create_parser():
     parser_version = subparsers.add_parser('version', help='Show the version of the CLI')
     parser_version.set_defaults(func=version_command)
     
+    # Parser for the "profile-report" command
+    parser_profile = subparsers.add_parser('profile-report', help='Aggregate the profiles of profiled jobs into a hotspot report')
+    parser_profile.add_argument("directory", type=str, nargs='?', default="profiles",
+                                help="Directory containing the collapsed stack files of the profiled jobs.")
+    parser_profile.add_argument("-n", "--top", type=int, default=20,
+                                help="Number of hotspots to show.")
+    parser_profile.set_defaults(func=profile_report_command)
+    
+    # Parser for the "transcribe" command
+    parser_transcribe = subparsers.add_parser('transcribe', help='Transcribe media files without the Web Interface')
+    parser_transcribe.add_argument("inputs", type=str, nargs='+',
+                                   help="Media files, directories or glob patterns (quote them to prevent shell expansion).")
+    parser_transcribe.add_argument("-c", "--config", type=str, default=None,
+                                   help="Path to the customized config.yaml file, only `scraibe_params` are used.")
+    parser_transcribe.add_argument("-o", "--output-dir", type=str, default=None,
+                                   help="Directory for the results. By default they are written next to the inputs.")
+    parser_transcribe.add_argument("-w", "--workers", type=int, default=1,
+                                   help="Number of worker processes, each holding its own model.")
+    parser_transcribe.add_argument("--task", type=str, default='Auto Transcribe',
+                                   choices=['Auto Transcribe', 'Transcribe', 'Diarisation'],
+                                   help="Task to run on every file.")
+    parser_transcribe.add_argument("--language", type=str, default=None,
+                                   help="Language of the files. By default the language is detected.")
+    parser_transcribe.add_argument("--num-speakers", type=int, default=0,
+                                   help="Number of speakers, 0 if unknown.")
+    parser_transcribe.add_argument("--translate", action='store_true',
+                                   help="Translate the transcripts to English.")
+    parser_transcribe.add_argument("--no-pin", action='store_true',
+                                   help="Do not pin the worker processes to disjoint sets of CPU cores.")
+    parser_transcribe.add_argument("--manifest", type=str, default=None,
+                                   help="Path to the manifest used to resume interrupted runs. Defaults to `scraibe_manifest.jsonl` in the output or working directory.")
+    parser_transcribe.set_defaults(func=transcribe_command)
+    
+    # Parser for the "bench" command
+    parser_bench = subparsers.add_parser('bench', help='Benchmark the overhead of the WebUI with a stub transcription backend')
+    parser_bench.add_argument("-s", "--suite", type=str, nargs='+', default=["config", "mail", "sync", "async"],
+                              choices=["config", "mail", "sync", "async"],
+                              help="Benchmarks to run.")
+    parser_bench.add_argument("-r", "--rounds", type=int, default=20,
+                              help="Number of measured calls or submitted jobs per benchmark.")
+    parser_bench.add_argument("--latency", type=float, default=0.0,
+                              help="Seconds the stub backend spends per model call.")
+    parser_bench.add_argument("--rtf", type=float, default=0.0,
+                              help="Seconds the stub backend spends per second of audio.")
+    parser_bench.add_argument("--duration", type=float, default=10.0,
+                              help="Duration of the synthetic benchmark clip in seconds.")
+    parser_bench.add_argument("-o", "--output", type=str, default=None,
+                              help="Write the JSON results to this file instead of stdout.")
+    parser_bench.add_argument("--compare", type=str, default=None,
+                              help="JSON results of a previous run to compare against.")
+    parser_bench.set_defaults(func=bench_command)
+    
+    # Parser for the "loadtest" command
+    parser_loadtest = subparsers.add_parser('loadtest', help='Load test the Web Interface with simulated users and a stub transcription backend')
+    parser_loadtest.add_argument("-i", "--interface", type=str, nargs='+', default=["simple", "async"],
+                                 choices=["simple", "async"],
+                                 help="Interface types to load test.")
+    parser_loadtest.add_argument("-u", "--users", type=int, nargs='+', default=[1, 2, 4, 8],
+                                 help="Number of concurrent users of each load stage.")
+    parser_loadtest.add_argument("-d", "--stage-duration", type=float, default=30.0,
+                                 help="Seconds per load stage.")
+    parser_loadtest.add_argument("-c", "--config", type=str, default=None,
+                                 help="Path to the customized config.yaml file used for the server.")
+    parser_loadtest.add_argument("--task", type=str, default='Transcribe',
+                                 choices=['Auto Transcribe', 'Transcribe', 'Diarisation'],
+                                 help="Task submitted by the users.")
+    parser_loadtest.add_argument("--latency", type=float, default=0.5,
+                                 help="Seconds the stub backend spends per model call.")
+    parser_loadtest.add_argument("--rtf", type=float, default=0.0,
+                                 help="Seconds the stub backend spends per second of audio.")
+    parser_loadtest.add_argument("--clip-duration", type=float, default=10.0,
+                                 help="Duration of the uploaded synthetic clip in seconds.")
+    parser_loadtest.add_argument("--port", type=int, default=None,
+                                 help="Port of the server. Defaults to a free port.")
+    parser_loadtest.add_argument("-o", "--output", type=str, default=None,
+                                 help="Write the JSON results to this file.")
+    parser_loadtest.set_defaults(func=loadtest_command)
+    
+    # Parser for the "worker" command
+    parser_worker = subparsers.add_parser('worker', help='Run the jobs of the async interface from the spool directory')
+    parser_worker.add_argument("-c", "--config", type=str, default=None,
+                               help="Path to the customized config.yaml file, `scraibe_params`, `mail` and `advanced.spool` are used.")
+    parser_worker.add_argument("--spool", type=str, default=None,
+                               help="Path to the spool directory. Overrides `advanced.spool.path`.")
+    parser_worker.add_argument("--poll-interval", type=float, default=None,
+                               help="Seconds to wait when no job is pending. Overrides `advanced.spool.poll_interval`.")
+    parser_worker.add_argument("-p", "--processes", type=int, default=None,
+                               help="Number of worker processes, each holding its own model. Overrides `advanced.spool.processes`.")
+    parser_worker.add_argument("--no-pin", action='store_true',
+                               help="Do not pin the worker processes to disjoint sets of CPU cores.")
+    parser_worker.add_argument("--threads", type=int, default=None,
+                               help="Number of torch threads per worker. Defaults to the worker's share of the cores when pinned.")
+    parser_worker.add_argument("--max-jobs", type=int, default=None,
+                               help="Stop after this many jobs.")
+    parser_worker.set_defaults(func=worker_command)
+    
+    # Parser for the "tune" command
+    parser_tune = subparsers.add_parser('tune', help='Find the fastest backend, compute type and thread count for this host')
+    parser_tune.add_argument("-c", "--config", type=str, default=None,
+                             help="Path to the customized config.yaml file, `scraibe_params` provides the model and device.")
+    parser_tune.add_argument("-o", "--output", type=str, default="tuned.yaml",
+                             help="Path of the config overlay with the best configuration.")
+    parser_tune.add_argument("--model", type=str, default=None,
+                             help="The Whisper model. Overrides `scraibe_params.whisper_model`.")
+    parser_tune.add_argument("--device", type=str, default=None,
+                             help="The device. Overrides `scraibe_params.device`.")
+    parser_tune.add_argument("--clip", type=str, default=None,
+                             help="A short representative recording. Defaults to a synthetic clip.")
+    parser_tune.add_argument("--clip-duration", type=float, default=30.0,
+                             help="Duration of the synthetic clip in seconds.")
+    parser_tune.add_argument("-r", "--repeats", type=int, default=2,
+                             help="Number of measured transcriptions per candidate and worker.")
+    parser_tune.add_argument("--backends", nargs='+', default=None, choices=["whisper", "faster-whisper"],
+                             help="The backends to try.")
+    parser_tune.add_argument("-w", "--workers", nargs='+', type=int, default=None,
+                             help="The worker counts to try, the cores are split between the workers. Defaults to 1 2 4 on the CPU.")
+    parser_tune.add_argument("--max-memory", type=int, default=None,
+                             help="Only select configurations using at most this many MiB of memory.")
+    parser_tune.add_argument("--json", type=str, default=None,
+                             help="Write all measurements to this JSON file.")
+    parser_tune.set_defaults(func=tune_command)
+    
     return parser
 
 def cli():
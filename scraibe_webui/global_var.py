@@ -1,10 +1,26 @@
 from os.path import dirname, realpath
+from collections import deque
 
 ROOT_PATH = dirname(realpath(__file__)).split('scraibe_webui')[0]
 
 # Variables for Live Interface
 PIPE = None
+MODEL_POOL = None # routes jobs to models and keeps them in memory, None uses a single model
 
 # Variables for Mail Interface
 MAX_CONCURRENT_MODELS: int = 1
-NUMBER_OF_QUEUE: int = 0
\ No newline at end of file
+NUMBER_OF_QUEUE: int = 0
+SPOOL = None # spool the async interface writes its jobs to, None runs them in-process
+SCHEDULER = None # queues and runs the in-process async jobs
+
+# Files referenced by queued or running jobs (path -> number of references)
+ACTIVE_FILES: dict = {}
+
+# Readiness of the app, set once the models are preloaded and warmed up
+READY: bool = False
+PRELOAD_FAILED: bool = False # the models could not be preloaded, the app never becomes ready
+DRAINING: bool = False # set on SIGTERM, new jobs are refused while the running ones finish
+
+# Load report of the app
+ACTIVE_WORKERS: int = 0
+RECENT_RTF: deque = deque(maxlen=50) # real-time factors of the recently finished jobs
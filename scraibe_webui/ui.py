@@ -195,7 +195,8 @@ def gradio_Interface(config : AppConfigLoader) -> gr.Blocks:
                                             upload_notification_format_options],
                                 outputs=[output],
                                 show_progress=False,
-                                concurrency_limit = None)
+                                concurrency_limit = None,
+                                api_name="run_scraibe_async")
                 
     
             else:
@@ -223,7 +224,8 @@ def gradio_Interface(config : AppConfigLoader) -> gr.Blocks:
                                         json_accordion,
                                         annoation,
                                         annotate],
-                                concurrency_limit = None)
+                                concurrency_limit = None,
+                                api_name="run_scraibe")
             
                             
     return demo
\ No newline at end of file
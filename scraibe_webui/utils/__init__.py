@@ -1,7 +1,102 @@
-from .appconfigloader import *
-from .configloader import *
-from .interactions import *
-from .wrapper import *
-from .lang import *
-from .themes import *
-from ._parsekwargs import *
\ No newline at end of file
+from importlib import import_module
+
+from ._parsekwargs import *
+
+# Most utilities depend on gradio, pandas or scraibe (torch, whisper, pyannote).
+# They are only imported on first access to keep the start up of the CLI fast.
+_LAZY_IMPORTS = {
+    "InterfaceTypeWarning": ".appconfigloader",
+    "AppConfigLoader": ".appconfigloader",
+    "ConfigLoader": ".configloader",
+    "select_task": ".interactions",
+    "select_origin": ".interactions",
+    "annotate_output": ".interactions",
+    "get_pipe": ".interactions",
+    "get_model_name": ".interactions",
+    "run_scraibe": ".interactions",
+    "show_notification": ".interactions",
+    "run_scraibe_async": ".interactions",
+    "apply_settings": ".interactions",
+    "ScraibeWrapper": ".wrapper",
+    "LANGUAGES": ".lang",
+    "ForestOceanTheme": ".themes",
+    "Janitor": ".janitor",
+    "register_files": ".janitor",
+    "release_files": ".janitor",
+    "get_active_files": ".janitor",
+    "get_upload_folder": ".janitor",
+    "create_warmup_clip": ".warmup",
+    "preload_models": ".warmup",
+    "start_preload": ".warmup",
+    "get_media_duration": ".media",
+    "get_total_duration": ".media",
+    "track_job": ".status",
+    "get_status": ".status",
+    "status_route": ".status",
+    "MetricsRegistry": ".metrics",
+    "REGISTRY": ".metrics",
+    "time_stage": ".metrics",
+    "queue_depth": ".metrics",
+    "metrics_route": ".metrics",
+    "Tracer": ".tracing",
+    "trace_job": ".tracing",
+    "span": ".tracing",
+    "JobProfiler": ".profiling",
+    "profile_job": ".profiling",
+    "aggregate_profiles": ".profiling",
+    "BatchManifest": ".batch",
+    "BatchTranscriber": ".batch",
+    "collect_inputs": ".batch",
+    "StubScraibe": ".stub",
+    "SMTPSink": ".stub",
+    "use_stub_backend": ".stub",
+    "benchmark": ".bench",
+    "run_benchmarks": ".bench",
+    "compare_results": ".bench",
+    "LoadTest": ".loadtest",
+    "get_rss": ".loadtest",
+    "Spool": ".spool",
+    "SpoolWorker": ".worker",
+    "run_worker_processes": ".worker",
+    "available_cores": ".affinity",
+    "partition_cores": ".affinity",
+    "pin_process": ".affinity",
+    "TuneCandidate": ".tune",
+    "get_candidates": ".tune",
+    "write_overlay": ".tune",
+    "load_overlay": ".tune",
+    "auto_tune": ".tune",
+    "ModelRouter": ".pool",
+    "ModelPool": ".pool",
+    "LanguageDetector": ".langdetect",
+    "media_hash": ".media",
+    "SpeechMap": ".vad",
+    "VoiceActivityFilter": ".vad",
+    "WindowedDiariser": ".windowed",
+    "JobScheduler": ".scheduler",
+    "QueueFullError": ".scheduler",
+    "format_duration": ".scheduler",
+    "RTFStore": ".eta",
+    "hardware_id": ".eta",
+    "CancelToken": ".cancel",
+    "JobCancelled": ".cancel",
+    "run_isolated": ".isolation",
+    "CheckpointStore": ".resume",
+    "PartialResultError": ".resume",
+    "JobJournal": ".shutdown",
+    "GracefulShutdown": ".shutdown",
+    "SingleFlight": ".singleflight",
+    "flight_key": ".singleflight",
+    "transcribe_batch": ".batching",
+}
+
+def __getattr__(name):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    value = getattr(import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_IMPORTS))
@@ -0,0 +1,98 @@
+"""
+affinity.py
+
+This module partitions the CPU cores of the host between worker processes.
+
+Torch, OpenMP and MKL size their thread pools per process. When several worker processes run
+side by side, each of them would otherwise start one thread per core and the workers would
+compete for the same cores. Instead, each worker process is pinned to a disjoint set of cores
+with `os.sched_setaffinity`, and its thread pools are sized to the number of cores in its set.
+
+Functions:
+    available_cores: Get the cores the current process may run on.
+    partition_cores: Split the cores into disjoint sets, one per worker.
+    pin_process: Pin the current process to a set of cores and size its thread pools.
+"""
+import os
+import warnings
+from typing import Iterable, List, Optional
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                   "NUMEXPR_NUM_THREADS", "VECLIB_MAXIMUM_THREADS")
+
+
+def available_cores() -> List[int]:
+    """Get the cores the current process may run on.
+
+    Returns:
+        List[int]: The ids of the available cores.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def partition_cores(workers: int, cores: Optional[Iterable[int]] = None) -> List[List[int]]:
+    """Split the cores into disjoint sets of nearly equal size, one per worker.
+
+    Neighbouring cores are kept together, so a worker's cores are likely to share caches.
+    If there are more workers than cores, the cores are shared round robin.
+
+    Args:
+        workers (int): The number of workers.
+        cores (Iterable[int], optional): The cores to split. Defaults to `available_cores()`.
+
+    Returns:
+        List[List[int]]: The cores of every worker.
+    """
+    cores = sorted(cores) if cores is not None else available_cores()
+    workers = max(int(workers), 1)
+
+    if workers > len(cores):
+        warnings.warn(f"{workers} workers but only {len(cores)} cores available, cores are shared.")
+        return [[cores[i % len(cores)]] for i in range(workers)]
+
+    size, remainder = divmod(len(cores), workers)
+    partitions, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < remainder else 0)
+        partitions.append(cores[start:end])
+        start = end
+    return partitions
+
+
+def pin_process(cores: Iterable[int]) -> int:
+    """Pin the current process to a set of cores and size its thread pools accordingly.
+
+    Call this at the start of a worker process, before torch or numpy is imported, so that
+    OpenMP and MKL pick up the thread counts.
+
+    Args:
+        cores (Iterable[int]): The cores of the process.
+
+    Returns:
+        int: The number of threads per pool.
+    """
+    cores = sorted(cores)
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError as e:
+            warnings.warn(f"Could not pin the process to cores {cores}: {e}")
+
+    threads = max(len(cores), 1)
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    os.environ["SCRAIBE_NUM_THREADS"] = str(threads)
+
+    try:
+        import torch
+    except ImportError:
+        return threads
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(max(threads // 2, 1))
+    except RuntimeError:
+        pass  # can only be set once and before any parallel work
+    return threads
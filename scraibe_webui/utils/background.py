@@ -1,8 +1,13 @@
 import re
+import shutil
+import warnings
+from time import time
 from unicodedata import normalize
 
 from os import remove
-from os.path import join, split
+from os.path import join, split, splitext
+from typing import Any, Callable, Dict, List, Optional, Union
+from uuid import uuid4
 
 from threading import Thread, BoundedSemaphore, active_count
 from scraibe.misc import set_threads
@@ -11,6 +16,13 @@ from scraibe_webui.global_var import MAX_CONCURRENT_MODELS
 import scraibe_webui.global_var as gv
 from .mail import MailService
 from .wrapper import ScraibeWrapper
+from .janitor import register_files, release_files
+from .status import track_job
+from .metrics import JOB_STAGE_SECONDS, BATCH_SIZE, time_stage
+from .tracing import span
+from .cancel import JobCancelled, checkpoint
+from .resume import PartialResultError, get_checkpoint_store
+from .singleflight import run_once
 
 threadLimiter = BoundedSemaphore(MAX_CONCURRENT_MODELS)
 
@@ -34,9 +46,8 @@ class BackgroundThread:
     """
     def __init__(self, mail_service_params : dict,
                         scraibe_kwargs : dict,
-                        threads_per_model : int = 4, 
-                        
-                        
+                        threads_per_model : int = 4,
+                        pipe : ScraibeWrapper = None
                         ) -> None:
         """
         Background Thread for transcribing audio and sending the result to the client using Email. This class contains all the necessary methods to run the background process.
@@ -45,11 +56,138 @@ class BackgroundThread:
             mail_service_params (dict): The mail service parameters.
             scraibe_kwargs (dict): The model parameters.
             threads_per_model (int, optional): The number of threads per model. Defaults to 4.  If set to 0 the number of threads will be set to the number of cores available.
+            pipe (ScraibeWrapper, optional): A resident model used for all jobs. Defaults to None, which loads the model for every job.
         
         """
         self.mail_service_params = mail_service_params
         self.scraibe_kwargs = scraibe_kwargs
         self.threads_per_model = threads_per_model
+        self.pipe = pipe
+        
+    def get_model_name(self, sources : List[str], language : str) -> str:
+        """
+        Gets the name of the model of a job, routed by the pool if model routing is enabled.
+        
+        Args:
+            sources (List[str]): The media of the job.
+            language (str): The language of the job.
+        
+        Returns:
+            str: The name of the model.
+        """
+        if self.pipe is None and gv.MODEL_POOL is not None:
+            return gv.MODEL_POOL.route(sources, language, self.scraibe_kwargs.get("whisper_model"))
+        return self.scraibe_kwargs.get("whisper_model")
+    
+    def get_model(self, model : str) -> ScraibeWrapper:
+        """
+        Gets the model of a job: the resident model, the routed model of the pool or a newly loaded one.
+        
+        Args:
+            model (str): The name of the model, see `get_model_name`.
+        
+        Returns:
+            ScraibeWrapper: The loaded model.
+        """
+        if self.pipe is not None:
+            return self.pipe
+        if gv.MODEL_POOL is not None:
+            return gv.MODEL_POOL.get(model)
+        with time_stage("model_load"):
+            return ScraibeWrapper.load_from_dict(self.scraibe_kwargs)
+    
+    def process_file(self,
+                     _scraibe : ScraibeWrapper,
+                     audio : str,
+                     task : str,
+                     num_speakers : int,
+                     translate : bool,
+                     language : str,
+                     model : str = None) -> List[str]:
+        """
+        Runs the task on a single file and writes the results next to it. An identical
+        computation which is in flight is waited for instead of running the model again.
+        
+        Args:
+            _scraibe (ScraibeWrapper): The loaded model.
+            audio (str): The path to the media file.
+            task (str): The task to run. One of 'Auto Transcribe', 'Transcribe' or 'Diarisation'.
+            num_speakers (int): The number of speakers in the file.
+            translate (bool): Whether to translate the transcription.
+            language (str): The language of the file.
+            model (str, optional): The name of the routed model, see `get_model_name`. Defaults to the configured model.
+        
+        Returns:
+            List[str]: The paths of the written result files.
+        """
+        _out_base_filename = normalize_filename(splitext(audio)[0])
+        
+        temp_file_path_txt = f'{_out_base_filename}.txt'
+        temp_file_path_json = f'{_out_base_filename}.json'
+        
+        # keyed by the model which runs, like the simple interface
+        params = {"task": task, "model": model or self.scraibe_kwargs.get("whisper_model"), "translate": translate,
+                  "language": language, "num_speakers": num_speakers if task != 'Transcribe' else None}
+        
+        if task == 'Auto Transcribe':
+            result, _ = run_once(audio, lambda: _scraibe.autotranscribe(audio,
+                                                                        num_speakers = num_speakers,
+                                                                        translate = translate,
+                                                                        language = language), **params)
+            _ , result_txt, result_json = result
+            
+            with span("write_results"):
+                with open(temp_file_path_txt, 'w') as temp_file:
+                    temp_file.write(str(result_txt))
+                
+                with open(temp_file_path_json, 'w', encoding='utf-8') as temp_file:
+                    temp_file.write(str(result_json))
+            
+            return [temp_file_path_txt, temp_file_path_json]
+        
+        elif task == 'Transcribe':
+            result, _ = run_once(audio, lambda: _scraibe.transcribe(audio,
+                                                                    translate = translate,
+                                                                    language = language), **params)
+            
+            with span("write_results"):
+                with open(temp_file_path_txt, 'w') as temp_file:
+                    temp_file.write(str(result))
+            
+            return [temp_file_path_txt]
+        
+        elif task == 'Diarisation':
+            result, _ = run_once(audio, lambda: _scraibe.diarisation(audio, num_speakers = num_speakers), **params)
+            
+            with span("write_results"):
+                with open(temp_file_path_json, 'w') as temp_file:
+                    temp_file.write(result)
+            
+            return [temp_file_path_json]
+        
+        else:
+            raise ValueError(f"Invalid task: {task}")
+    
+    def process_file_retrying(self, retries : int, *args, **kwargs) -> List[str]:
+        """
+        Runs `process_file` and tries a failed file `retries` more times. Cancellation is not retried.
+        
+        Args:
+            retries (int): How often a failed file is tried again.
+            *args, **kwargs: The arguments of `process_file`.
+        
+        Returns:
+            List[str]: The paths of the written result files.
+        """
+        for attempt in range(retries + 1):
+            try:
+                return self.process_file(*args, **kwargs)
+            except JobCancelled:
+                raise
+            except Exception as e:
+                if attempt == retries:
+                    raise
+                warnings.warn(f"Processing {args[1]} failed, trying again ({attempt + 1}/{retries}): {e!r}")
         
     def parrallel_task(self,
                        audio : str,
@@ -59,10 +197,22 @@ class BackgroundThread:
                        translate : bool,
                        language : str,
                        error_format_options : dict = {},
-                       success_format_option : dict = {}
-                       ) -> None:
+                       success_format_option : dict = {},
+                       submitted_at : float = None,
+                       job_id : str = None,
+                       followers : Callable[[], List[Dict[str, Any]]] = None
+                       ) -> Optional[Exception]:
         
-        """ Background task that runs in a separate thread """
+        """
+        Background task that runs in a separate thread. Returns the exception if the job failed.
+        
+        With checkpointing enabled the results of every finished file are kept under the job id,
+        so a job which is run again after a crash resumes at its first unfinished file. Once the
+        job is done, `followers` is called to get the identical jobs which receive its result.
+        """
+        
+        if submitted_at is not None:
+            JOB_STAGE_SECONDS.observe(time() - submitted_at, stage="queue_wait")
         
         if self.threads_per_model  is not None:
             set_threads(yaml_threads = self.threads_per_model) 
@@ -70,106 +220,212 @@ class BackgroundThread:
         # List to store temporary files
         temp_files = []
         
+        _scraibe = None
+        error = None
+        
+        sources = [audio] if isinstance(audio, str) else list(audio)
+        
+        store = get_checkpoint_store() if job_id is not None else None
+        finished = store.load(job_id, sources) if store is not None else {}
+        results = {} # index -> result files of every finished file, including the resumed ones
+        failed = []
+        
         try:
-            # setup Scraibe if not already setup
-           
-            _scraibe = ScraibeWrapper.load_from_dict(self.scraibe_kwargs)
-            
-            if isinstance(audio, str):
-                
-                _out_base_filename = normalize_filename(audio.split('.')[0])
-                
-                temp_file_path_txt = join(f'{_out_base_filename}.txt')
-                temp_file_path_json = join(f'{_out_base_filename}.json')
-                
-                
-                if task == 'Auto Transcribe':
-
-                    _ , result_txt, result_json = _scraibe.autotranscribe(audio,
-                                                        num_speakers = num_speakers,
-                                                        translate = translate,
-                                                        language = language)
-
-                    with open(temp_file_path_txt, 'w') as temp_file:
-                        temp_file.write(str(result_txt))
-                    
-                    with open(temp_file_path_json, 'w', encoding='utf-8') as temp_file:
-                           temp_file.write(str(result_json))
-                    
-                    temp_files.append(temp_file_path_txt)
-                    temp_files.append(temp_file_path_json)                   
+            with track_job(audio, interface="async", job_id=job_id, task=task, files=len(sources),
+                           resumed=len(finished)) as job_info:
+                checkpoint() # a job cancelled before it started does not load a model
+                # setup Scraibe if not already setup
+                model = self.get_model_name(sources, language)
+                _scraibe = self.get_model(model)
+                job_info["model"] = _scraibe.model_name
                 
-                elif task == 'Transcribe':
-                    result = _scraibe.transcribe(audio,
-                                                    translate = translate,
-                                                    language = language)
-
-                    with open(temp_file_path_txt, 'w') as temp_file:
-                        temp_file.write(str(result))
-                    
-                    temp_files.append(temp_file_path_txt)
-                
-                elif task == 'Diarisation':
-                    result = _scraibe.diarisation(audio, num_speakers = num_speakers)
-                    
-                    with open(temp_file_path_json, 'w') as temp_file:
-                        temp_file.write(result)
-                    
-                    temp_files.append(temp_file_path_json)
-                
-            elif isinstance(audio, list):
-                
-                for aud in audio:
-                    
-                    temp_file_path_txt = join(aud.split('.')[0] + '.txt')
-                    temp_file_path_json = join(aud.split('.')[0] + '.json')
-                    
-                    
-                    if task == 'Auto Transcribe':
-                        _ , result_txt, result_json = _scraibe.autotranscribe(aud,
-                                                        num_speakers = num_speakers,
-                                                        translate = translate,
-                                                        language = language)
-                       
-                        with open(temp_file_path_txt, 'w') as temp_file:
-                            temp_file.write(str(result_txt))
-                    
-                        with open(temp_file_path_json, 'w', encoding='utf-8') as temp_file:
-                            temp_file.write(str(result_json))
-                        
-                        temp_files.append(temp_file_path_txt)
-                        temp_files.append(temp_file_path_json)                   
+                for i, aud in enumerate(sources):
+                    checkpoint()
+                    if i in finished:
+                        results[i] = finished[i]
+                        continue
+                    with span("file", file=split(aud)[1]):
+                        try:
+                            paths = self.process_file_retrying(store.retries if store is not None else 0,
+                                                               _scraibe, aud, task,
+                                                               num_speakers, translate, language,
+                                                               model = model)
+                        except JobCancelled:
+                            raise
+                        except Exception as e:
+                            if store is None or not store.partial_results:
+                                raise
+                            failed.append((split(aud)[1], e))
+                            continue
+                    temp_files.extend(paths)
+                    results[i] = paths
+                    if store is not None:
+                        store.save(job_id, i, aud, paths)
                 
-                    elif task == 'Transcribe':
-                        result = _scraibe.transcribe(aud,
-                                                    translate = translate,
-                                                    language = language)
-
-                        with open(temp_file_path_txt, 'w') as temp_file:
-                            temp_file.write(str(result))
-                    
-                        temp_files.append(temp_file_path_txt)
-                        
-                    elif task == 'Diarisation':
-                        result = _scraibe.diarisation(aud, num_speakers = num_speakers)
-                        
-                        with open(temp_file_path_json, 'w') as temp_file:
-                            temp_file.write(result)
-                    
-                        temp_files.append(temp_file_path_json)
-
-            MailService.from_config(self.mail_service_params).send_transcript(receiver_email=reciever, transcript_paths = temp_files, **success_format_option)
+                checkpoint()
+                if failed and not results:
+                    raise failed[0][1]
+                MailService.from_config(self.mail_service_params).send_transcript(receiver_email=reciever, transcript_paths = [path for i in sorted(results) for path in results[i]], **success_format_option)
+                if failed:
+                    raise PartialResultError(failed, len(sources))
+        
+        except JobCancelled as cancelled:
+            error = cancelled
+            if cancelled.notify:
+                MailService.from_config(self.mail_service_params).send_error_notification(receiver_email = reciever, exception_message = cancelled, **error_format_options)
         
         except Exception as exeption:
-            
+            error = exeption
             MailService.from_config(self.mail_service_params).send_error_notification(receiver_email = reciever, exception_message = exeption, **error_format_options)
         
+        if followers is not None:
+            self.send_to_followers(followers(), results, error)
+        
         for file in temp_files:
             remove(file)
         
+        if store is not None and not getattr(error, "requeue", False):
+            store.clear(job_id)
+        release_files(audio)
         gv.NUMBER_OF_QUEUE -= 1
         del _scraibe # Delete Scraibe object after use
+        return error
+        
+    def parrallel_batch(self, jobs : List[Dict[str, Any]]) -> List[Optional[Exception]]:
+        """
+        Runs the short Transcribe jobs of several users together with one model.
+        
+        The model is loaded once for the whole batch and the files of all jobs are transcribed in
+        one batched inference call where the backend supports it. Every job still gets its own
+        result files and mail. All jobs must share the model, language and translate option.
+        
+        Args:
+            jobs (List[Dict[str, Any]]): The jobs queued by the `JobScheduler`.
+        
+        Returns:
+            List[Optional[Exception]]: The exception of every failed job or None.
+        """
+        started = time()
+        for job in jobs:
+            JOB_STAGE_SECONDS.observe(started - job["submitted_at"], stage="queue_wait")
+        BATCH_SIZE.observe(len(jobs))
+        
+        if self.threads_per_model  is not None:
+            set_threads(yaml_threads = self.threads_per_model)
+        
+        sources = [[job["audio"]] if isinstance(job["audio"], str) else list(job["audio"]) for job in jobs]
+        flat = [s for job_sources in sources for s in job_sources]
+        translate, language = jobs[0]["translate"], jobs[0]["language"]
+        
+        _scraibe = None
+        try:
+            with track_job(flat, interface="async", job_id=uuid4().hex, task="Transcribe", files=len(flat),
+                           jobs=[job["job_id"] for job in jobs]) as job_info:
+                checkpoint() # e.g. cancelled while the batch was gathered
+                # a batch is routed like its first job
+                _scraibe = self.get_model(self.get_model_name(sources[0], language))
+                job_info["model"] = _scraibe.model_name
+                results = _scraibe.transcribe_batch(flat, translate = translate, language = language)
+        except Exception as exeption:
+            results = [exeption] * len(flat)
+        
+        errors = []
+        for job, job_sources in zip(jobs, sources):
+            job_results, results = results[:len(job_sources)], results[len(job_sources):]
+            errors.append(self.send_batch_result(job, job_sources, job_results))
+        
+        del _scraibe
+        return errors
+    
+    def send_batch_result(self,
+                          job : Dict[str, Any],
+                          sources : List[str],
+                          results : List[Union[str, Exception]]) -> Optional[Exception]:
+        """
+        Writes the transcripts of one job of a batch and mails them to its reciever. A job cancelled
+        while its batch ran gets no transcript.
         
+        Args:
+            job (Dict[str, Any]): The job queued by the `JobScheduler`.
+            sources (List[str]): The media of the job.
+            results (List[Union[str, Exception]]): The transcript of every file or the exception it failed with.
+        
+        Returns:
+            Optional[Exception]: The exception if the job failed.
+        """
+        temp_files = []
+        error = next((r for r in results if isinstance(r, Exception)), None)
+        
+        try:
+            if job.get("cancelled") is not None:
+                raise job["cancelled"]
+            if error is not None:
+                raise error
+            
+            for aud, text in zip(sources, results):
+                temp_file_path_txt = f'{normalize_filename(splitext(aud)[0])}.txt'
+                with open(temp_file_path_txt, 'w') as temp_file:
+                    temp_file.write(str(text))
+                temp_files.append(temp_file_path_txt)
+            
+            MailService.from_config(self.mail_service_params).send_transcript(receiver_email=job["reciever"], transcript_paths = temp_files, **(job.get("transcript_format_options") or {}))
+        
+        except JobCancelled as cancelled:
+            error = cancelled
+            if cancelled.notify:
+                MailService.from_config(self.mail_service_params).send_error_notification(receiver_email = job["reciever"], exception_message = cancelled, **(job.get("error_format_options") or {}))
+        
+        except Exception as exeption:
+            error = exeption
+            MailService.from_config(self.mail_service_params).send_error_notification(receiver_email = job["reciever"], exception_message = exeption, **(job.get("error_format_options") or {}))
+        
+        if job.get("seal") is not None:
+            self.send_to_followers(job["seal"](), {i: [path] for i, path in enumerate(temp_files)}, error)
+        
+        for file in temp_files:
+            remove(file)
+        
+        release_files(job["audio"])
+        gv.NUMBER_OF_QUEUE -= 1
+        return error
+    
+    def send_to_followers(self,
+                          followers : List[Dict[str, Any]],
+                          results : Dict[int, List[str]],
+                          error : Optional[Exception]) -> None:
+        """
+        Sends the result of a job to the identical jobs which followed it, named after their own files.
+        
+        Args:
+            followers (List[Dict[str, Any]]): The following jobs queued by the `JobScheduler`.
+            results (Dict[int, List[str]]): The result files of every finished file by its index.
+            error (Optional[Exception]): The exception the job failed with.
+        """
+        for follower in followers:
+            sources = [follower["audio"]] if isinstance(follower["audio"], str) else list(follower["audio"])
+            copies = []
+            try:
+                paths = []
+                for i, files in sorted(results.items()):
+                    for path in files:
+                        copy = f'{normalize_filename(splitext(sources[i])[0])}{splitext(path)[1]}'
+                        if copy != path: # identical uploads can share their path
+                            shutil.copyfile(path, copy)
+                            copies.append(copy)
+                        paths.append(copy)
+                
+                if paths and (error is None or isinstance(error, PartialResultError)):
+                    MailService.from_config(self.mail_service_params).send_transcript(receiver_email=follower["reciever"], transcript_paths = paths, **(follower.get("transcript_format_options") or {}))
+                if error is not None and getattr(error, "notify", True):
+                    MailService.from_config(self.mail_service_params).send_error_notification(receiver_email = follower["reciever"], exception_message = error, **(follower.get("error_format_options") or {}))
+            except Exception as e:
+                warnings.warn(f"Could not send the result to job {follower['job_id']}: {e!r}")
+            
+            for file in copies:
+                remove(file)
+            release_files(follower["audio"])
+            gv.NUMBER_OF_QUEUE -= 1
+    
     def run(self,
             audio : str,
             reciever : str,
@@ -180,6 +436,7 @@ class BackgroundThread:
             error_format_options : dict = {},
             transcript_format_options : dict = {}, *args, **kwargs):
         """ Run the background process """
+        register_files(audio) # protect the uploaded media from the janitor until the job is done
         _thread = BoundedThread(target=self.parrallel_task,
                                 args=(audio,
                                       reciever,
@@ -189,7 +446,7 @@ class BackgroundThread:
                                     language,
                                     error_format_options,
                                     transcript_format_options, *args),
-                                kwargs=kwargs).start()
+                                kwargs={"submitted_at": time(), "job_id": uuid4().hex, **kwargs}).start()
         return _thread
     
     @property
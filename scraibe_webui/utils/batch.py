@@ -0,0 +1,319 @@
+"""
+batch.py
+
+This module provides the headless batch transcription behind `scraibe-webui transcribe`.
+
+Input directories and glob patterns are expanded into a list of media files which are processed
+by a pool of worker processes. Each worker loads the model once and reuses it for all files it
+receives. The result of every file is recorded in a JSON lines manifest, so an interrupted run
+can be restarted with the same arguments and skips all files that are already done.
+
+Classes:
+    BatchManifest: Records the state of every file of a batch run.
+    BatchTranscriber: Runs a task on many files with a pool of worker processes.
+
+Functions:
+    collect_inputs: Expand directories and glob patterns into media files.
+"""
+import os
+import json
+from glob import glob
+from time import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from queue import Empty
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from tqdm import tqdm
+
+from .affinity import partition_cores, pin_process
+
+MEDIA_EXTENSIONS = (".mp3", ".wav", ".m4a", ".flac", ".ogg", ".opus", ".aac", ".wma",
+                    ".mp4", ".mkv", ".avi", ".mov", ".webm")
+
+TASKS = ('Auto Transcribe', 'Transcribe', 'Diarisation')
+
+# model of the current worker process
+_worker_pipe = None
+
+
+def collect_inputs(inputs: Iterable[str],
+                   extensions: Iterable[str] = MEDIA_EXTENSIONS) -> List[Tuple[str, str]]:
+    """Expand directories and glob patterns into media files.
+
+    Args:
+        inputs (Iterable[str]): Files, directories or glob patterns.
+        extensions (Iterable[str], optional): File extensions considered as media
+                                              when expanding directories. Defaults to MEDIA_EXTENSIONS.
+
+    Returns:
+        List[Tuple[str, str]]: Pairs of the absolute path of each media file and the directory
+                               its output path is made relative to.
+    """
+    extensions = tuple(e.lower() for e in extensions)
+    found = {}
+
+    for item in inputs:
+        if os.path.isdir(item):
+            base = os.path.abspath(item)
+            for root, _, files in os.walk(base):
+                for name in sorted(files):
+                    if name.lower().endswith(extensions):
+                        found.setdefault(os.path.join(root, name), base)
+        else:
+            matches = glob(item, recursive=True) if any(c in item for c in "*?[") else [item]
+            for path in sorted(matches):
+                if os.path.isfile(path):
+                    path = os.path.abspath(path)
+                    found.setdefault(path, os.path.dirname(path))
+
+    return sorted(found.items())
+
+
+class BatchManifest:
+    """
+    Records the state of every file of a batch run in a JSON lines file.
+
+    Every finished file appends one record, so the manifest survives interruptions.
+    When the same file appears more than once, the latest record wins.
+
+    Attributes:
+        path (str): The path to the manifest.
+        records (Dict[str, Dict[str, Any]]): The latest record per source file.
+    """
+    def __init__(self, path: str) -> None:
+        """
+        Initializes the BatchManifest and loads existing records.
+
+        Args:
+            path (str): The path to the manifest.
+        """
+        self.path = path
+        self.records = {}
+
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # partially written line of an interrupted run
+                    self.records[record["source"]] = record
+
+    def is_done(self, source: str) -> bool:
+        """Check if a file was processed successfully and its outputs still exist.
+
+        Args:
+            source (str): The path to the media file.
+
+        Returns:
+            bool: True if the file can be skipped.
+        """
+        record = self.records.get(source)
+        return (record is not None and record.get("status") == "done"
+                and all(os.path.exists(p) for p in record.get("outputs", [])))
+
+    def add(self, record: Dict[str, Any]) -> None:
+        """Append a record and flush it to disk.
+
+        Args:
+            record (Dict[str, Any]): The record with at least the keys `source` and `status`.
+        """
+        self.records[record["source"]] = record
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _init_worker(scraibe_params: Dict[str, Any], threads: Optional[int] = None,
+                 core_sets: Any = None) -> None:
+    """Pin the worker process to its cores and load the model once per worker process."""
+    global _worker_pipe
+
+    if core_sets is not None:
+        try:
+            pin_process(core_sets.get_nowait())
+        except Empty:
+            pass  # replacement of a crashed worker, keep the default affinity
+
+    from .wrapper import ScraibeWrapper
+
+    if threads:
+        from scraibe.misc import set_threads
+        set_threads(yaml_threads=threads)
+
+    _worker_pipe = ScraibeWrapper.load_from_dict(scraibe_params)
+
+
+def _process_file(source: str, output_base: str, task: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the task on a single file inside a worker and write the results."""
+    start = time()
+    outputs = []
+    try:
+        os.makedirs(os.path.dirname(output_base) or ".", exist_ok=True)
+
+        if task == 'Auto Transcribe':
+            transcript = _worker_pipe.autotranscribe_file(source, **kwargs)
+            with open(f"{output_base}.txt", "w", encoding="utf-8") as f:
+                f.write(str(transcript))
+            with open(f"{output_base}.json", "w", encoding="utf-8") as f:
+                f.write(transcript.get_json())
+            outputs = [f"{output_base}.txt", f"{output_base}.json"]
+
+        elif task == 'Transcribe':
+            text = _worker_pipe.transcribe_file(source, **kwargs)
+            with open(f"{output_base}.txt", "w", encoding="utf-8") as f:
+                f.write(str(text))
+            outputs = [f"{output_base}.txt"]
+
+        elif task == 'Diarisation':
+            diarisation = _worker_pipe.diarise_file(source, **kwargs)
+            with open(f"{output_base}.json", "w", encoding="utf-8") as f:
+                f.write(json.dumps(diarisation, indent=2))
+            outputs = [f"{output_base}.json"]
+
+        else:
+            raise ValueError(f"Invalid task: {task}")
+
+        return {"source": source, "status": "done", "outputs": outputs,
+                "duration": round(time() - start, 3)}
+
+    except Exception as e:
+        return {"source": source, "status": "failed", "outputs": outputs,
+                "error": repr(e), "duration": round(time() - start, 3)}
+
+
+class BatchTranscriber:
+    """
+    Runs a task on many files with a pool of worker processes.
+
+    Attributes:
+        scraibe_params (Dict[str, Any]): The parameters used to load the model in each worker.
+        workers (int): The number of worker processes.
+        threads_per_worker (int): The number of torch threads per worker.
+        pin_workers (bool): Whether each worker process is pinned to a disjoint set of cores.
+        output_dir (str): Directory for the results. None writes them next to the inputs.
+        manifest (BatchManifest): The manifest of the run.
+    """
+    def __init__(self,
+                 scraibe_params: Dict[str, Any],
+                 workers: int = 1,
+                 threads_per_worker: Optional[int] = None,
+                 output_dir: Optional[str] = None,
+                 manifest_path: Optional[str] = None,
+                 pin_workers: bool = True) -> None:
+        """
+        Initializes the BatchTranscriber.
+
+        Args:
+            scraibe_params (dict): The parameters used to load the model in each worker.
+            workers (int, optional): The number of worker processes. Defaults to 1.
+            threads_per_worker (int, optional): The number of torch threads per worker. Defaults to None,
+                                                which uses the worker's share of the cores.
+            output_dir (str, optional): Directory for the results. Defaults to None, which writes
+                                        the results next to the inputs.
+            manifest_path (str, optional): Path to the manifest. Defaults to `scraibe_manifest.jsonl`
+                                           in the output directory or the working directory.
+            pin_workers (bool, optional): Whether each worker process is pinned to a disjoint set
+                                          of cores. Defaults to True.
+        """
+        self.scraibe_params = scraibe_params
+        self.workers = max(int(workers), 1)
+        self.threads_per_worker = threads_per_worker
+        self.pin_workers = pin_workers
+        self.output_dir = os.path.abspath(output_dir) if output_dir else None
+
+        if manifest_path is None:
+            manifest_path = os.path.join(output_dir or os.getcwd(), "scraibe_manifest.jsonl")
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        self.manifest = BatchManifest(manifest_path)
+
+    def output_base(self, source: str, base: str) -> str:
+        """Get the path of the results of a file without the file extension.
+
+        Args:
+            source (str): The path to the media file.
+            base (str): The directory the output path is made relative to.
+
+        Returns:
+            str: The output path without extension.
+        """
+        stem = os.path.splitext(source)[0]
+        if self.output_dir is None:
+            return stem
+        return os.path.join(self.output_dir, os.path.relpath(stem, base))
+
+    @staticmethod
+    def task_kwargs(task: str, num_speakers: int = 0, translate: bool = False,
+                    language: Optional[str] = None) -> Dict[str, Any]:
+        """Build the keyword arguments of the model in the same way as the UI does.
+
+        Args:
+            task (str): The task to run.
+            num_speakers (int, optional): The number of speakers, 0 for unknown. Defaults to 0.
+            translate (bool, optional): Whether to translate to English. Defaults to False.
+            language (str, optional): The language of the files. Defaults to None.
+
+        Returns:
+            Dict[str, Any]: The keyword arguments.
+        """
+        kwargs = {"num_speakers": num_speakers or None}
+        if task != 'Diarisation':
+            kwargs["language"] = language if language not in (None, "Unspecified") else None
+            kwargs["task"] = 'translate' if translate else 'transcribe'
+        return kwargs
+
+    def run(self, inputs: Iterable[str], task: str = 'Auto Transcribe', **task_kwargs: Any) -> Dict[str, int]:
+        """Process all media files found in the inputs which are not done yet.
+
+        Args:
+            inputs (Iterable[str]): Files, directories or glob patterns.
+            task (str, optional): The task to run. Defaults to 'Auto Transcribe'.
+            **task_kwargs (Any): `num_speakers`, `translate` and `language` for the model.
+
+        Returns:
+            Dict[str, int]: Number of files which are done, failed or skipped.
+        """
+        if task not in TASKS:
+            raise ValueError(f"Invalid task: {task}. Must be one of {TASKS}.")
+
+        kwargs = self.task_kwargs(task, **task_kwargs)
+        files = collect_inputs(inputs)
+        todo = [(s, b) for s, b in files if not self.manifest.is_done(s)]
+        summary = {"done": 0, "failed": 0, "skipped": len(files) - len(todo)}
+
+        if not todo:
+            return summary
+
+        progress = tqdm(total=len(todo), desc="Transcribing files")
+
+        def _record(record: Dict[str, Any]) -> None:
+            self.manifest.add(record)
+            summary[record["status"]] += 1
+            progress.update(1)
+
+        if self.workers == 1:
+            _init_worker(self.scraibe_params, self.threads_per_worker)
+            for source, base in todo:
+                _record(_process_file(source, self.output_base(source, base), task, kwargs))
+        else:
+            context = get_context("spawn")
+            core_sets = None
+            if self.pin_workers:
+                core_sets = context.Queue()
+                for cores in partition_cores(self.workers):
+                    core_sets.put(cores)
+
+            with ProcessPoolExecutor(max_workers=self.workers,
+                                     mp_context=context,
+                                     initializer=_init_worker,
+                                     initargs=(self.scraibe_params, self.threads_per_worker, core_sets)) as pool:
+                futures = [pool.submit(_process_file, source, self.output_base(source, base), task, kwargs)
+                           for source, base in todo]
+                for future in as_completed(futures):
+                    _record(future.result())
+
+        progress.close()
+        return summary
@@ -0,0 +1,95 @@
+"""
+batching.py
+
+This module transcribes the short clips of several jobs in one batched inference call.
+
+A single short clip leaves most of the compute of a GPU or of a many-core CPU unused. Backends
+which support batched inference transcribe the clips of several jobs in one call instead:
+
+    faster-whisper: The clips are concatenated and passed to the `BatchedInferencePipeline`
+                    with one clip timestamp per 30 second chunk, so no chunk spans two clips.
+                    The segments are assigned back to their clip by their time.
+    stub backend: `StubTranscriber.transcribe_batch`, used by the load tests.
+
+Other backends, e.g. openai-whisper, transcribe the clips one after the other with the same model.
+
+Functions:
+    transcribe_batch: Transcribe several waveforms, batched where the backend supports it.
+"""
+import warnings
+from bisect import bisect_right
+from typing import Any, List, Optional
+
+import numpy as np
+
+CHUNK_SECONDS = 30 # input length of Whisper and chunk length of the batched pipeline
+
+
+def _faster_whisper_batch(transcriber: Any, waveforms: List[Any], sr: int,
+                          batch_size: int, **kwargs: Any) -> Optional[List[str]]:
+    """Transcribe the clips with the batched pipeline of faster-whisper, None if not possible."""
+    try:
+        from faster_whisper import BatchedInferencePipeline
+    except ImportError:
+        return None
+
+    samples = [(w.cpu().numpy() if hasattr(w, "cpu") else np.asarray(w)).astype(np.float32, copy=False).reshape(-1)
+               for w in waveforms]
+    chunk = CHUNK_SECONDS * sr
+    if sum(len(s) for s in samples) <= chunk:
+        return None # the pipeline would transcribe all clips as a single chunk
+
+    clips, owners, position = [], [], 0
+    for k, s in enumerate(samples):
+        for start in range(0, len(s), chunk):
+            clips.append({"start": position + start, "end": position + min(start + chunk, len(s))})
+            owners.append(k)
+        position += len(s)
+    starts = [clip["start"] / sr for clip in clips]
+
+    whisper_kwargs = transcriber._get_whisper_kwargs(**kwargs)
+    try:
+        segments, _ = BatchedInferencePipeline(model=transcriber.model).transcribe(
+            np.concatenate(samples),
+            language=whisper_kwargs.get("language"),
+            task=whisper_kwargs.get("task", "transcribe"),
+            vad_filter=False,
+            clip_timestamps=clips,
+            batch_size=batch_size)
+
+        texts = [""] * len(samples)
+        for segment in segments:
+            index = max(bisect_right(starts, (segment.start + segment.end) / 2) - 1, 0)
+            texts[owners[index]] += segment.text
+    except (TypeError, ValueError, RuntimeError) as e:
+        warnings.warn(f"Batched inference failed, transcribing the clips one by one: {e}")
+        return None
+    return texts
+
+
+def transcribe_batch(transcriber: Any, waveforms: List[Any], sr: int,
+                     batch_size: int = 8, **kwargs: Any) -> List[str]:
+    """Transcribe several waveforms, batched where the backend supports it.
+
+    Batched inference needs a known language, since the batched pipeline detects the language
+    only once for all clips. Without a language the clips are transcribed one by one.
+
+    Args:
+        transcriber (Transcriber): The loaded transcriber of a Scraibe model.
+        waveforms (List[Union[torch.Tensor, np.ndarray]]): The mono waveforms of the clips.
+        sr (int): The sample rate of the waveforms.
+        batch_size (int, optional): The number of 30 second chunks decoded together. Defaults to 8.
+        **kwargs (Any): Keyword arguments for the transcription, e.g. `language` and `task`.
+
+    Returns:
+        List[str]: The transcript of every waveform.
+    """
+    if hasattr(transcriber, "transcribe_batch"):
+        return list(transcriber.transcribe_batch(waveforms, **kwargs))
+
+    if len(waveforms) > 1 and kwargs.get("language") and not hasattr(transcriber.model, "dims"):
+        texts = _faster_whisper_batch(transcriber, waveforms, sr, batch_size, **kwargs)
+        if texts is not None:
+            return texts
+
+    return [transcriber.transcribe(waveform, **kwargs) for waveform in waveforms]
@@ -0,0 +1,292 @@
+"""
+bench.py
+
+This module benchmarks the overhead of the WebUI itself, behind `scraibe-webui bench`.
+
+The Scraibe model is replaced by the deterministic `StubScraibe` with a configurable latency and
+mails are sent to a local `SMTPSink`, so the results show the cost of queueing, threads, config
+loading, MIME building and the event handlers instead of the Whisper runtime. Every benchmark
+reports latency statistics and throughput in the style of pytest-benchmark. The results are
+emitted as JSON, so runs of different versions can be compared with `compare_results`.
+The config and mail benchmarks are also run by pytest-benchmark from `tests/test_bench.py`.
+
+Functions:
+    benchmark: Call a function repeatedly and compute latency statistics.
+    bench_config_load: Benchmark `ConfigLoader.load_config`.
+    bench_mail: Benchmark `MailService` against a local SMTP sink.
+    bench_sync: Benchmark the sync path `run_scraibe` with the stub backend.
+    bench_async: Benchmark the async queue `run_scraibe_async` with the stub backend.
+    run_benchmarks: Run the selected benchmarks and collect the results.
+    compare_results: Compare the results of two runs.
+"""
+import os
+import sys
+import shutil
+import platform
+import statistics
+import tempfile
+from time import perf_counter, sleep, time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List
+
+from .._version import __version__
+from .stub import SMTPSink, use_stub_backend
+from .warmup import create_warmup_clip
+
+SUITES = ("config", "mail", "sync", "async")
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def _stats(values: List[float]) -> Dict[str, float]:
+    mean = statistics.fmean(values)
+    return {"rounds": len(values),
+            "min": min(values),
+            "max": max(values),
+            "mean": mean,
+            "stddev": statistics.stdev(values) if len(values) > 1 else 0.0,
+            "median": statistics.median(values),
+            "p95": _percentile(values, 0.95),
+            "ops": 1 / mean if mean else 0.0}
+
+
+def benchmark(func: Callable[[], Any], rounds: int = 20, warmup: int = 1) -> Dict[str, float]:
+    """Call a function repeatedly and compute latency statistics.
+
+    Args:
+        func (Callable[[], Any]): The function to benchmark.
+        rounds (int, optional): Number of measured calls. Defaults to 20.
+        warmup (int, optional): Number of calls before measuring. Defaults to 1.
+
+    Returns:
+        Dict[str, float]: min, max, mean, stddev, median and p95 in seconds and the
+            throughput `ops` in calls per second.
+    """
+    for _ in range(warmup):
+        func()
+
+    timings = []
+    for _ in range(max(rounds, 1)):
+        start = perf_counter()
+        func()
+        timings.append(perf_counter() - start)
+    return _stats(timings)
+
+
+def bench_config_load(rounds: int = 50, **kwargs: Any) -> List[Dict[str, Any]]:
+    """Benchmark `ConfigLoader.load_config` with the default configuration.
+
+    Args:
+        rounds (int, optional): Number of measured calls. Defaults to 50.
+
+    Returns:
+        List[Dict[str, Any]]: The benchmark results.
+    """
+    from .configloader import ConfigLoader
+
+    return [{"name": "config_load", "group": "config", "params": {},
+             "stats": benchmark(ConfigLoader.load_config, rounds)}]
+
+
+def bench_mail(rounds: int = 20, attachment_size: int = 65536, **kwargs: Any) -> List[Dict[str, Any]]:
+    """Benchmark building MIME messages and sending them to a local SMTP sink.
+
+    Args:
+        rounds (int, optional): Number of measured calls. Defaults to 20.
+        attachment_size (int, optional): Size of the attached transcript in bytes. Defaults to 64 KiB.
+
+    Returns:
+        List[Dict[str, Any]]: The benchmark results.
+    """
+    from .mail import MailService
+
+    workdir = tempfile.mkdtemp(prefix="scraibe_bench_")
+    attachment = os.path.join(workdir, "transcript.txt")
+    with open(attachment, "w", encoding="utf-8") as f:
+        f.write(("lorem ipsum dolor sit amet " * (attachment_size // 27 + 1))[:attachment_size])
+
+    params = {"attachment_size": attachment_size}
+    try:
+        with SMTPSink() as sink:
+            service = MailService.from_config(sink.mail_config())
+            build = benchmark(lambda: service.setup_message("Bench", "user@localhost", "<p>Bench</p>",
+                                                            [attachment]).as_string(), rounds)
+            send = benchmark(lambda: service.send_transcript("user@localhost", attachment), rounds)
+            if service.mailserver:
+                service.mailserver.quit()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return [{"name": "mail_build_message", "group": "mail", "params": params, "stats": build},
+            {"name": "mail_send_transcript", "group": "mail", "params": params, "stats": send}]
+
+
+class _NoProgress:
+    """Replaces `gradio.Progress` outside of a Gradio event."""
+    track_tqdm = True
+
+    def __call__(self, *args: Any, **kwargs: Any) -> None:
+        pass
+
+
+def bench_sync(rounds: int = 20, latency: float = 0.0, rtf: float = 0.0, duration: float = 10.0,
+               tasks: Iterable[str] = ('Auto Transcribe', 'Transcribe', 'Diarisation'),
+               **kwargs: Any) -> List[Dict[str, Any]]:
+    """Benchmark the sync path `run_scraibe` with the stub backend and a kept alive model.
+
+    Args:
+        rounds (int, optional): Number of measured calls per task. Defaults to 20.
+        latency (float, optional): Seconds per stub model call. Defaults to 0.0.
+        rtf (float, optional): Stub seconds per second of audio. Defaults to 0.0.
+        duration (float, optional): Duration of the benchmark clip in seconds. Defaults to 10.0.
+        tasks (Iterable[str], optional): The tasks to benchmark. Defaults to all tasks.
+
+    Returns:
+        List[Dict[str, Any]]: The benchmark results.
+    """
+    import scraibe_webui.global_var as gv
+    from .wrapper import ScraibeWrapper
+    from .interactions import run_scraibe
+
+    previous_class, previous_pipe = use_stub_backend(latency=latency, rtf=rtf), gv.PIPE
+    gv.PIPE = None
+    clip = create_warmup_clip(duration=duration)
+    results = []
+    try:
+        for task in tasks:
+            stats = benchmark(lambda: run_scraibe(task, 0, False, "Unspecified", clip, None, None,
+                                                  True, {}, progress=_NoProgress()), rounds)
+            results.append({"name": f"sync_{task.lower().replace(' ', '_')}", "group": "sync",
+                            "params": {"task": task, "latency": latency, "rtf": rtf, "duration": duration},
+                            "stats": stats})
+    finally:
+        ScraibeWrapper.model_class, gv.PIPE = previous_class, previous_pipe
+        os.remove(clip)
+    return results
+
+
+def bench_async(rounds: int = 20, latency: float = 0.0, rtf: float = 0.0, duration: float = 10.0,
+                task: str = 'Transcribe', timeout: float = 600.0, **kwargs: Any) -> List[Dict[str, Any]]:
+    """Benchmark the async queue `run_scraibe_async` with the stub backend and a local SMTP sink.
+
+    All jobs are submitted at once. The submission latency is the time until the upload mail is
+    sent and the UI is updated; the job latency is the time until the transcript mail arrives.
+
+    Args:
+        rounds (int, optional): Number of submitted jobs. Defaults to 20.
+        latency (float, optional): Seconds per stub model call. Defaults to 0.0.
+        rtf (float, optional): Stub seconds per second of audio. Defaults to 0.0.
+        duration (float, optional): Duration of the benchmark clips in seconds. Defaults to 10.0.
+        task (str, optional): The task of the jobs. Defaults to 'Transcribe'.
+        timeout (float, optional): Seconds to wait for all jobs to finish. Defaults to 600.0.
+
+    Returns:
+        List[Dict[str, Any]]: The benchmark results.
+    """
+    from .wrapper import ScraibeWrapper
+    from .interactions import run_scraibe_async
+
+    previous_class = use_stub_backend(latency=latency, rtf=rtf)
+    workdir = tempfile.mkdtemp(prefix="scraibe_bench_")
+    clip = create_warmup_clip(os.path.join(workdir, "clip.wav"), duration=duration)
+    params = {"task": task, "latency": latency, "rtf": rtf, "duration": duration, "jobs": rounds}
+
+    try:
+        with SMTPSink() as sink:
+            mail_config = sink.mail_config()
+            submitted, submit_timings = {}, []
+            start = perf_counter()
+            for i in range(rounds):
+                # one clip per job since the results are written next to the media
+                job_clip = shutil.copy(clip, os.path.join(workdir, f"job_{i}.wav"))
+                receiver = f"user{i}@localhost"
+                submitted[receiver] = time()
+                t0 = perf_counter()
+                next(run_scraibe_async(task, 0, False, "Unspecified", job_clip, None, None,
+                                       receiver, mail_config, {}, None))
+                submit_timings.append(perf_counter() - t0)
+
+            # every job sends an upload mail and a result mail
+            deadline = time() + timeout
+            while len(sink.messages) < 2 * rounds and time() < deadline:
+                sleep(0.01)
+            wall = perf_counter() - start
+
+            finished, errors = {}, 0
+            for message in sink.messages:
+                if b"Upload Successful" in message["data"]:
+                    continue
+                if b"An error occurred" in message["data"]:
+                    errors += 1
+                finished[message["to"][0]] = message["received_at"]
+    finally:
+        ScraibeWrapper.model_class = previous_class
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    job_timings = [finished[r] - t for r, t in submitted.items() if r in finished]
+    job_stats = _stats(job_timings) if job_timings else {}
+    job_stats.update({"completed": len(job_timings), "errors": errors, "throughput": len(job_timings) / wall})
+
+    return [{"name": "async_submit", "group": "async", "params": params, "stats": _stats(submit_timings)},
+            {"name": "async_job", "group": "async", "params": params, "stats": job_stats}]
+
+
+_BENCHMARKS = {"config": bench_config_load, "mail": bench_mail, "sync": bench_sync, "async": bench_async}
+
+
+def run_benchmarks(suites: Iterable[str] = SUITES, rounds: int = 20, latency: float = 0.0,
+                   rtf: float = 0.0, duration: float = 10.0) -> Dict[str, Any]:
+    """Run the selected benchmarks and collect the results.
+
+    Args:
+        suites (Iterable[str], optional): Any of 'config', 'mail', 'sync' and 'async'. Defaults to all.
+        rounds (int, optional): Number of measured calls or jobs per benchmark. Defaults to 20.
+        latency (float, optional): Seconds per stub model call. Defaults to 0.0.
+        rtf (float, optional): Stub seconds per second of audio. Defaults to 0.0.
+        duration (float, optional): Duration of the benchmark clips in seconds. Defaults to 10.0.
+
+    Returns:
+        Dict[str, Any]: The machine information, the stub settings and the benchmark results.
+    """
+    benchmarks = []
+    for suite in suites:
+        if suite not in _BENCHMARKS:
+            raise ValueError(f"Invalid benchmark suite: {suite}. Must be one of {SUITES}.")
+        benchmarks.extend(_BENCHMARKS[suite](rounds=rounds, latency=latency, rtf=rtf, duration=duration))
+
+    return {"version": __version__,
+            "datetime": datetime.now(timezone.utc).isoformat(),
+            "machine_info": {"python": sys.version.split()[0],
+                             "platform": platform.platform(),
+                             "processor": platform.processor(),
+                             "cpu_count": os.cpu_count()},
+            "stub": {"latency": latency, "rtf": rtf, "duration": duration},
+            "benchmarks": benchmarks}
+
+
+def compare_results(old: Dict[str, Any], new: Dict[str, Any],
+                    metric: str = "mean") -> List[Dict[str, Any]]:
+    """Compare the results of two runs.
+
+    Args:
+        old (Dict[str, Any]): The results of the baseline run.
+        new (Dict[str, Any]): The results of the current run.
+        metric (str, optional): The statistic to compare. Defaults to "mean".
+
+    Returns:
+        List[Dict[str, Any]]: Per benchmark present in both runs the old and new value and their ratio.
+    """
+    baseline = {b["name"]: b["stats"] for b in old.get("benchmarks", [])}
+    comparison = []
+    for bench in new.get("benchmarks", []):
+        before = baseline.get(bench["name"], {}).get(metric)
+        after = bench["stats"].get(metric)
+        if before is None or after is None:
+            continue
+        comparison.append({"name": bench["name"], "old": before, "new": after,
+                           "ratio": after / before if before else None})
+    return comparison
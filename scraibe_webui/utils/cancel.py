@@ -0,0 +1,226 @@
+"""
+cancel.py
+
+This module provides the cancellation of running jobs.
+
+Python threads cannot be stopped from the outside. A job therefore runs with a `CancelToken`
+bound to its thread and checks it at checkpoints: before each stage of a file, between the
+files of a job, between the speaker segments of Auto Transcribe and between the windows of a
+windowed diarisation. Once the token is cancelled, or its deadline has passed, the next
+checkpoint raises `JobCancelled` and the job stops without sending its result. A stage which
+hangs never reaches a checkpoint; jobs which must be stopped at once are run in a child
+process which is killed instead, see `isolation.py`.
+
+Users cancel their jobs with the link in the upload notification. Mail scanners open the links
+in mails, so the link only shows a confirmation page and the job is cancelled by its form.
+Administrators can cancel any job with a bearer token.
+
+Classes:
+    JobCancelled: Raised at a checkpoint of a cancelled job.
+    CancelToken: Cancellation state and deadline of a job.
+
+Functions:
+    bind: Context manager binding a token to the current thread.
+    checkpoint: Raise `JobCancelled` if the job of the current thread is cancelled.
+    configure: Configure the cancel links from the `advanced.cancellation` configuration.
+    cancel_link: Get the cancel link of a job for the upload notification.
+    cancel_routes: Create the starlette routes cancelling jobs.
+"""
+import hmac
+from html import escape
+from time import time
+from threading import Event, local
+from contextlib import contextmanager
+from urllib.parse import urlencode
+from typing import Any, Dict, List, Optional
+
+import scraibe_webui.global_var as gv
+
+_local = local()
+
+_config = {}
+
+
+class JobCancelled(Exception):
+    """
+    Raised at a checkpoint of a cancelled job.
+
+    Attributes:
+        reason (str): Why the job was cancelled, e.g. "cancelled by the user" or "timeout".
+        notify (bool): Whether the reciever is told about the cancellation by mail.
+        requeue (bool): Whether the job is run again later, so its checkpoint is kept.
+    """
+    def __init__(self, reason: str = "cancelled", notify: bool = True, requeue: bool = False) -> None:
+        super().__init__(f"The job was stopped: {reason}.")
+        self.reason = reason
+        self.notify = notify
+        self.requeue = requeue
+
+
+class CancelToken:
+    """
+    Cancellation state and deadline of a job.
+
+    Attributes:
+        deadline (float): UNIX time after which the job is cancelled, None for no deadline.
+        reason (str): Why the job was cancelled, None while it is not cancelled.
+        notify (bool): Whether the reciever is told about the cancellation by mail.
+        requeue (bool): Whether the job is run again later, so its checkpoint is kept.
+    """
+    def __init__(self, deadline: Optional[float] = None) -> None:
+        """
+        Initializes the CancelToken.
+
+        Args:
+            deadline (float, optional): UNIX time after which the job is cancelled. Defaults to None.
+        """
+        self.deadline = deadline
+        self.reason = None
+        self.notify = True
+        self.requeue = False
+        self._event = Event()
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether the job is cancelled or its deadline has passed."""
+        if not self._event.is_set() and self.deadline is not None and time() > self.deadline:
+            self.cancel("the time limit was exceeded")
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled", notify: bool = True, requeue: bool = False) -> None:
+        """Cancel the job. Only the first reason is kept.
+
+        Args:
+            reason (str, optional): Why the job is cancelled. Defaults to "cancelled".
+            notify (bool, optional): Whether the reciever is told by mail. Defaults to True.
+            requeue (bool, optional): Whether the job is run again later. Defaults to False.
+        """
+        if not self._event.is_set():
+            self.reason, self.notify, self.requeue = reason, notify, requeue
+            self._event.set()
+
+    def check(self) -> None:
+        """Raise `JobCancelled` if the job is cancelled.
+
+        Raises:
+            JobCancelled: If the job is cancelled or its deadline has passed.
+        """
+        if self.cancelled:
+            raise JobCancelled(self.reason, self.notify, self.requeue)
+
+    def __repr__(self) -> str:
+        return f"CancelToken(cancelled={self._event.is_set()}, reason={self.reason}, deadline={self.deadline})"
+
+
+@contextmanager
+def bind(token: Optional[CancelToken]):
+    """Bind a token to the current thread, so `checkpoint` checks it.
+
+    Args:
+        token (Optional[CancelToken]): The token of the job run by the thread.
+    """
+    previous = getattr(_local, "token", None)
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+
+def checkpoint() -> None:
+    """Raise `JobCancelled` if the job of the current thread is cancelled. No-op without a bound token.
+
+    Raises:
+        JobCancelled: If the job is cancelled or its deadline has passed.
+    """
+    token = getattr(_local, "token", None)
+    if token is not None:
+        token.check()
+
+
+def configure(config: Optional[Dict[str, Any]]) -> None:
+    """Configure the cancel links from the `advanced.cancellation` configuration.
+
+    Args:
+        config (Optional[Dict[str, Any]]): The `advanced.cancellation` configuration section.
+    """
+    global _config
+    _config = dict(config or {}) if (config or {}).get("enabled") else {}
+
+
+def cancel_link(job: Dict[str, Any]) -> Optional[str]:
+    """Get the cancel link of a job for the upload notification.
+
+    Args:
+        job (Dict[str, Any]): The job queued by the `JobScheduler`.
+
+    Returns:
+        Optional[str]: The link, None if cancellation is disabled or no `base_url` is set.
+    """
+    if not _config.get("base_url"):
+        return None
+    query = urlencode({"job": job["job_id"], "key": job["cancel_secret"]})
+    return f"{_config['base_url'].rstrip('/')}{_config.get('path') or '/cancel'}?{query}"
+
+
+_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Cancel job</title></head>
+<body><p>{message}</p>{form}</body></html>"""
+
+_FORM = """<form method="post">
+<input type="hidden" name="job" value="{job}"><input type="hidden" name="key" value="{key}">
+<button type="submit">Cancel the job</button></form>"""
+
+
+def _authorized(job_id: str, key: str) -> bool:
+    job = gv.SCHEDULER.find(job_id) if gv.SCHEDULER is not None and job_id else None
+    return job is not None and hmac.compare_digest(job["cancel_secret"], key or "")
+
+
+def cancel_routes(path: str = "/cancel", admin_token: Optional[str] = None) -> List[Any]:
+    """Create the starlette routes cancelling jobs.
+
+    `GET <path>?job=<id>&key=<secret>` shows a confirmation page and its form posts to
+    `POST <path>`, which cancels the job. If `admin_token` is set, `POST <path>/admin` with a
+    JSON body `{"job_id": ..., "reason": ..., "notify": ...}` and the header
+    `Authorization: Bearer <admin_token>` cancels any job.
+
+    Args:
+        path (str, optional): The path of the endpoint. Defaults to "/cancel".
+        admin_token (str, optional): The token of the administrators. Defaults to None.
+
+    Returns:
+        List[Route]: The routes which can be added to the Gradio app.
+    """
+    from starlette.routing import Route
+    from starlette.responses import HTMLResponse, JSONResponse
+
+    async def _confirm(request):
+        job_id, key = request.query_params.get("job", ""), request.query_params.get("key", "")
+        if not _authorized(job_id, key):
+            return HTMLResponse(_PAGE.format(message="The job is already done or the link is invalid.", form=""),
+                                status_code=404)
+        return HTMLResponse(_PAGE.format(message="Do you want to cancel your job?",
+                                         form=_FORM.format(job=escape(job_id), key=escape(key))))
+
+    async def _cancel(request):
+        form = await request.form()
+        job_id, key = form.get("job", ""), form.get("key", "")
+        if not _authorized(job_id, key) or not gv.SCHEDULER.cancel(job_id, "cancelled by the user", notify=False):
+            return HTMLResponse(_PAGE.format(message="The job is already done or the link is invalid.", form=""),
+                                status_code=404)
+        return HTMLResponse(_PAGE.format(message="Your job was cancelled.", form=""))
+
+    async def _admin(request):
+        if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {admin_token}"):
+            return JSONResponse({"error": "unauthorized"}, status_code=401)
+        body = await request.json()
+        cancelled = gv.SCHEDULER is not None and gv.SCHEDULER.cancel(
+            str(body.get("job_id")), body.get("reason") or "cancelled by an administrator", bool(body.get("notify", True)))
+        return JSONResponse({"job_id": body.get("job_id"), "cancelled": cancelled},
+                            status_code=200 if cancelled else 404)
+
+    routes = [Route(path, _confirm, methods=["GET"]), Route(path, _cancel, methods=["POST"])]
+    if admin_token:
+        routes.append(Route(f"{path.rstrip('/')}/admin", _admin, methods=["POST"]))
+    return routes
@@ -0,0 +1,225 @@
+"""
+eta.py
+
+This module estimates how long async jobs take from the real-time factors of finished jobs.
+
+The real-time factor (RTF) of a job is its processing time divided by the duration of its media.
+It depends mostly on the model, the task and the hardware, so the RTFs of the recently finished
+jobs are kept in a rolling window per model, task and hardware. A queued job is estimated with
+the mean RTF of its key. If no job with the same key finished yet, the mean of the same model on
+this hardware, then of all jobs on this hardware, and finally `DEFAULT_RTF` is used.
+
+The store can be persisted to a JSON file, so the estimates survive restarts. Hardware is part
+of the key, so hosts of different kinds can share the file. Every process only adds its new
+real-time factors to the file, under a lock of the file, and reads the ones of the others, so
+several worker processes or hosts do not overwrite each other. The lock needs `fcntl`, without
+it (on Windows) only one process should write the file.
+
+Classes:
+    RTFStore: Keeps the recent real-time factors per model, task and hardware.
+
+Functions:
+    hardware_id: Get an identifier of the hardware of this host.
+    configure: Configure the store from the `advanced.eta` configuration.
+    get_rtf_store: Get the active store.
+"""
+import os
+import json
+import warnings
+from uuid import uuid4
+from threading import Lock
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+
+DEFAULT_RTF = 1.0 # real-time factor assumed until the first jobs finished
+
+_store = None
+
+
+@lru_cache(maxsize=1)
+def hardware_id() -> str:
+    """Get an identifier of the hardware of this host, e.g. "cuda:NVIDIA A100" or "cpu:16".
+
+    Returns:
+        str: The identifier.
+    """
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return f"cuda:{torch.cuda.get_device_name(0)}"
+    except ImportError:
+        pass
+    return f"cpu:{os.cpu_count()}"
+
+
+class RTFStore:
+    """
+    Keeps the recent real-time factors per model, task and hardware.
+
+    Attributes:
+        window (int): The number of recent real-time factors kept per key.
+        path (str): The JSON file the store is persisted to, None keeps it in memory.
+        hardware (str): The hardware of this host, see `hardware_id`.
+    """
+    def __init__(self, window: int = 50, path: Optional[str] = None, hardware: Optional[str] = None) -> None:
+        """
+        Initializes the RTFStore and loads the persisted real-time factors.
+
+        Args:
+            window (int, optional): The number of recent real-time factors kept per key. Defaults to 50.
+            path (str, optional): The JSON file the store is persisted to. Defaults to None.
+            hardware (str, optional): The hardware of this host. Defaults to `hardware_id()`.
+        """
+        self.window = max(int(window), 1)
+        self.path = path
+        self.hardware = hardware or hardware_id()
+
+        self._samples = {} # "model|task|hardware" -> recent real-time factors
+        self._pending = {} # real-time factors recorded since the last save, by key
+        self._lock = Lock()
+        self.load()
+
+    @staticmethod
+    def _key(model: Optional[str], task: Optional[str], hardware: str) -> str:
+        return f"{model}|{task}|{hardware}"
+
+    def record(self, model: Optional[str], task: Optional[str], rtf: float) -> None:
+        """Record the real-time factor of a finished job on this host.
+
+        Args:
+            model (str): The Whisper model of the job.
+            task (str): The task of the job.
+            rtf (float): The processing time divided by the duration of the media.
+        """
+        with self._lock:
+            key = self._key(model, task, self.hardware)
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(float(rtf))
+            if self.path is not None:
+                self._pending.setdefault(key, []).append(float(rtf))
+        self.save()
+
+    def estimate(self, model: Optional[str] = None, task: Optional[str] = None) -> float:
+        """Estimate the real-time factor of a job on this host.
+
+        Args:
+            model (str, optional): The Whisper model of the job. Defaults to None.
+            task (str, optional): The task of the job. Defaults to None.
+
+        Returns:
+            float: The mean real-time factor of the most specific key with samples, or `DEFAULT_RTF`.
+        """
+        with self._lock:
+            samples = self._samples.get(self._key(model, task, self.hardware))
+            if not samples:
+                samples = [rtf for key, values in self._samples.items()
+                           if key.startswith(f"{model}|") and key.endswith(f"|{self.hardware}") for rtf in values]
+            if not samples:
+                samples = [rtf for key, values in self._samples.items()
+                           if key.endswith(f"|{self.hardware}") for rtf in values]
+            return sum(samples) / len(samples) if samples else DEFAULT_RTF
+
+    def _read(self) -> Optional[Dict[str, List[float]]]:
+        """Read the persisted real-time factors, None if the file does not exist or is unreadable."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            warnings.warn(f"Could not load the real-time factors from {self.path}: {e}")
+            return None
+
+    @contextmanager
+    def _file_lock(self):
+        """Lock the file against the other processes sharing it."""
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def load(self) -> None:
+        """Load the persisted real-time factors, if the file exists."""
+        if self.path is None:
+            return
+        data = self._read()
+        if data is None:
+            return
+        with self._lock:
+            self._samples = {key: deque(values, maxlen=self.window) for key, values in data.items()}
+
+    def save(self) -> None:
+        """Add the real-time factors recorded since the last save to the file, if a path is set.
+
+        The file is read again under its lock, so the real-time factors other processes saved
+        meanwhile are kept and loaded into this store.
+        """
+        if self.path is None:
+            return
+        try:
+            with self._file_lock():
+                data = self._read() or {}
+                with self._lock:
+                    pending, self._pending = self._pending, {}
+                    for key, values in pending.items():
+                        data[key] = list(deque([*data.get(key, []), *values], maxlen=self.window))
+                    self._samples = {key: deque(values, maxlen=self.window) for key, values in data.items()}
+
+                tmp = f"{self.path}.{uuid4().hex}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+        except OSError as e:
+            warnings.warn(f"Could not save the real-time factors to {self.path}: {e}")
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'RTFStore':
+        """Initialize the RTFStore from a configuration dictionary.
+
+        Args:
+            config (dict): The `advanced.eta` configuration section.
+
+        Returns:
+            RTFStore: An instance of RTFStore.
+        """
+        return cls(window=config.get("window") or 50, path=config.get("path"))
+
+    def __repr__(self) -> str:
+        return f"RTFStore(window={self.window}, path={self.path}, hardware={self.hardware}, keys={len(self._samples)})"
+
+
+def configure(config: Optional[Dict[str, Any]]) -> RTFStore:
+    """Configure the store from the `advanced.eta` configuration.
+
+    Args:
+        config (Optional[Dict[str, Any]]): The `advanced.eta` configuration section.
+
+    Returns:
+        RTFStore: The active store.
+    """
+    global _store
+    _store = RTFStore.from_config(config or {})
+    return _store
+
+
+def get_rtf_store() -> RTFStore:
+    """Get the active store. An in-memory store is created on first use if none is configured.
+
+    Returns:
+        RTFStore: The active store.
+    """
+    global _store
+    if _store is None:
+        _store = RTFStore()
+    return _store
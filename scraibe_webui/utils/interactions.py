@@ -2,6 +2,7 @@
 These functions will be used by all interfaces that use the web app.
 """
 from time import sleep
+from datetime import datetime
 from typing import Union
 from pandas import DataFrame
 from gradio import Progress, update, Info, Warning, Error
@@ -9,6 +10,12 @@ from scraibe import Transcript
 from .wrapper import ScraibeWrapper
 from .mail import MailService
 from .background import BackgroundThread
+from .scheduler import QueueFullError
+from .cancel import cancel_link as get_cancel_link
+from .janitor import register_files, release_files
+from .status import track_job
+from .metrics import time_stage, CACHE_HITS_TOTAL, CACHE_MISSES_TOTAL
+from .singleflight import run_once
 import scraibe_webui.global_var as gv
 
 
@@ -68,7 +75,8 @@ def annotate_output(annoation : DataFrame, out_json : dict):
     return update(value = str(trans)),update(value = trans.get_json())
 
 
-def get_pipe(keep_model_alive : bool, scraibe_params : dict) -> ScraibeWrapper:
+def get_pipe(keep_model_alive : bool, scraibe_params : dict,
+             source : Union[str, list] = None, language : str = None, model : str = None) -> ScraibeWrapper:
     """
     This function loads the model into memory only when it's needed, which is beneficial for occasional use. 
     By doing so, it efficiently manages resource usage by ensuring that the resources required by the model 
@@ -78,26 +86,53 @@ def get_pipe(keep_model_alive : bool, scraibe_params : dict) -> ScraibeWrapper:
     Args:
         keep_model_alive (bool): A boolean value that determines whether the model should be kept alive.
         scraibe_params (dict): A dictionary containing the parameters required to load the model.
+        source (Union[str, list], optional): The media of the job, used for model routing.
+        language (str, optional): The requested language, used for model routing.
+        model (str, optional): The model already routed by the pool, see `get_model_name`.
 
     Returns:
         model (Scraibe): The loaded Scraibe model.
     """
-    _loader =  ScraibeWrapper.load_from_dict(scraibe_params)
+    if gv.MODEL_POOL is not None:
+        # routed models are kept in the pool regardless of keep_model_alive
+        return gv.MODEL_POOL.get(model or get_model_name(scraibe_params, source, language))
     
     if not keep_model_alive:
         
-        pipe = _loader
+        with time_stage("model_load"):
+            pipe = ScraibeWrapper.load_from_dict(scraibe_params)
     else:
         pipe = gv.PIPE
 
         if pipe is None:
             Warning("Loading the model for the first time. This may take a few seconds.")
-            pipe = _loader
+            CACHE_MISSES_TOTAL.inc(cache="model")
+            with time_stage("model_load"):
+                pipe = ScraibeWrapper.load_from_dict(scraibe_params)
             gv.PIPE = pipe
+        else:
+            CACHE_HITS_TOTAL.inc(cache="model")
 
     return pipe
 
 
+def get_model_name(scraibe_params : dict, source : Union[str, list] = None, language : str = None) -> str:
+    """
+    Gets the name of the model which runs a job, routed by the pool if model routing is enabled.
+    
+    Args:
+        scraibe_params (dict): A dictionary containing the parameters required to load the model.
+        source (Union[str, list], optional): The media of the job, used for model routing.
+        language (str, optional): The requested language, used for model routing.
+    
+    Returns:
+        str: The name of the model.
+    """
+    if gv.MODEL_POOL is not None:
+        return gv.MODEL_POOL.route(source, language, scraibe_params.get("whisper_model"))
+    return scraibe_params.get("whisper_model")
+
+
 def run_scraibe(task : str,
                num_speakers : int,
                translate : bool,
@@ -115,15 +150,10 @@ def run_scraibe(task : str,
                     " in their tqdm progress bar, which Gradio.Progress does not support." 
                     " As a result, progress will not be tracked.")
             
-        # load model or use the existing one
-
-        _pipe = get_pipe(keep_model_alive, scraibe_params)
-    
-        # get *args which are not None
-        
+        if gv.DRAINING:
+            raise Error("The server is restarting. Please try again in a few minutes.")
         
-        if progress.track_tqdm: # TODO [FixProgressBarIssue]
-            progress(0, desc='Starting task...')
+        # get *args which are not None
         
         source = audio or video or file_in
         
@@ -132,48 +162,80 @@ def run_scraibe(task : str,
             if len(source) == 1:
                 source = source[0]
  
-        if task == 'Auto Transcribe':
+        register_files(source) # protect the uploaded media from the janitor while running
+
+        try:
+            with track_job(source, task=task) as job_info:
+                
+                # routed before the flight, so identical requests are keyed by the model which runs them
+                model = get_model_name(scraibe_params, source, language)
+                
+                def compute():
+                    # load model or use the existing one
+                    
+                    _pipe = get_pipe(keep_model_alive, scraibe_params, model = model)
+                    job_info["model"] = _pipe.model_name
+                    
+                    if progress.track_tqdm: # TODO [FixProgressBarIssue]
+                        progress(0, desc='Starting task...')
+                    
+                    if task == 'Auto Transcribe':
+                        return _pipe.autotranscribe(source = source,
+                                                    num_speakers = num_speakers,
+                                                    translate = translate,
+                                                    language = language)
+                    elif task == 'Transcribe':
+                        return _pipe.transcribe(source = source,
+                                                translate = translate,
+                                                language = language)
+                    elif task == 'Diarisation':
+                        return _pipe.diarisation(source = source,
+                                                 num_speakers = num_speakers)
+                
+                # identical requests in flight, e.g. of a whole class uploading the same lecture, share one run
+                result, leader = run_once(source, compute, task = task, model = model,
+                                          translate = translate, language = language,
+                                          num_speakers = num_speakers if task != 'Transcribe' else None)
+                job_info["coalesced"] = not leader
+                
+                if task == 'Auto Transcribe':
     
-            res, out_str , out_json = _pipe.autotranscribe(source = source,
-                                num_speakers = num_speakers,
-                                translate = translate,
-                                language = language)
+                    res, out_str , out_json = result
             
-            _df = DataFrame(columns= res.speakers)
+                    _df = DataFrame(columns= res.speakers)
             
-            _df.loc[0] = res.speakers
+                    _df.loc[0] = res.speakers
             
-            return (update(value = out_str, visible = True), # out_txt
-                    update(value = out_json, visible = True), # out_json
-                    update(visible = True), # accordion for json
-                    update(value = _df,
-                           row_count = (1, "fixed"),
-                           col_count = (len(res.speakers), "fixed"),
-                           visible = True), # annotation
-                    update(visible = True)) # annotate button     
+                    return (update(value = out_str, visible = True), # out_txt
+                            update(value = out_json, visible = True), # out_json
+                            update(visible = True), # accordion for json
+                            update(value = _df,
+                                   row_count = (1, "fixed"),
+                                   col_count = (len(res.speakers), "fixed"),
+                                   visible = True), # annotation
+                            update(visible = True)) # annotate button     
             
-        elif task == 'Transcribe':
+                elif task == 'Transcribe':
             
-            out = _pipe.transcribe(source = source,
-                                translate = translate,
-                                language = language)
+                    out = result
             
-            return (update(value = out, visible = True), # out_txt
-                    update(value = None, visible = False), # out_json
-                    update(visible = False), # accordion for json
-                    update(visible = False), # annotation
-                    update(visible = False)) # annotate button 
+                    return (update(value = out, visible = True), # out_txt
+                            update(value = None, visible = False), # out_json
+                            update(visible = False), # accordion for json
+                            update(visible = False), # annotation
+                            update(visible = False)) # annotate button 
             
-        elif task == 'Diarisation':
+                elif task == 'Diarisation':
             
-            out = _pipe.diarisation(source = source,
-                                num_speakers = num_speakers)
+                    out = result
             
-            return (update(value = None, visible = False), # out_txt
-                    update(value = out, visible = True), # out_json
-                    update(visible = True, open = True), # accordion for json
-                    update(visible = False), # annotation
-                    update(visible = False)) # annotate button
+                    return (update(value = None, visible = False), # out_txt
+                            update(value = out, visible = True), # out_json
+                            update(visible = True, open = True), # accordion for json
+                            update(visible = False), # annotation
+                            update(visible = False)) # annotate button
+        finally:
+            release_files(source)
 
 
 def show_notification(mail : str) -> str:
@@ -203,25 +265,72 @@ def run_scraibe_async(task : str,
     
     source = audio or video or file_in
     
+    if gv.DRAINING:
+        raise Error("The server is restarting. Please try again in a few minutes.")
     if not mail:
         raise Error("Please provide an email address.")
     if not source:
         raise Error("Please provide a valid source file.")
     
-    job = BackgroundThread(mail_service_params, scraibe_kwargs, threads_per_model)
+    if isinstance(source, list):
+        source = [s if isinstance(s, str) else s.name for s in source]
     
-    job.run(audio = source,
-            reciever = mail,
-            task = task,
-            num_speakers = num_speakers,
-            translate = translate,
-            language = language,
-            error_format_options = error_format_options,
-            transcript_format_options = transcript_format_options)
+    estimated_completion = None
+    cancel_link = None
     
-    if "queue_position" in upload_format_options.keys():
+    if gv.SPOOL is not None:
+        # the job is run by a `scraibe-webui worker` claiming it from the spool
+        record = gv.SPOOL.enqueue(source,
+                                  reciever = mail,
+                                  task = task,
+                                  num_speakers = num_speakers,
+                                  translate = translate,
+                                  language = language,
+                                  error_format_options = error_format_options,
+                                  transcript_format_options = transcript_format_options)
+        queue_position = gv.SPOOL.position(record["job_id"])
+    elif gv.SCHEDULER is not None:
+        try:
+            job = gv.SCHEDULER.submit(BackgroundThread(mail_service_params, scraibe_kwargs, threads_per_model),
+                                      audio = source,
+                                      reciever = mail,
+                                      task = task,
+                                      num_speakers = num_speakers,
+                                      translate = translate,
+                                      language = language,
+                                      error_format_options = error_format_options,
+                                      transcript_format_options = transcript_format_options)
+        except QueueFullError as e:
+            # refused before anything is queued, so no upload notification is sent
+            raise Error(str(e))
+        
         gv.NUMBER_OF_QUEUE += 1
-        upload_format_options["queue_position"] = gv.NUMBER_OF_QUEUE
+        queue_position = gv.SCHEDULER.position(job["job_id"]) or 1
+        estimated_completion = gv.SCHEDULER.estimated_completion(job["job_id"])
+        cancel_link = get_cancel_link(job)
+    else:
+        job = BackgroundThread(mail_service_params, scraibe_kwargs, threads_per_model)
+        
+        gv.NUMBER_OF_QUEUE += 1
+        
+        job.run(audio = source,
+                reciever = mail,
+                task = task,
+                num_speakers = num_speakers,
+                translate = translate,
+                language = language,
+                error_format_options = error_format_options,
+                transcript_format_options = transcript_format_options)
+        queue_position = gv.NUMBER_OF_QUEUE
+    
+    if "queue_position" in upload_format_options.keys():
+        upload_format_options["queue_position"] = queue_position
+    if "estimated_completion" in upload_format_options.keys():
+        upload_format_options["estimated_completion"] = (
+            datetime.fromtimestamp(estimated_completion).strftime("%Y-%m-%d %H:%M")
+            if estimated_completion is not None else "unknown")
+    if "cancel_link" in upload_format_options.keys():
+        upload_format_options["cancel_link"] = cancel_link or ""
     
     MailService.from_config(mail_service_params).send_upload_notification(mail, **upload_format_options)
 
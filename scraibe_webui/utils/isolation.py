@@ -0,0 +1,166 @@
+"""
+isolation.py
+
+This module runs async jobs in child processes, so a cancelled or timed out job can be killed.
+
+A `CancelToken` only stops a job at its next checkpoint. A stage which hangs, e.g. a model or
+ffmpeg call on a corrupt file, is never interrupted, and its worker thread stays busy until the
+call returns. With `advanced.scheduling.isolation` set to "process" every job is run in a new
+process while its worker thread waits for it. Once the token of the job is cancelled, or its
+deadline has passed, the process is killed and the worker takes the next job.
+
+The child process loads the model of the job and configures language detection, VAD, windowed
+diarisation, model routing and checkpoints like the app, then runs the job and mails its result.
+The worker thread counts the job in the status endpoint and the ETA estimates. Metrics and
+traces recorded within the child are not reported by the app.
+
+Functions:
+    run_isolated: Run a job in a child process which is killed once the job is cancelled.
+"""
+import warnings
+import multiprocessing
+from typing import Any, Dict, List, Optional, Tuple
+
+import scraibe_webui.global_var as gv
+from .cancel import JobCancelled
+from .janitor import release_files
+from .mail import MailService
+from .resume import get_checkpoint_store
+
+POLL_INTERVAL = 0.2 # seconds between the checks of the token of a running job
+
+FOLLOWER_FIELDS = ("job_id", "audio", "reciever", "error_format_options", "transcript_format_options")
+
+
+def _configure(setup: Dict[str, Any]) -> None:
+    """Configure a child process like the app."""
+    from .pool import ModelPool
+    from .langdetect import configure as configure_language_detection
+    from .vad import configure as configure_vad
+    from .windowed import configure as configure_windowed_diarisation
+    from .resume import configure as configure_checkpoints
+
+    advanced = setup.get("advanced") or {}
+    configure_language_detection(advanced.get("language_detection"))
+    configure_vad(advanced.get("vad"))
+    configure_windowed_diarisation(advanced.get("windowed_diarisation"))
+    configure_checkpoints(advanced.get("checkpoints"))
+
+    routing_config = advanced.get("model_routing") or {}
+    if routing_config.get("enabled"):
+        gv.MODEL_POOL = ModelPool.from_config(routing_config, setup.get("scraibe_params") or {})
+
+
+def _main(setup: Dict[str, Any], runner: Dict[str, Any], job: Dict[str, Any],
+          followers: List[Dict[str, Any]], conn: Any) -> None:
+    """Entry point of a child process. Sends the error of the job, None if it succeeded."""
+    from .background import BackgroundThread
+
+    _configure(setup)
+    error = BackgroundThread(**runner).parrallel_task(job["audio"],
+                                                      job["reciever"],
+                                                      job["task"],
+                                                      job["num_speakers"],
+                                                      job["translate"],
+                                                      job["language"],
+                                                      job["error_format_options"],
+                                                      job["transcript_format_options"],
+                                                      submitted_at=job["submitted_at"],
+                                                      job_id=job["job_id"],
+                                                      followers=lambda: followers)
+    # custom exceptions cannot always be rebuilt from their pickle
+    conn.send(None if error is None else repr(error))
+    conn.close()
+
+
+def _outcome(job: Dict[str, Any], process: Any, receiver: Any) -> Tuple[Optional[Exception], bool]:
+    """Get the error of a finished child process and whether it mailed the recievers."""
+    try:
+        message = receiver.recv() if receiver.poll() else False
+    except EOFError:
+        message = False # died before it sent its result
+
+    if message is None:
+        return None, True
+    if message is not False:
+        return RuntimeError(message), True
+
+    token = job["token"]
+    if token.cancelled:
+        return JobCancelled(token.reason, token.notify, token.requeue), False
+    warnings.warn(f"The process of job {job['job_id']} exited with code {process.exitcode}.")
+    return RuntimeError(f"The job stopped unexpectedly (exit code {process.exitcode})."), False
+
+
+def run_isolated(job: Dict[str, Any], setup: Optional[Dict[str, Any]] = None) -> Optional[Exception]:
+    """Run a job in a child process which is killed once the token of the job is cancelled.
+
+    The followers of the job are taken when it starts, identical jobs submitted later are
+    queued on their own.
+
+    Args:
+        job (Dict[str, Any]): A running job of the `JobScheduler`.
+        setup (Dict[str, Any], optional): The `advanced` configuration as `advanced` and the
+                                          parameters of the models as `scraibe_params`. Defaults to None.
+
+    Returns:
+        Optional[Exception]: The exception if the job failed or was cancelled.
+    """
+    from .status import track_job
+
+    runner, token = job["runner"], job["token"]
+    followers = job["seal"]() if job.get("seal") is not None else []
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_main,
+                              args=(setup or {},
+                                    {"mail_service_params": runner.mail_service_params,
+                                     "scraibe_kwargs": runner.scraibe_kwargs,
+                                     "threads_per_model": runner.threads_per_model},
+                                    {key: job[key] for key in ("job_id", "audio", "reciever", "task", "num_speakers",
+                                                               "translate", "language", "error_format_options",
+                                                               "transcript_format_options", "submitted_at")},
+                                    [{key: follower.get(key) for key in FOLLOWER_FIELDS} for follower in followers],
+                                    sender),
+                              name=f"scraibe-job-{job['job_id']}",
+                              daemon=True)
+
+    error, mailed = None, False
+    try:
+        with track_job(job["audio"], interface="async", job_id=job["job_id"], task=job["task"],
+                       isolated=True) as job_info:
+            job_info["model"] = job.get("model")
+            process.start()
+            sender.close()
+            while process.is_alive() and not token.cancelled:
+                process.join(POLL_INTERVAL)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+            error, mailed = _outcome(job, process, receiver)
+            if error is not None:
+                raise error # only successful jobs count for the real-time factors
+    except Exception as e:
+        error = e
+    finally:
+        receiver.close()
+
+    if not mailed:
+        # the child was killed or died before it could tell the recievers
+        if getattr(error, "notify", True):
+            MailService.from_config(runner.mail_service_params).send_error_notification(
+                receiver_email=job["reciever"], exception_message=error, **job["error_format_options"])
+        runner.send_to_followers(followers, {}, error)
+        store = get_checkpoint_store()
+        if store is not None and not getattr(error, "requeue", False):
+            store.clear(job["job_id"])
+    else:
+        # the child mailed the followers, their media is registered in this process
+        for follower in followers:
+            release_files(follower["audio"])
+            gv.NUMBER_OF_QUEUE -= 1
+
+    release_files(job["audio"])
+    gv.NUMBER_OF_QUEUE -= 1
+    return error
@@ -0,0 +1,259 @@
+"""
+janitor.py
+
+This module contains the Janitor class which keeps the disk usage of the WebUI bounded.
+
+Uploaded media is stored by Gradio in its temporary directory and is never removed by the
+application itself. The Janitor periodically scans the watched directories and evicts files
+which are older than a configurable age or which exceed a configurable byte quota. Files that
+are still referenced by a queued or running job are never touched.
+
+Classes:
+    Janitor: Background thread that evicts unreferenced uploads and intermediate files.
+
+Functions:
+    register_files: Mark files as referenced by a queued or running job.
+    release_files: Release files previously registered by a job.
+    get_active_files: Get the files referenced by queued or running jobs.
+    get_upload_folder: Get the directory in which Gradio stores uploaded files.
+"""
+import os
+import tempfile
+from time import time
+from threading import Thread, Event, Lock
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import scraibe_webui.global_var as gv
+from .metrics import JANITOR_RECLAIMED_BYTES_TOTAL
+
+_active_files_lock = Lock()
+
+
+def register_files(paths: Union[str, Iterable[str], None]) -> None:
+    """Mark files as referenced by a queued or running job.
+
+    Registered files are skipped by the Janitor until they are released again.
+
+    Args:
+        paths (Union[str, Iterable[str], None]): A path or a list of paths.
+    """
+    for path in _as_list(paths):
+        with _active_files_lock:
+            gv.ACTIVE_FILES[path] = gv.ACTIVE_FILES.get(path, 0) + 1
+
+
+def release_files(paths: Union[str, Iterable[str], None]) -> None:
+    """Release files previously registered by a job.
+
+    Args:
+        paths (Union[str, Iterable[str], None]): A path or a list of paths.
+    """
+    for path in _as_list(paths):
+        with _active_files_lock:
+            count = gv.ACTIVE_FILES.get(path, 0) - 1
+            if count > 0:
+                gv.ACTIVE_FILES[path] = count
+            else:
+                gv.ACTIVE_FILES.pop(path, None)
+
+
+def get_active_files() -> List[str]:
+    """Get the files referenced by queued or running jobs.
+
+    Returns:
+        List[str]: The resolved paths of all referenced files.
+    """
+    with _active_files_lock:
+        return [os.path.realpath(p) for p in gv.ACTIVE_FILES]
+
+
+def get_upload_folder() -> str:
+    """Get the directory in which Gradio stores uploaded files.
+
+    Returns:
+        str: The Gradio upload folder.
+    """
+    return os.environ.get("GRADIO_TEMP_DIR") or os.path.realpath(
+        os.path.join(tempfile.gettempdir(), "gradio"))
+
+
+def _as_list(paths: Union[str, Iterable[str], None]) -> List[str]:
+    if paths is None:
+        return []
+    if isinstance(paths, str):
+        return [paths]
+    return [getattr(p, 'name', p) for p in paths]
+
+
+class Janitor:
+    """
+    Evicts unreferenced uploads and intermediate files to keep disk usage bounded.
+
+    Attributes:
+        paths (List[str]): Directories watched by the Janitor.
+        max_bytes (int): Byte quota for all watched directories. None disables the quota.
+        max_age (int): Age in seconds after which unreferenced files are evicted. None disables age eviction.
+        interval (int): Seconds between two runs of the Janitor.
+        metrics (Dict[str, Any]): Counters describing the work done by the Janitor.
+    """
+    def __init__(self,
+                 paths: Optional[List[str]] = None,
+                 max_bytes: Optional[int] = None,
+                 max_age: Optional[int] = 86400,
+                 interval: int = 600) -> None:
+        """
+        Initializes the Janitor.
+
+        Args:
+            paths (List[str], optional): Directories to watch. Defaults to the Gradio upload folder.
+            max_bytes (int, optional): Byte quota for all watched directories. Defaults to None.
+            max_age (int, optional): Age in seconds after which unreferenced files are evicted. Defaults to 86400.
+            interval (int, optional): Seconds between two runs of the Janitor. Defaults to 600.
+        """
+        self.paths = paths or [get_upload_folder()]
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+
+        self.metrics = {"runs": 0,
+                        "files_removed": 0,
+                        "bytes_reclaimed": 0,
+                        "last_run": None,
+                        "usage_bytes": 0}
+
+        self._stop_event = Event()
+        self._thread = None
+
+    def scan(self) -> List[Dict[str, Any]]:
+        """Collect all files in the watched directories.
+
+        Returns:
+            List[Dict[str, Any]]: File entries with path, size and modification time.
+        """
+        entries = []
+        for root_path in self.paths:
+            for root, _, files in os.walk(root_path):
+                for name in files:
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append({"path": path,
+                                    "size": stat.st_size,
+                                    "mtime": stat.st_mtime})
+        return entries
+
+    def is_referenced(self, path: str, active_files: List[str]) -> bool:
+        """Check if a file belongs to a queued or running job.
+
+        Gradio stores every upload in its own sub directory and the result files of a job are
+        written next to the uploaded media. Therefore a file is considered referenced if it
+        shares the sub directory or the base name with a referenced file.
+
+        Args:
+            path (str): The path to check.
+            active_files (List[str]): The files referenced by queued or running jobs.
+
+        Returns:
+            bool: True if the path is referenced, False otherwise.
+        """
+        path = os.path.realpath(path)
+        directory = os.path.dirname(path)
+        roots = [os.path.realpath(p) for p in self.paths]
+
+        for active in active_files:
+            if path == active or os.path.splitext(path)[0] == os.path.splitext(active)[0]:
+                return True
+            if directory not in roots and directory == os.path.dirname(active):
+                return True
+        return False
+
+    def run_once(self) -> int:
+        """Evict expired files first and then the oldest files until the quota is met.
+
+        Returns:
+            int: The number of bytes reclaimed by this run.
+        """
+        now = time()
+        entries = sorted(self.scan(), key=lambda e: e["mtime"])
+        active_files = get_active_files()
+        usage = sum(e["size"] for e in entries)
+        reclaimed = 0
+
+        for entry in entries:
+            expired = self.max_age is not None and now - entry["mtime"] > self.max_age
+            over_quota = self.max_bytes is not None and usage > self.max_bytes
+
+            if not (expired or over_quota) or self.is_referenced(entry["path"], active_files):
+                continue
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                continue
+
+            usage -= entry["size"]
+            reclaimed += entry["size"]
+            self.metrics["files_removed"] += 1
+
+        self.remove_empty_dirs()
+
+        self.metrics["runs"] += 1
+        self.metrics["bytes_reclaimed"] += reclaimed
+        JANITOR_RECLAIMED_BYTES_TOTAL.inc(reclaimed)
+        self.metrics["last_run"] = now
+        self.metrics["usage_bytes"] = usage
+
+        return reclaimed
+
+    def remove_empty_dirs(self) -> None:
+        """Remove empty sub directories left behind by evicted uploads."""
+        for root_path in self.paths:
+            for root, dirs, files in os.walk(root_path, topdown=False):
+                if root != root_path and not dirs and not files:
+                    try:
+                        os.rmdir(root)
+                    except OSError:
+                        pass
+
+    def _loop(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Janitor run failed: {e}")
+            self._stop_event.wait(self.interval)
+
+    def start(self) -> 'Janitor':
+        """Start the Janitor in a daemon thread.
+
+        Returns:
+            Janitor: The started Janitor.
+        """
+        self._stop_event.clear()
+        self._thread = Thread(target=self._loop, name="scraibe-janitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the Janitor thread."""
+        self._stop_event.set()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'Janitor':
+        """Initialize the Janitor from a configuration dictionary.
+
+        Args:
+            config (dict): The `advanced.janitor` configuration section.
+
+        Returns:
+            Janitor: An instance of Janitor.
+        """
+        return cls(paths=config.get('paths'),
+                   max_bytes=config.get('max_bytes'),
+                   max_age=config.get('max_age', 86400),
+                   interval=config.get('interval', 600))
+
+    def __repr__(self) -> str:
+        return (f"Janitor(paths={self.paths}, max_bytes={self.max_bytes}, "
+                f"max_age={self.max_age}, interval={self.interval})")
@@ -0,0 +1,189 @@
+"""
+langdetect.py
+
+This module provides the language detection stage which runs before the transcription.
+
+If no language is given, Whisper detects it inside every transcribe call. When a file is
+transcribed in segments (as in Auto Transcribe), the language is detected again for every
+segment, and re-running a file detects it again as well. With detection enabled, the language
+is detected once on a short sample at the start of the decoded audio, cached by the hash of the
+media, and passed explicitly to all following transcribe calls.
+
+Classes:
+    LanguageDetector: Detects the language of audio and caches it by media hash.
+
+Functions:
+    configure: Enable language detection from the `advanced.language_detection` configuration.
+    get_detector: Get the active detector.
+    normalize_language: Convert a language name or code to the lowercase language name.
+"""
+from threading import Lock
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from .metrics import CACHE_HITS_TOTAL, CACHE_MISSES_TOTAL
+
+_detector = None
+
+
+def _language_name(code: str) -> str:
+    """Convert a Whisper language code to the name used in the language dropdown."""
+    try:
+        from whisper.tokenizer import LANGUAGES
+    except ImportError:
+        return code
+    return LANGUAGES.get(code, code).title()
+
+
+def normalize_language(language: str) -> str:
+    """Convert a language name or code to the lowercase language name, e.g. "en" to "english".
+
+    Args:
+        language (str): The name or Whisper code of the language.
+
+    Returns:
+        str: The lowercase name of the language.
+    """
+    language = language.lower()
+    try:
+        from whisper.tokenizer import LANGUAGES
+    except ImportError:
+        return language
+    return LANGUAGES.get(language, language)
+
+
+class LanguageDetector:
+    """
+    Detects the language of audio and caches it by media hash.
+
+    Attributes:
+        sample_seconds (float): Seconds at the start of the audio used for the detection.
+        cache_size (int): Number of cached languages.
+    """
+    def __init__(self, sample_seconds: float = 30.0, cache_size: int = 1024) -> None:
+        """
+        Initializes the LanguageDetector.
+
+        Args:
+            sample_seconds (float, optional): Seconds at the start of the audio used for the
+                                              detection. Whisper looks at 30 seconds at most. Defaults to 30.0.
+            cache_size (int, optional): Number of cached languages. Defaults to 1024.
+        """
+        self.sample_seconds = sample_seconds
+        self.cache_size = cache_size
+
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def cached(self, key: str) -> Optional[str]:
+        """Get the cached language of a media file.
+
+        Args:
+            key (str): The hash of the media.
+
+        Returns:
+            Optional[str]: The language or None if it is not cached.
+        """
+        with self._lock:
+            language = self._cache.get(key)
+            if language is not None:
+                self._cache.move_to_end(key)
+        if language is None:
+            CACHE_MISSES_TOTAL.inc(cache="language")
+        else:
+            CACHE_HITS_TOTAL.inc(cache="language")
+        return language
+
+    def store(self, key: str, language: str) -> None:
+        """Cache the language of a media file.
+
+        Args:
+            key (str): The hash of the media.
+            language (str): The detected language.
+        """
+        with self._lock:
+            self._cache[key] = language
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def detect(self, transcriber: Any, audio: Any) -> str:
+        """Detect the language on a sample at the start of the audio.
+
+        Args:
+            transcriber (Transcriber): The loaded transcriber of a Scraibe model.
+            audio (AudioProcessor): The decoded audio.
+
+        Returns:
+            str: The name of the language, e.g. "English".
+        """
+        sample = audio.waveform[:int(audio.sr * self.sample_seconds)]
+
+        if hasattr(transcriber, "detect_language"):
+            # backends which detect the language themselves, e.g. the stub backend
+            return _language_name(transcriber.detect_language(sample))
+
+        model = transcriber.model
+        if hasattr(model, "dims"):
+            # openai-whisper
+            import whisper
+
+            if not model.is_multilingual:
+                return _language_name("en")
+            dtype = next(model.parameters()).dtype
+            mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(sample.flatten()), n_mels=model.dims.n_mels)
+            _, probs = model.detect_language(mel.to(model.device).to(dtype))
+            return _language_name(max(probs, key=probs.get))
+
+        # faster-whisper detects the language before the lazy segment generator is consumed
+        if hasattr(sample, "cpu"):
+            sample = sample.cpu().numpy()
+        _, info = model.transcribe(sample, beam_size=1)
+        return _language_name(info.language)
+
+    def clear(self) -> None:
+        """Drop all cached languages."""
+        with self._lock:
+            self._cache.clear()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'LanguageDetector':
+        """Initialize the LanguageDetector from a configuration dictionary.
+
+        Args:
+            config (dict): The `advanced.language_detection` configuration section.
+
+        Returns:
+            LanguageDetector: An instance of LanguageDetector.
+        """
+        return cls(sample_seconds=config.get("sample_seconds") or 30.0,
+                   cache_size=config.get("cache_size") or 1024)
+
+    def __repr__(self) -> str:
+        return f"LanguageDetector(sample_seconds={self.sample_seconds}, cached={len(self._cache)})"
+
+
+def configure(config: Optional[Dict[str, Any]]) -> Optional[LanguageDetector]:
+    """Enable language detection from the `advanced.language_detection` configuration.
+
+    Args:
+        config (Optional[Dict[str, Any]]): The `advanced.language_detection` configuration section.
+
+    Returns:
+        Optional[LanguageDetector]: The active detector or None if detection is disabled.
+    """
+    global _detector
+    if config and config.get("enabled"):
+        _detector = LanguageDetector.from_config(config)
+    else:
+        _detector = None
+    return _detector
+
+
+def get_detector() -> Optional[LanguageDetector]:
+    """Get the active detector.
+
+    Returns:
+        Optional[LanguageDetector]: The active detector or None if detection is disabled.
+    """
+    return _detector
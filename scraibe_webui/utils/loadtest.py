@@ -0,0 +1,329 @@
+"""
+loadtest.py
+
+This module provides the end-to-end load test behind `scraibe-webui loadtest`.
+
+The WebUI is started in a separate process with the stub backend from `stub.py` and sends its
+mails to a local `SMTPSink`. Simulated users drive the app through `gradio_client`, uploading a
+synthetic clip and submitting it like a user clicking the button. The number of users is ramped
+up in stages; for every stage the latency percentiles, the error rate, the throughput and the
+resident memory of the server process are reported.
+
+For the `simple` interface the latency is the time until the transcript is returned. For the
+`async` interface the submit latency is the time until the UI confirms the upload, and the job
+latency is the time until the transcript mail arrives at the sink.
+
+Classes:
+    StageResult: The measurements of one load stage.
+    LoadTest: Starts the server and runs the load stages.
+
+Functions:
+    get_rss: Get the resident memory of a process.
+"""
+import os
+import json
+import socket
+import multiprocessing
+from time import perf_counter, sleep, time
+from threading import Thread, Event, Lock
+from urllib.request import urlopen
+from urllib.error import URLError
+from typing import Any, Dict, Iterable, List, Optional
+
+from .stub import SMTPSink, use_stub_backend
+from .warmup import create_warmup_clip
+
+
+def get_rss(pid: int) -> Optional[int]:
+    """Get the resident memory of a process.
+
+    Args:
+        pid (int): The process id.
+
+    Returns:
+        Optional[int]: The resident set size in bytes or None if it cannot be read.
+    """
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except Exception:
+        return None
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve(config: Optional[str], overrides: Dict[str, Any], stub_kwargs: Dict[str, Any]) -> None:
+    """Start the WebUI with the stub backend. Runs in the server process."""
+    from ..app import App
+
+    use_stub_backend(**stub_kwargs)
+    App.load_config(config, **overrides).start()
+
+
+class StageResult:
+    """
+    The measurements of one load stage.
+
+    Attributes:
+        users (int): The number of concurrent users.
+        latencies (List[float]): Latencies of the successful requests in seconds.
+        job_latencies (List[float]): Seconds until the transcript mail arrived (async only).
+        errors (int): Number of failed requests.
+        rss (List[int]): Samples of the resident memory of the server in bytes.
+        duration (float): The wall time of the stage in seconds.
+    """
+    def __init__(self, users: int) -> None:
+        self.users = users
+        self.latencies = []
+        self.job_latencies = []
+        self.errors = 0
+        self.rss = []
+        self.duration = 0.0
+        self.lock = Lock()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Summarize the stage.
+
+        Returns:
+            Dict[str, Any]: Percentiles, error rate, throughput and memory of the stage.
+        """
+        requests = len(self.latencies) + self.errors
+        summary = {"users": self.users,
+                   "requests": requests,
+                   "errors": self.errors,
+                   "error_rate": self.errors / requests if requests else 0.0,
+                   "throughput": len(self.latencies) / self.duration if self.duration else 0.0,
+                   "p50": _percentile(self.latencies, 0.50),
+                   "p95": _percentile(self.latencies, 0.95),
+                   "p99": _percentile(self.latencies, 0.99),
+                   "rss_max": max(self.rss) if self.rss else None,
+                   "rss_mean": sum(self.rss) / len(self.rss) if self.rss else None}
+        if self.job_latencies:
+            summary.update({"job_p50": _percentile(self.job_latencies, 0.50),
+                            "job_p95": _percentile(self.job_latencies, 0.95),
+                            "job_p99": _percentile(self.job_latencies, 0.99)})
+        return summary
+
+
+class LoadTest:
+    """
+    Starts the WebUI with a stub backend and a local SMTP sink and drives it with simulated users.
+
+    Attributes:
+        interface_type (str): Either 'simple' or 'async'.
+        config (str): Path to a config.yaml applied before the load test overrides.
+        task (str): The task submitted by the users.
+        stub_kwargs (Dict[str, Any]): Keyword arguments of `StubScraibe` like `latency` or `rtf`.
+        clip_duration (float): Duration of the uploaded clip in seconds.
+        port (int): The port of the server.
+    """
+    def __init__(self,
+                 interface_type: str = "simple",
+                 config: Optional[str] = None,
+                 task: str = "Transcribe",
+                 latency: float = 0.5,
+                 rtf: float = 0.0,
+                 clip_duration: float = 10.0,
+                 port: Optional[int] = None,
+                 startup_timeout: float = 120.0) -> None:
+        """
+        Initializes the LoadTest.
+
+        Args:
+            interface_type (str, optional): Either 'simple' or 'async'. Defaults to "simple".
+            config (str, optional): Path to a config.yaml. Defaults to None.
+            task (str, optional): The task submitted by the users. Defaults to "Transcribe".
+            latency (float, optional): Seconds per stub model call. Defaults to 0.5.
+            rtf (float, optional): Stub seconds per second of audio. Defaults to 0.0.
+            clip_duration (float, optional): Duration of the uploaded clip in seconds. Defaults to 10.0.
+            port (int, optional): The port of the server. Defaults to a free port.
+            startup_timeout (float, optional): Seconds to wait for the server. Defaults to 120.0.
+        """
+        if interface_type not in ("simple", "async"):
+            raise ValueError(f"Invalid interface type: {interface_type}. Must be 'simple' or 'async'.")
+
+        self.interface_type = interface_type
+        self.config = config
+        self.task = task
+        self.stub_kwargs = {"latency": latency, "rtf": rtf}
+        self.clip_duration = clip_duration
+        self.port = port or _free_port()
+        self.startup_timeout = startup_timeout
+
+        self.sink = None
+        self.process = None
+        self.clip = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/"
+
+    def start(self) -> 'LoadTest':
+        """Start the SMTP sink and the server and wait until the server is ready."""
+        self.sink = SMTPSink().start()
+        self.clip = create_warmup_clip(duration=self.clip_duration)
+
+        overrides = {"interface_type": self.interface_type,
+                     "launch": {"server_name": "127.0.0.1", "server_port": self.port,
+                                "prevent_thread_lock": False, "show_api": True},
+                     "advanced": {"status_endpoint": "/status"},
+                     "mail": self.sink.mail_config()}
+        context = multiprocessing.get_context("spawn")
+        self.process = context.Process(target=_serve, args=(self.config, overrides, self.stub_kwargs),
+                                       name="scraibe-loadtest-server", daemon=True)
+        self.process.start()
+
+        deadline = time() + self.startup_timeout
+        while time() < deadline:
+            if not self.process.is_alive():
+                raise RuntimeError("The WebUI process exited during startup.")
+            try:
+                with urlopen(f"{self.url}status", timeout=1) as response:
+                    if json.loads(response.read()).get("ready"):
+                        return self
+            except (URLError, OSError, ValueError):
+                pass
+            sleep(0.5)
+        self.stop()
+        raise TimeoutError(f"The WebUI did not become ready within {self.startup_timeout} seconds.")
+
+    def stop(self) -> None:
+        """Stop the server and the SMTP sink."""
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(10)
+        if self.sink is not None:
+            self.sink.stop()
+        if self.clip is not None and os.path.exists(self.clip):
+            os.remove(self.clip)
+
+    def _submit(self, client: Any, receiver: str) -> None:
+        from gradio_client import handle_file
+
+        if self.interface_type == "simple":
+            client.predict(self.task, 0, False, "Unspecified", handle_file(self.clip), None, None,
+                           api_name="/run_scraibe")
+        else:
+            job = client.submit(self.task, 0, False, "Unspecified", handle_file(self.clip), None, None,
+                                receiver, api_name="/run_scraibe_async")
+            # the first update confirms the upload, the second one only hides the notification
+            while not job.done() and not job.outputs():
+                sleep(0.01)
+            if job.done() and job.exception() is not None:
+                raise job.exception()
+
+    def _user(self, index: int, client: Any, stage: StageResult, stop: Event,
+              submitted: Dict[str, float]) -> None:
+        n = 0
+        while not stop.is_set():
+            receiver = f"user{index}-{n}@localhost"
+            n += 1
+            start = perf_counter()
+            submitted[receiver] = time()
+            try:
+                self._submit(client, receiver)
+                with stage.lock:
+                    stage.latencies.append(perf_counter() - start)
+            except Exception:
+                submitted.pop(receiver, None)
+                with stage.lock:
+                    stage.errors += 1
+
+    def run_stage(self, users: int, duration: float = 30.0, drain_timeout: float = 300.0) -> StageResult:
+        """Run a load stage with a fixed number of concurrent users.
+
+        Args:
+            users (int): The number of concurrent users.
+            duration (float, optional): Seconds the users keep submitting. Defaults to 30.0.
+            drain_timeout (float, optional): Seconds to wait for the transcript mails of the
+                                             async interface after the stage. Defaults to 300.0.
+
+        Returns:
+            StageResult: The measurements of the stage.
+        """
+        from gradio_client import Client
+
+        stage = StageResult(users)
+        clients = [Client(self.url, verbose=False) for _ in range(users)]
+        stop, submitted = Event(), {}
+        first_message = len(self.sink.messages)
+
+        threads = [Thread(target=self._user, args=(i, client, stage, stop, submitted), daemon=True)
+                   for i, client in enumerate(clients)]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+
+        deadline = time() + duration
+        while time() < deadline:
+            rss = get_rss(self.process.pid)
+            if rss is not None:
+                stage.rss.append(rss)
+            sleep(0.5)
+
+        stop.set()
+        for thread in threads:
+            thread.join()
+        stage.duration = perf_counter() - start
+
+        if self.interface_type == "async":
+            # every job sends an upload mail and a result mail
+            deadline = time() + drain_timeout
+            while len(self.sink.messages) - first_message < 2 * len(submitted) and time() < deadline:
+                rss = get_rss(self.process.pid)
+                if rss is not None:
+                    stage.rss.append(rss)
+                sleep(0.5)
+            for message in self.sink.messages[first_message:]:
+                receiver = message["to"][0]
+                if receiver not in submitted or b"Upload Successful" in message["data"]:
+                    continue
+                if b"An error occurred" in message["data"]:
+                    stage.errors += 1
+                else:
+                    stage.job_latencies.append(message["received_at"] - submitted[receiver])
+
+        for client in clients:
+            if hasattr(client, "close"):
+                client.close()
+        return stage
+
+    def run(self, users: Iterable[int] = (1, 2, 4, 8), duration: float = 30.0) -> List[Dict[str, Any]]:
+        """Ramp up the load in stages.
+
+        Args:
+            users (Iterable[int], optional): The number of concurrent users of each stage. Defaults to (1, 2, 4, 8).
+            duration (float, optional): Seconds per stage. Defaults to 30.0.
+
+        Returns:
+            List[Dict[str, Any]]: The summary of every stage.
+        """
+        return [self.run_stage(n, duration).to_dict() for n in users]
+
+    def __enter__(self) -> 'LoadTest':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def __repr__(self) -> str:
+        return (f"LoadTest(interface_type={self.interface_type}, task={self.task}, "
+                f"stub={self.stub_kwargs}, url={self.url})")
@@ -1,5 +1,9 @@
+import os
 import ssl
+import json
 import smtplib
+from uuid import uuid4
+from time import time
 from typing import Union, Optional
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -7,6 +11,8 @@ from email.mime.base import MIMEBase
 from email import encoders
 import warnings
 
+from .metrics import time_stage, SMTP_ERRORS_TOTAL
+
 class MailService:
     def __init__(self,
                  sender_email: str,
@@ -22,7 +28,8 @@ class MailService:
                  error_subject: str = "An error occurred during processing.",
                  success_template: str = None,
                  success_subject: str = "Your transcript is ready.",
-                 css_template_path: str = None) -> None:
+                 css_template_path: str = None,
+                 outbox: str = None) -> None:
         """
         Initializes the Mail Service class.
 
@@ -45,6 +52,8 @@ class MailService:
             success_template (str, optional): HTML template for success notifications.
             success_subject (str, optional): Subject line for success notifications.
             css_template_path (str, optional): Path to a CSS file for email styling.
+            outbox (str, optional): Directory in which mails which could not be sent are kept
+                                    until `flush_outbox` sends them. Defaults to None, which drops them.
 
         Returns:
             None
@@ -68,6 +77,7 @@ class MailService:
         self.success_subject = success_subject
 
         self.css_template_path = css_template_path
+        self.outbox = outbox
 
         # Store the context parameter for later use
         self.context_param = context
@@ -140,16 +150,66 @@ class MailService:
             message (str): The email body.
             attachments (list, optional): List of file paths to attach.
         """
-        _message = self.setup_message(subject, receiver_email, message, attachments)
-        if not self.mailserver:
-            self.mailserver = self.setup_mailserver()
+        with time_stage("mail_send", subject=subject):
+            _message = self.setup_message(subject, receiver_email, message, attachments)
             if not self.mailserver:
-                warnings.warn("Failed to connect to the mail server. Email not sent.")
-                return
+                self.mailserver = self.setup_mailserver()
+                if not self.mailserver:
+                    SMTP_ERRORS_TOTAL.inc()
+                    warnings.warn("Failed to connect to the mail server. Email not sent.")
+                    self.store_in_outbox(receiver_email, _message.as_string())
+                    return
+            try:
+                self.mailserver.sendmail(self.sender_email, receiver_email, _message.as_string())
+            except Exception as e:
+                SMTP_ERRORS_TOTAL.inc()
+                warnings.warn(f"Failed to send email: {e}")
+                self.store_in_outbox(receiver_email, _message.as_string())
+
+    def store_in_outbox(self, receiver_email: str, message: str) -> None:
+        """Keep a mail which could not be sent in the outbox. Does nothing without an outbox.
+
+        Args:
+            receiver_email (str): The receiver's email address.
+            message (str): The complete message including its attachments.
+        """
+        if not self.outbox:
+            return
+        os.makedirs(self.outbox, exist_ok=True)
+        path = os.path.join(self.outbox, f"{int(time() * 1000):015d}-{uuid4().hex}.json")
+        tmp = f"{path}.tmp"
         try:
-            self.mailserver.sendmail(self.sender_email, receiver_email, _message.as_string())
-        except Exception as e:
-            warnings.warn(f"Failed to send email: {e}")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"receiver_email": receiver_email, "message": message}, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            warnings.warn(f"Failed to store the email in the outbox: {e}")
+
+    def flush_outbox(self) -> int:
+        """Send the mails kept in the outbox, oldest first.
+
+        Returns:
+            int: The number of mails which are still in the outbox.
+        """
+        if not self.outbox or not os.path.isdir(self.outbox):
+            return 0
+        pending = sorted(name for name in os.listdir(self.outbox) if name.endswith(".json"))
+        for i, name in enumerate(pending):
+            path = os.path.join(self.outbox, name)
+            if not self.mailserver:
+                self.mailserver = self.setup_mailserver()
+                if not self.mailserver:
+                    return len(pending) - i
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    mail = json.load(f)
+                self.mailserver.sendmail(self.sender_email, mail["receiver_email"], mail["message"])
+            except Exception as e:
+                SMTP_ERRORS_TOTAL.inc()
+                warnings.warn(f"Failed to send email from the outbox: {e}")
+                return len(pending) - i
+            os.remove(path)
+        return 0
 
     def setup_message(self, subject: str, receiver_email: str, message: str, attachments: list = None) -> MIMEMultipart:
         """Prepare the email message.
@@ -247,6 +307,7 @@ class MailService:
             success_template=config.get('success_template'),
             success_subject=config.get('success_subject', "Your transcript is ready."),
             css_template_path=config.get('css_template_path'),
+            outbox=config.get('outbox'),
         )
 
     def __repr__(self) -> str:
@@ -0,0 +1,87 @@
+"""
+media.py
+
+Helper functions to inspect media files without decoding them.
+
+Functions:
+    get_media_duration: Get the duration of a media file in seconds.
+    get_total_duration: Get the summed duration of one or more media files.
+    media_hash: Get the SHA-256 of the content of a media file.
+"""
+import os
+import hashlib
+from functools import lru_cache
+from subprocess import run, CalledProcessError, TimeoutExpired
+from typing import Iterable, Optional, Union
+
+
+def get_media_duration(path: str) -> Optional[float]:
+    """Get the duration of a media file in seconds using ffprobe.
+
+    Args:
+        path (str): The path to the media file.
+
+    Returns:
+        Optional[float]: The duration in seconds, or None if it could not be determined.
+    """
+    cmd = [
+        "ffprobe",
+        "-v", "error",
+        "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1",
+        path
+    ]
+    try:
+        out = run(cmd, capture_output=True, check=True, timeout=30).stdout
+        return float(out.decode().strip())
+    except (CalledProcessError, TimeoutExpired, FileNotFoundError, ValueError):
+        return None
+
+
+def get_total_duration(source: Union[str, Iterable[str], None]) -> Optional[float]:
+    """Get the summed duration of one or more media files.
+
+    Args:
+        source (Union[str, Iterable[str], None]): A path or a list of paths.
+
+    Returns:
+        Optional[float]: The total duration in seconds, or None if any duration is unknown.
+    """
+    if source is None:
+        return None
+    if isinstance(source, str):
+        source = [source]
+
+    total = 0.0
+    for path in source:
+        duration = get_media_duration(getattr(path, 'name', path))
+        if duration is None:
+            return None
+        total += duration
+    return total
+
+
+@lru_cache(maxsize=1024)
+def _file_hash(path: str, size: int, mtime_ns: int) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def media_hash(path: str) -> str:
+    """Get the SHA-256 of the content of a media file.
+
+    The hash is memoized by path, size and modification time, so asking again for an
+    unchanged file does not read it again.
+
+    Args:
+        path (str): The path to the media file.
+
+    Returns:
+        str: The hex digest of the content.
+    """
+    path = getattr(path, 'name', path)
+    stat = os.stat(path)
+    return _file_hash(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
@@ -0,0 +1,344 @@
+"""
+metrics.py
+
+This module provides a minimal Prometheus compatible metrics surface for the WebUI.
+
+Counters, gauges and histograms are kept in a process wide registry and rendered in the
+Prometheus text exposition format by the `/metrics` endpoint. Metrics are disabled by default,
+in which case every update returns immediately and the instrumentation has negligible overhead.
+
+Classes:
+    Counter: A monotonically increasing value.
+    Gauge: A value that can go up and down or is computed on scrape.
+    Histogram: Observations counted in cumulative buckets.
+    MetricsRegistry: Holds all metrics and renders them.
+
+Functions:
+    enable: Enable the collection of metrics.
+    is_enabled: Check if metrics are collected.
+    time_stage: Context manager timing a stage of a job.
+    queue_depth: Get the number of async jobs which are queued or running.
+    metrics_route: Create the starlette route serving the metrics.
+"""
+from time import time
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .tracing import open_span, close_span
+
+DEFAULT_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, float("inf"))
+
+STAGES = ("queue_wait", "model_load", "decode", "vad", "language_detection", "transcription", "diarisation", "mail_send")
+
+_enabled = False
+
+
+def enable(enabled: bool = True) -> None:
+    """Enable or disable the collection of metrics.
+
+    Args:
+        enabled (bool, optional): Whether metrics should be collected. Defaults to True.
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled() -> bool:
+    """Check if metrics are collected.
+
+    Returns:
+        bool: True if metrics are collected, False otherwise.
+    """
+    return _enabled
+
+
+def _escape_label(value: Any) -> str:
+    # the exposition format requires backslashes, quotes and newlines to be escaped
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{k}="{_escape_label(v)}"' for k, v in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class of all metrics."""
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        """
+        Initializes the metric.
+
+        Args:
+            name (str): The name of the metric.
+            documentation (str): The help text of the metric.
+            labelnames (Iterable[str], optional): The names of the labels. Defaults to ().
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        """Render the samples of this metric."""
+        with self._lock:
+            return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                    for key, value in self._values.items()]
+
+    def render(self) -> str:
+        """Render the metric in the Prometheus text exposition format."""
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """A monotonically increasing value."""
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increase the counter.
+
+        Args:
+            amount (float, optional): The amount to add. Defaults to 1.
+            **labels (str): The label values.
+        """
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value that can go up and down or is computed when scraped."""
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 function: Optional[Callable[[], float]] = None) -> None:
+        """
+        Initializes the gauge.
+
+        Args:
+            name (str): The name of the metric.
+            documentation (str): The help text of the metric.
+            labelnames (Iterable[str], optional): The names of the labels. Defaults to ().
+            function (Callable[[], float], optional): Computes the value when scraped. Defaults to None.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the gauge to a value.
+
+        Args:
+            value (float): The new value.
+            **labels (str): The label values.
+        """
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> List[str]:
+        if self.function is not None:
+            return [f"{self.name} {_format_value(self.function())}"]
+        return super().samples()
+
+
+class Histogram(_Metric):
+    """Observations counted in cumulative buckets."""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        """
+        Initializes the histogram.
+
+        Args:
+            name (str): The name of the metric.
+            documentation (str): The help text of the metric.
+            labelnames (Iterable[str], optional): The names of the labels. Defaults to ().
+            buckets (Tuple[float, ...], optional): The upper bounds of the buckets. Defaults to DEFAULT_BUCKETS.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != float("inf"):
+            self.buckets += (float("inf"),)
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Observe a value.
+
+        Args:
+            value (float): The observed value.
+            **labels (str): The label values.
+        """
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                for bound, count in zip(self.buckets, counts):
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds all metrics of the process and renders them."""
+
+    def __init__(self) -> None:
+        """Initializes an empty registry."""
+        self.metrics = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        """Register a metric. Registering a name twice returns the existing metric.
+
+        Args:
+            metric (_Metric): The metric to register.
+
+        Returns:
+            _Metric: The registered metric.
+        """
+        return self.metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The rendered metrics.
+        """
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+def queue_depth() -> int:
+    """Get the number of async jobs which are queued or running, in the spool or the in-process queue.
+
+    Returns:
+        int: The number of jobs.
+    """
+    import scraibe_webui.global_var as gv
+    if gv.SPOOL is not None:
+        return gv.SPOOL.depth()
+    if gv.SCHEDULER is not None:
+        return gv.SCHEDULER.depth()
+    return max(gv.NUMBER_OF_QUEUE, 0)
+
+
+def _active_workers() -> float:
+    import scraibe_webui.global_var as gv
+    return gv.ACTIVE_WORKERS
+
+
+def _worker_utilization() -> float:
+    import scraibe_webui.global_var as gv
+    return gv.ACTIVE_WORKERS / max(gv.MAX_CONCURRENT_MODELS or 1, 1)
+
+
+JOB_SECONDS = REGISTRY.register(Histogram(
+    "scraibe_job_seconds", "End to end processing time of a job.", ("interface",)))
+JOB_STAGE_SECONDS = REGISTRY.register(Histogram(
+    "scraibe_job_stage_seconds", "Time spent in a stage of a job.", ("stage",)))
+JOBS_TOTAL = REGISTRY.register(Counter(
+    "scraibe_jobs_total", "Number of finished jobs.", ("interface", "status")))
+SMTP_ERRORS_TOTAL = REGISTRY.register(Counter(
+    "scraibe_smtp_errors_total", "Number of failed SMTP connections or sends."))
+VAD_SKIPPED_RATIO = REGISTRY.register(Histogram(
+    "scraibe_vad_skipped_ratio", "Fraction of the audio of a file removed as non-speech.",
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)))
+VAD_SKIPPED_SECONDS_TOTAL = REGISTRY.register(Counter(
+    "scraibe_vad_skipped_seconds_total", "Seconds of audio removed as non-speech."))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    "scraibe_batch_size", "Number of short jobs run together in a batch.",
+    buckets=(1, 2, 4, 8, 16, 32, float("inf"))))
+COALESCED_TOTAL = REGISTRY.register(Counter(
+    "scraibe_coalesced_total", "Number of requests served by an identical computation in flight.", ("level",)))
+CACHE_HITS_TOTAL = REGISTRY.register(Counter(
+    "scraibe_cache_hits_total", "Number of cache hits.", ("cache",)))
+CACHE_MISSES_TOTAL = REGISTRY.register(Counter(
+    "scraibe_cache_misses_total", "Number of cache misses.", ("cache",)))
+JANITOR_RECLAIMED_BYTES_TOTAL = REGISTRY.register(Counter(
+    "scraibe_janitor_reclaimed_bytes_total", "Bytes reclaimed by the janitor."))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "scraibe_queue_depth", "Number of async jobs which are queued or running.", function=queue_depth))
+ACTIVE_WORKERS = REGISTRY.register(Gauge(
+    "scraibe_active_workers", "Number of jobs currently running.", function=_active_workers))
+WORKER_UTILIZATION = REGISTRY.register(Gauge(
+    "scraibe_worker_utilization", "Running jobs relative to the number of async workers.",
+    function=_worker_utilization))
+
+
+class time_stage:
+    """Context manager timing a stage of a job.
+
+    The stage is observed in the stage histogram and, if the job is traced, recorded as span.
+
+    Example:
+        >>> with time_stage("transcription"):
+        ...     model.transcribe(audio)
+    """
+    __slots__ = ("stage", "attributes", "start", "span")
+
+    def __init__(self, stage: str, **attributes: Any) -> None:
+        self.stage = stage
+        self.attributes = attributes
+        self.start = None
+        self.span = None
+
+    def __enter__(self) -> 'time_stage':
+        if _enabled:
+            self.start = time()
+        self.span = open_span(self.stage, **self.attributes)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        close_span(self.span)
+        if self.start is not None:
+            JOB_STAGE_SECONDS.observe(time() - self.start, stage=self.stage)
+
+
+def metrics_route(path: str = "/metrics"):
+    """Create the starlette route serving the metrics.
+
+    Args:
+        path (str, optional): The path of the endpoint. Defaults to "/metrics".
+
+    Returns:
+        Route: The route which can be added to the Gradio app.
+    """
+    from starlette.routing import Route
+    from starlette.responses import PlainTextResponse
+
+    # a plain function runs in the threadpool, the locks of the scheduler never block the event loop
+    def _metrics_endpoint(request):
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    return Route(path, _metrics_endpoint, methods=["GET"])
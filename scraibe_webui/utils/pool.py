@@ -0,0 +1,260 @@
+"""
+pool.py
+
+This module routes jobs to Whisper models and keeps the routed models in memory.
+
+Every job would otherwise use the single `scraibe_params.whisper_model`. With routing rules,
+jobs in a given language or below a given duration can be sent to a cheaper model, e.g. an
+English-only `.en` variant or a smaller model, while the large multilingual model is only used
+for the remaining jobs. The `ModelPool` loads every routed model once and keeps the most recently
+used ones in memory.
+
+If a job has no language and language detection is enabled, the language is detected with the
+`detect_model` before routing. The result is cached, so the routed model does not detect it again,
+and identical concurrent uploads share one detection if single-flight is enabled.
+
+A model is loaded outside the lock of the pool, so models already in memory are served while
+another one loads. Concurrent requests for a model which is loading wait for that load.
+
+Rules are checked in order and the first matching rule wins:
+
+    rules:
+      - language: [English]
+        max_duration: 600
+        model: small.en
+      - language: [English]
+        model: medium.en
+
+Classes:
+    ModelRouter: Selects the model of a job from routing rules.
+    ModelPool: Loads the routed models and keeps the most recently used ones in memory.
+"""
+from threading import Event, Lock
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from .wrapper import ScraibeWrapper
+from .media import get_total_duration
+from .langdetect import get_detector, normalize_language
+from .metrics import time_stage, CACHE_HITS_TOTAL, CACHE_MISSES_TOTAL
+from .singleflight import run_once
+
+
+class ModelRouter:
+    """
+    Selects the model of a job from routing rules.
+
+    A rule matches if all of its conditions hold:
+        language (Union[str, List[str]]): The language of the job as name or code, e.g. "English"
+                                          or "en". "Unspecified" matches jobs without a known language.
+        min_duration (float): The job has at least this many seconds of media.
+        max_duration (float): The job has at most this many seconds of media.
+
+    Attributes:
+        rules (List[Dict[str, Any]]): The rules, each with a `model` and optional conditions.
+    """
+    def __init__(self, rules: Optional[List[Dict[str, Any]]] = None) -> None:
+        """
+        Initializes the ModelRouter.
+
+        Args:
+            rules (List[Dict[str, Any]], optional): The routing rules. Defaults to None.
+        """
+        self.rules = []
+        for rule in rules or []:
+            if not rule.get("model"):
+                raise ValueError(f"Routing rule without model: {rule}")
+            languages = rule.get("language")
+            if isinstance(languages, str):
+                languages = [languages]
+            self.rules.append({**rule, "language": [normalize_language(lang) for lang in languages] if languages else None})
+
+    @property
+    def uses_language(self) -> bool:
+        """Whether any rule depends on the language."""
+        return any(rule["language"] is not None for rule in self.rules)
+
+    @property
+    def uses_duration(self) -> bool:
+        """Whether any rule depends on the duration of the media."""
+        return any(rule.get("min_duration") is not None or rule.get("max_duration") is not None
+                   for rule in self.rules)
+
+    @staticmethod
+    def _matches(rule: Dict[str, Any], language: Optional[str], duration: Optional[float]) -> bool:
+        if rule["language"] is not None and normalize_language(language or "unspecified") not in rule["language"]:
+            return False
+        if rule.get("min_duration") is not None and (duration is None or duration < rule["min_duration"]):
+            return False
+        if rule.get("max_duration") is not None and (duration is None or duration > rule["max_duration"]):
+            return False
+        return True
+
+    def route(self, language: Optional[str] = None, duration: Optional[float] = None,
+              default: Optional[str] = None) -> Optional[str]:
+        """Select the model of a job.
+
+        Args:
+            language (str, optional): The requested or detected language. Defaults to None.
+            duration (float, optional): The duration of the media in seconds. Rules with a
+                                        duration condition do not match if it is unknown.
+            default (str, optional): The model used if no rule matches. Defaults to None.
+
+        Returns:
+            Optional[str]: The name of the model.
+        """
+        for rule in self.rules:
+            if self._matches(rule, language, duration):
+                return rule["model"]
+        return default
+
+    def __repr__(self) -> str:
+        return f"ModelRouter(rules={len(self.rules)})"
+
+
+class ModelPool:
+    """
+    Loads the routed models and keeps the most recently used ones in memory.
+
+    Attributes:
+        scraibe_params (Dict[str, Any]): The parameters used to load the models.
+        router (ModelRouter): Selects the model of a job.
+        max_models (int): The number of models kept in memory.
+        detect_model (str): The model detecting the language of jobs without language.
+    """
+    def __init__(self, scraibe_params: Dict[str, Any], router: Optional[ModelRouter] = None,
+                 max_models: int = 2, detect_model: Optional[str] = None) -> None:
+        """
+        Initializes the ModelPool.
+
+        Args:
+            scraibe_params (dict): The parameters used to load the models. `whisper_model` is
+                                   the model of jobs which match no rule.
+            router (ModelRouter, optional): Selects the model of a job. Defaults to no rules.
+            max_models (int, optional): The number of models kept in memory. Defaults to 2.
+            detect_model (str, optional): The model detecting the language of jobs without
+                                          language. Defaults to `scraibe_params.whisper_model`.
+        """
+        self.scraibe_params = scraibe_params
+        self.router = router or ModelRouter()
+        self.max_models = max(int(max_models), 1)
+        self.detect_model = detect_model
+
+        self._models = OrderedDict()
+        self._loading = {} # model -> set once its load finished or failed
+        self._lock = Lock()
+
+    @property
+    def routed_models(self) -> List[str]:
+        """The default model and the models of the rules, without duplicates."""
+        models = [self.scraibe_params.get("whisper_model")] + [rule["model"] for rule in self.router.rules]
+        return list(dict.fromkeys(model for model in models if model))
+
+    @property
+    def loaded_models(self) -> List[str]:
+        """The names of the models in memory, the least recently used first."""
+        return list(self._models)
+
+    def get(self, model: Optional[str] = None) -> ScraibeWrapper:
+        """Get a model from the pool and load it if it is not in memory.
+
+        If the pool is full, the least recently used model is dropped. Jobs still running
+        with it keep their reference until they finish. A model which is loading by another
+        request is waited for instead of being loaded twice.
+
+        Args:
+            model (str, optional): The name of the model. Defaults to `scraibe_params.whisper_model`.
+
+        Returns:
+            ScraibeWrapper: The loaded model.
+        """
+        model = model or self.scraibe_params.get("whisper_model")
+        while True:
+            with self._lock:
+                if model in self._models:
+                    CACHE_HITS_TOTAL.inc(cache="model")
+                    self._models.move_to_end(model)
+                    return self._models[model]
+
+                loading = self._loading.get(model)
+                if loading is None:
+                    loading = self._loading[model] = Event()
+                    break
+            # loaded by now, or its load failed and this request tries it itself
+            loading.wait()
+
+        CACHE_MISSES_TOTAL.inc(cache="model")
+        try:
+            with time_stage("model_load"):
+                pipe = ScraibeWrapper.load_from_dict({**self.scraibe_params, "whisper_model": model})
+            with self._lock:
+                while len(self._models) >= self.max_models:
+                    self._models.popitem(last=False)
+                self._models[model] = pipe
+            return pipe
+        finally:
+            with self._lock:
+                del self._loading[model]
+            loading.set()
+
+    def route(self, source: Union[str, Iterable[str], None] = None, language: Optional[str] = None,
+              default: Optional[str] = None) -> Optional[str]:
+        """Select the model of a job.
+
+        Args:
+            source (Union[str, Iterable[str]], optional): The media of the job.
+            language (str, optional): The requested language. If None or "Unspecified", it is
+                                      detected when language detection is enabled.
+            default (str, optional): The model used if no rule matches. Defaults to `scraibe_params.whisper_model`.
+
+        Returns:
+            Optional[str]: The name of the model.
+        """
+        if (source is not None and language in (None, "Unspecified")
+                and self.router.uses_language and get_detector() is not None):
+            first = source if isinstance(source, str) else next(iter(source))
+            # identical uploads in flight detect it once, later ones hit the cache of the detector
+            language, _ = run_once(first, lambda: self.get(self.detect_model).detect_language(first),
+                                   task="language_detection", model=self.detect_model)
+
+        # probing the media is only worth it if a rule needs the duration
+        duration = get_total_duration(source) if source is not None and self.router.uses_duration else None
+        return self.router.route(language, duration, default or self.scraibe_params.get("whisper_model"))
+
+    def get_for(self, source: Union[str, Iterable[str], None] = None, language: Optional[str] = None,
+                default: Optional[str] = None) -> ScraibeWrapper:
+        """Get the routed model of a job from the pool.
+
+        Args:
+            source (Union[str, Iterable[str]], optional): The media of the job.
+            language (str, optional): The requested or detected language. Defaults to None.
+            default (str, optional): The model used if no rule matches. Defaults to `scraibe_params.whisper_model`.
+
+        Returns:
+            ScraibeWrapper: The loaded model.
+        """
+        return self.get(self.route(source, language, default))
+
+    def clear(self) -> None:
+        """Drop all models."""
+        with self._lock:
+            self._models.clear()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], scraibe_params: Dict[str, Any]) -> 'ModelPool':
+        """Initialize the ModelPool from a configuration dictionary.
+
+        Args:
+            config (dict): The `advanced.model_routing` configuration section.
+            scraibe_params (dict): The parameters used to load the models.
+
+        Returns:
+            ModelPool: An instance of ModelPool.
+        """
+        return cls(scraibe_params,
+                   router=ModelRouter(config.get("rules")),
+                   max_models=config.get("max_models") or 2,
+                   detect_model=config.get("detect_model"))
+
+    def __repr__(self) -> str:
+        return f"ModelPool(router={self.router}, max_models={self.max_models}, loaded={self.loaded_models})"
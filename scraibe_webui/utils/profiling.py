@@ -0,0 +1,317 @@
+"""
+profiling.py
+
+This module provides an opt-in profiler hook for single jobs.
+
+Selected jobs are profiled either with a low overhead stack sampler or with cProfile. For every
+profiled job a collapsed stack file (`<job_id>.collapsed`, one `frame;frame;frame count` line per
+stack, readable by flame graph tools) is written to the output directory. In cProfile mode the
+raw profile (`<job_id>.prof`) is written as well. Only one job at a time can run under cProfile,
+since Python 3.12 allows a single active profiler; concurrent jobs are sampled instead. Profiling
+never fails a job, errors while writing a profile are only warned about. `aggregate_profiles`
+combines all collapsed stack files of a directory into a hotspot report, which is exposed as
+`scraibe-webui profile-report`.
+
+When profiling is disabled `profile_job` returns immediately and adds no overhead.
+
+Classes:
+    StackSampler: Samples the stack of a single thread in a background thread.
+    JobProfiler: Selects jobs and writes their profiles.
+
+Functions:
+    configure: Enable profiling from the `advanced.profile_jobs` configuration.
+    profile_job: Context manager profiling a job if it is selected.
+    aggregate_profiles: Aggregate collapsed stack files into a hotspot report.
+"""
+import os
+import sys
+import random
+import pstats
+import warnings
+import cProfile
+from glob import glob
+from threading import Thread, Event, Lock, get_ident
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+_profiler = None
+
+_cprofile_lock = Lock() # held by the job running under cProfile
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class StackSampler:
+    """
+    Samples the stack of a single thread in a background thread.
+
+    Attributes:
+        interval (float): Seconds between two samples.
+        counts (Dict[str, int]): Number of samples per collapsed stack.
+    """
+    def __init__(self, thread_id: int, interval: float = 0.01) -> None:
+        """
+        Initializes the StackSampler.
+
+        Args:
+            thread_id (int): The identifier of the thread to sample.
+            interval (float, optional): Seconds between two samples. Defaults to 0.01.
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self._stop_event = Event()
+        self._thread = Thread(target=self._run, name="scraibe-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def start(self) -> 'StackSampler':
+        """Start sampling."""
+        self._thread.start()
+        return self
+
+    def stop(self) -> Dict[str, int]:
+        """Stop sampling.
+
+        Returns:
+            Dict[str, int]: Number of samples per collapsed stack.
+        """
+        self._stop_event.set()
+        self._thread.join()
+        return self.counts
+
+
+class JobProfiler:
+    """
+    Selects jobs and writes their profiles.
+
+    Attributes:
+        output_dir (str): Directory the profiles are written to.
+        mode (str): Either 'sampler' or 'cprofile'.
+        sample_rate (float): Fraction of the jobs which are profiled.
+        interval (float): Seconds between two samples of the stack sampler.
+        tasks (List[str]): Only jobs of these tasks are profiled. None selects all tasks.
+        min_media_duration (float): Only jobs with at least this media duration are profiled.
+    """
+    def __init__(self,
+                 output_dir: str = "profiles",
+                 mode: str = "sampler",
+                 sample_rate: float = 1.0,
+                 interval: float = 0.01,
+                 tasks: Optional[List[str]] = None,
+                 min_media_duration: Optional[float] = None) -> None:
+        """
+        Initializes the JobProfiler.
+
+        Args:
+            output_dir (str, optional): Directory the profiles are written to. Defaults to "profiles".
+            mode (str, optional): Either 'sampler' or 'cprofile'. Defaults to "sampler".
+            sample_rate (float, optional): Fraction of the jobs which are profiled. Defaults to 1.0.
+            interval (float, optional): Seconds between two samples. Defaults to 0.01.
+            tasks (List[str], optional): Only jobs of these tasks are profiled. Defaults to None.
+            min_media_duration (float, optional): Minimum media duration of profiled jobs. Defaults to None.
+        """
+        if mode not in ("sampler", "cprofile"):
+            raise ValueError(f"Invalid profiling mode: {mode}. Must be 'sampler' or 'cprofile'.")
+
+        self.output_dir = output_dir
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.tasks = tasks
+        self.min_media_duration = min_media_duration
+
+        os.makedirs(output_dir, exist_ok=True)
+
+    def select(self, task: Optional[str] = None, media_duration: Optional[float] = None) -> bool:
+        """Decide if a job is profiled.
+
+        Args:
+            task (str, optional): The task of the job.
+            media_duration (float, optional): The duration of the media of the job.
+
+        Returns:
+            bool: True if the job should be profiled.
+        """
+        if self.tasks and task not in self.tasks:
+            return False
+        if self.min_media_duration is not None and (media_duration or 0) < self.min_media_duration:
+            return False
+        return random.random() < self.sample_rate
+
+    def write_collapsed(self, job_id: str, counts: Dict[str, float]) -> str:
+        """Write collapsed stacks to `<job_id>.collapsed`.
+
+        Args:
+            job_id (str): The id of the job.
+            counts (Dict[str, float]): Weight per collapsed stack.
+
+        Returns:
+            str: The path of the written file.
+        """
+        path = os.path.join(self.output_dir, f"{job_id}.collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(counts.items(), key=lambda x: -x[1]):
+                f.write(f"{stack} {int(count)}\n")
+        return path
+
+    @staticmethod
+    def collapse_cprofile(profile: cProfile.Profile) -> Dict[str, float]:
+        """Convert a cProfile result into collapsed `caller;function` stacks weighted by own time.
+
+        cProfile does not record full stacks, therefore only the direct caller is kept.
+
+        Args:
+            profile (cProfile.Profile): The finished profile.
+
+        Returns:
+            Dict[str, float]: Own time in microseconds per collapsed stack.
+        """
+        counts = {}
+        stats = pstats.Stats(profile).stats
+        for (filename, _, func), (_, _, tottime, _, callers) in stats.items():
+            name = f"{os.path.basename(filename)}:{func}"
+            if not callers:
+                counts[name] = counts.get(name, 0) + tottime * 1e6
+            for (c_file, _, c_func), caller_stats in callers.items():
+                key = f"{os.path.basename(c_file)}:{c_func};{name}"
+                counts[key] = counts.get(key, 0) + caller_stats[2] * 1e6
+        return counts
+
+    @staticmethod
+    def _start_cprofile() -> Optional[cProfile.Profile]:
+        """Start cProfile for the current thread, None if another job or tool is profiling already."""
+        if not _cprofile_lock.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiling tool, e.g. a debugger or coverage, is active
+            _cprofile_lock.release()
+            return None
+        return profile
+
+    @contextmanager
+    def profile(self, job_id: str):
+        """Profile the enclosed code of the current thread.
+
+        In cProfile mode a job is sampled instead if another one runs under cProfile.
+
+        Args:
+            job_id (str): The id of the job used for the file names.
+        """
+        profile = self._start_cprofile() if self.mode == "cprofile" else None
+        sampler = StackSampler(get_ident(), self.interval).start() if profile is None else None
+        try:
+            yield
+        finally:
+            try:
+                if profile is not None:
+                    profile.disable()
+                    profile.dump_stats(os.path.join(self.output_dir, f"{job_id}.prof"))
+                    self.write_collapsed(job_id, self.collapse_cprofile(profile))
+                else:
+                    self.write_collapsed(job_id, sampler.stop())
+            except Exception as e:
+                warnings.warn(f"Could not write the profile of job {job_id}: {e!r}")
+            finally:
+                if profile is not None:
+                    _cprofile_lock.release()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'JobProfiler':
+        """Initialize the JobProfiler from a configuration dictionary.
+
+        Args:
+            config (dict): The `advanced.profile_jobs` configuration section.
+
+        Returns:
+            JobProfiler: An instance of JobProfiler.
+        """
+        return cls(output_dir=config.get("output_dir") or "profiles",
+                   mode=config.get("mode") or "sampler",
+                   sample_rate=config.get("sample_rate", 1.0),
+                   interval=config.get("interval") or 0.01,
+                   tasks=config.get("tasks"),
+                   min_media_duration=config.get("min_media_duration"))
+
+
+def configure(config: Optional[Dict[str, Any]]) -> Optional[JobProfiler]:
+    """Enable profiling from the `advanced.profile_jobs` configuration.
+
+    Args:
+        config (Optional[Dict[str, Any]]): The `advanced.profile_jobs` configuration section.
+
+    Returns:
+        Optional[JobProfiler]: The active profiler or None if profiling is disabled.
+    """
+    global _profiler
+    if config and config.get("enabled"):
+        _profiler = JobProfiler.from_config(config)
+    else:
+        _profiler = None
+    return _profiler
+
+
+@contextmanager
+def profile_job(job_id: str, task: Optional[str] = None, media_duration: Optional[float] = None):
+    """Profile a job if profiling is enabled and the job is selected.
+
+    Args:
+        job_id (str): The id of the job.
+        task (str, optional): The task of the job.
+        media_duration (float, optional): The duration of the media of the job.
+    """
+    if _profiler is None or not _profiler.select(task, media_duration):
+        yield
+        return
+
+    with _profiler.profile(job_id):
+        yield
+
+
+def aggregate_profiles(directory: str, top: int = 20) -> Dict[str, List[Dict[str, Any]]]:
+    """Aggregate all collapsed stack files of a directory into a hotspot report.
+
+    Args:
+        directory (str): The directory containing `.collapsed` files.
+        top (int, optional): Number of hotspots to report. Defaults to 20.
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: The `self` and `inclusive` hotspots. Each entry holds
+            the frame, its weight and its share of the total weight.
+    """
+    own, inclusive = {}, {}
+    total = 0
+    for path in glob(os.path.join(directory, "*.collapsed")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                if not stack:
+                    continue
+                count = float(count)
+                frames = stack.split(";")
+                total += count
+                own[frames[-1]] = own.get(frames[-1], 0) + count
+                for frame in set(frames):
+                    inclusive[frame] = inclusive.get(frame, 0) + count
+
+    def _top(counts: Dict[str, float]) -> List[Dict[str, Any]]:
+        ranked = sorted(counts.items(), key=lambda x: -x[1])[:top]
+        return [{"frame": frame, "weight": weight, "share": weight / total if total else 0.0}
+                for frame, weight in ranked]
+
+    return {"self": _top(own), "inclusive": _top(inclusive)}
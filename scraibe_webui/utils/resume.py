@@ -0,0 +1,194 @@
+"""
+resume.py
+
+This module checkpoints the results of multi-file jobs, so they can be resumed.
+
+The results of every file of a job are copied into a checkpoint directory as soon as the file
+is done. When the job is run again under the same job id, e.g. after a worker crashed and the
+spool requeued the job, the finished files are taken from the checkpoint and the job resumes
+at the first unfinished file. The checkpoint is removed once the job is finished.
+
+A file which still fails after `retries` further attempts fails the job. With `partial_results`
+the remaining files are processed anyway, the reciever gets the transcripts of the finished
+files and an error notification listing the failed ones.
+
+Layout of the checkpoint directory:
+    <job id>/manifest.json    The finished files: index, name of the media and result files.
+    <job id>/<index>/         The result files of the file with that index.
+
+Classes:
+    PartialResultError: Raised when some files of a job failed permanently.
+    CheckpointStore: Keeps the results of the finished files of running jobs.
+
+Functions:
+    configure: Configure the store from the `advanced.checkpoints` configuration.
+    get_checkpoint_store: Get the active store, None if checkpointing is disabled.
+"""
+import os
+import json
+import shutil
+import warnings
+from uuid import uuid4
+from typing import Any, Dict, List, Optional, Tuple
+
+_store = None
+
+
+class PartialResultError(Exception):
+    """
+    Raised when some files of a job failed permanently.
+
+    Attributes:
+        failed (List[Tuple[str, Exception]]): The name of every failed file and its error.
+        total (int): The number of files of the job.
+    """
+    def __init__(self, failed: List[Tuple[str, Exception]], total: int) -> None:
+        details = "; ".join(f"{name}: {error}" for name, error in failed)
+        super().__init__(f"{len(failed)} of {total} files could not be processed ({details}). "
+                         "The transcripts of the other files were sent separately.")
+        self.failed = failed
+        self.total = total
+
+
+class CheckpointStore:
+    """
+    Keeps the results of the finished files of running jobs.
+
+    Attributes:
+        path (str): The checkpoint directory.
+        retries (int): How often a failed file is tried again before it fails permanently.
+        partial_results (bool): Whether the other files of a job are processed and mailed if a file fails permanently.
+    """
+    def __init__(self, path: str = "checkpoints", retries: int = 0, partial_results: bool = False) -> None:
+        """
+        Initializes the CheckpointStore and creates its directory.
+
+        Args:
+            path (str, optional): The checkpoint directory. Defaults to "checkpoints".
+            retries (int, optional): How often a failed file is tried again. Defaults to 0.
+            partial_results (bool, optional): Whether the finished files are mailed if a file
+                                              fails permanently. Defaults to False.
+        """
+        self.path = os.path.abspath(path)
+        self.retries = max(int(retries or 0), 0)
+        self.partial_results = partial_results
+        os.makedirs(self.path, exist_ok=True)
+
+    def _manifest(self, job_id: str) -> str:
+        return os.path.join(self.path, job_id, "manifest.json")
+
+    def _read(self, job_id: str) -> List[Dict[str, Any]]:
+        try:
+            with open(self._manifest(job_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            warnings.warn(f"Could not read the checkpoint of job {job_id}: {e}")
+            return []
+
+    def load(self, job_id: str, sources: List[str]) -> Dict[int, List[str]]:
+        """Get the results of the finished files of a job.
+
+        Args:
+            job_id (str): The id of the job.
+            sources (List[str]): The media of the job. A file only counts as finished if the
+                                 media at its index still has the same name.
+
+        Returns:
+            Dict[int, List[str]]: The paths of the result files by the index of the media.
+        """
+        done = {}
+        for entry in self._read(job_id):
+            index = entry["index"]
+            if index >= len(sources) or os.path.basename(sources[index]) != entry["name"]:
+                continue
+            paths = [os.path.join(self.path, job_id, str(index), name) for name in entry["results"]]
+            if all(os.path.exists(path) for path in paths):
+                done[index] = paths
+        return done
+
+    def save(self, job_id: str, index: int, source: str, results: List[str]) -> None:
+        """Copy the results of a finished file into the checkpoint.
+
+        Args:
+            job_id (str): The id of the job.
+            index (int): The index of the file within the job.
+            source (str): The media of the file.
+            results (List[str]): The paths of its result files.
+        """
+        target = os.path.join(self.path, job_id, str(index))
+        try:
+            os.makedirs(target, exist_ok=True)
+            for path in results:
+                shutil.copyfile(path, os.path.join(target, os.path.basename(path)))
+
+            entries = [entry for entry in self._read(job_id) if entry["index"] != index]
+            entries.append({"index": index, "name": os.path.basename(source),
+                            "results": [os.path.basename(path) for path in results]})
+            tmp = f"{self._manifest(job_id)}.{uuid4().hex}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self._manifest(job_id))
+        except OSError as e:
+            # the job goes on, it only cannot be resumed at this file
+            warnings.warn(f"Could not checkpoint file {index} of job {job_id}: {e}")
+
+    def clear(self, job_id: str) -> None:
+        """Remove the checkpoint of a finished job.
+
+        Args:
+            job_id (str): The id of the job.
+        """
+        shutil.rmtree(os.path.join(self.path, job_id), ignore_errors=True)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'CheckpointStore':
+        """Initialize the CheckpointStore from a configuration dictionary.
+
+        Args:
+            config (dict): The `advanced.checkpoints` configuration section.
+
+        Returns:
+            CheckpointStore: An instance of CheckpointStore.
+        """
+        return cls(path=config.get("path") or "checkpoints",
+                   retries=config.get("retries") or 0,
+                   partial_results=config.get("partial_results", False))
+
+    def __repr__(self) -> str:
+        return f"CheckpointStore(path={self.path}, retries={self.retries}, partial_results={self.partial_results})"
+
+
+def configure(config: Optional[Dict[str, Any]], spool_path: Optional[str] = None) -> Optional[CheckpointStore]:
+    """Configure the store from the `advanced.checkpoints` configuration.
+
+    Args:
+        config (Optional[Dict[str, Any]]): The `advanced.checkpoints` configuration section.
+        spool_path (str, optional): The spool directory. Without a configured `path` the
+                                    checkpoints are kept in its `checkpoints/` directory, so
+                                    all workers sharing the spool can resume each other's jobs.
+
+    Returns:
+        Optional[CheckpointStore]: The active store, None if checkpointing is disabled.
+    """
+    global _store
+    config = config or {}
+    if not config.get("enabled"):
+        _store = None
+        return None
+    if not config.get("path") and spool_path:
+        config = {**config, "path": os.path.join(spool_path, "checkpoints")}
+    _store = CheckpointStore.from_config(config)
+    return _store
+
+
+def get_checkpoint_store() -> Optional[CheckpointStore]:
+    """Get the active store.
+
+    Returns:
+        Optional[CheckpointStore]: The active store, None if checkpointing is disabled.
+    """
+    return _store
@@ -0,0 +1,826 @@
+"""
+scheduler.py
+
+This module queues the jobs of the async interface and runs them on a fixed number of worker threads.
+
+The number of workers is `advanced.concurrent_workers_async`. With batching enabled, short
+Transcribe jobs of different users which are queued within a short window are run together:
+the model is loaded once for the whole batch and the clips are transcribed in one batched
+inference call where the backend supports it, see `batching.py`. Every user still receives
+their own transcript or error notification.
+
+A short job waits at most `window` seconds after it was submitted for other short jobs to join
+its batch. Jobs which waited longer, e.g. behind a backlog, are batched with whatever is queued
+without waiting any further.
+
+Jobs are queued per tenant, by default the mail address of the reciever, and the next job is
+taken from the tenants by smooth weighted round-robin. A user submitting many jobs therefore
+only gets their share of the workers, and the single job of another user is started after at
+most one job of every other tenant instead of after the whole backlog. The number of running
+jobs of a tenant can be capped.
+
+The queue can be bounded by its depth and by the estimated time until a new job would be done.
+The estimate is the media duration of the running and queued jobs ahead of it, each multiplied
+by the real-time factor of its model and task from the `RTFStore`, divided by the number of
+workers. A submission exceeding either bound is refused with a `QueueFullError`.
+
+Jobs can be cancelled, and a running job is cancelled once it ran longer than `job_timeout`.
+A queued job is simply dropped. By default a running job is stopped at its next checkpoint,
+see `cancel.py`, and its worker takes the next job once it stopped. A stage which hangs is
+never interrupted, so it keeps its worker. With `isolation` set to "process" every job is run
+in a child process which is killed once the job is cancelled, see `isolation.py`.
+
+With single-flight enabled, a job with the same media and parameters as a queued or running job
+is attached to it as a follower instead of being queued. It takes no worker and gets the result
+of the job it follows under the names of its own files, see `singleflight.py`.
+
+On shutdown `drain` stops taking jobs, lets the running ones finish for a while and returns the
+unfinished jobs, so they can be persisted and submitted again on the next start.
+
+Classes:
+    QueueFullError: Raised when a job is refused because the queue is full.
+    JobScheduler: Queues the async jobs per tenant and runs them on worker threads, batching short clips.
+
+Functions:
+    format_duration: Format seconds as a short human readable duration.
+"""
+import json
+import warnings
+from time import time
+from uuid import uuid4
+from collections import Counter, OrderedDict, deque
+from threading import Condition, Thread
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import scraibe_webui.global_var as gv
+from .media import get_total_duration
+from .janitor import register_files, release_files
+from .eta import get_rtf_store
+from .cancel import CancelToken, JobCancelled, bind
+from .mail import MailService
+from .singleflight import flight_key, get_single_flight
+from .metrics import COALESCED_TOTAL
+from .isolation import run_isolated
+
+BATCH_TASKS = ('Transcribe',)
+
+TENANT_KEYS = ("reciever", "domain", None)
+
+ISOLATION_MODES = ("thread", "process")
+
+
+def format_duration(seconds: float) -> str:
+    """Format seconds as a short human readable duration, e.g. "2 h 15 min".
+
+    Args:
+        seconds (float): The duration in seconds.
+
+    Returns:
+        str: The formatted duration.
+    """
+    minutes = max(int(round(seconds / 60)), 1)
+    if minutes < 60:
+        return f"{minutes} min"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 48:
+        return f"{hours} h {minutes} min"
+    return f"{hours // 24} days {hours % 24} h"
+
+
+class QueueFullError(Exception):
+    """
+    Raised when a job is refused because the queue is full.
+
+    Attributes:
+        eta (float): The estimated seconds until a new job would be done.
+    """
+    def __init__(self, message: str, eta: float) -> None:
+        super().__init__(message)
+        self.eta = eta
+
+
+class JobScheduler:
+    """
+    Queues the async jobs and runs them on worker threads, batching short clips.
+
+    Attributes:
+        workers (int): The number of jobs or batches run at the same time.
+        max_batch (int): The maximum number of jobs in a batch. 1 disables batching.
+        window (float): Seconds a short job waits for other short jobs to join its batch.
+        max_duration (float): Jobs with at most this many seconds of media are batched.
+        tenant_key (str): How the tenant of a job is determined: 'reciever' (the mail address),
+                          'domain' (of the mail address) or None (first come, first served).
+        weights (Dict[str, float]): The share of the workers of each tenant. Tenants which are
+                                    not listed have weight 1.
+        max_running_per_tenant (int): The maximum number of running jobs of a tenant, None for no limit.
+        max_queue_depth (int): The maximum number of queued and running jobs, None for no limit.
+        max_wait (float): The maximum estimated seconds until a new job would be done, None for no limit.
+        job_timeout (float): The maximum seconds a job or batch runs before it is cancelled, None for no limit.
+        isolation (str): How jobs are run: 'thread' (stopped at their next checkpoint when
+                         cancelled) or 'process' (in a child process which is killed when cancelled).
+        setup (Dict[str, Any]): The configuration of the child processes, see `run_isolated`.
+    """
+    def __init__(self, workers: int = 1, max_batch: int = 1, window: float = 2.0,
+                 max_duration: float = 60.0, tenant_key: Optional[str] = "reciever",
+                 weights: Optional[Dict[str, float]] = None,
+                 max_running_per_tenant: Optional[int] = None,
+                 max_queue_depth: Optional[int] = None,
+                 max_wait: Optional[float] = None,
+                 job_timeout: Optional[float] = None,
+                 isolation: str = "thread",
+                 setup: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Initializes the JobScheduler.
+
+        Args:
+            workers (int, optional): The number of jobs or batches run at the same time. Defaults to 1.
+            max_batch (int, optional): The maximum number of jobs in a batch. 1 disables batching.
+                                       Defaults to 1.
+            window (float, optional): Seconds a short job waits for other short jobs. Defaults to 2.0.
+            max_duration (float, optional): Jobs with at most this many seconds of media are
+                                            batched. Defaults to 60.0.
+            tenant_key (str, optional): 'reciever', 'domain' or None. Defaults to "reciever".
+            weights (Dict[str, float], optional): The weight of each tenant. Defaults to None.
+            max_running_per_tenant (int, optional): The maximum number of running jobs of a
+                                                    tenant. Defaults to None.
+            max_queue_depth (int, optional): The maximum number of queued and running jobs.
+                                             Defaults to None.
+            max_wait (float, optional): The maximum estimated seconds until a new job would be
+                                        done. Defaults to None.
+            job_timeout (float, optional): The maximum seconds a job or batch runs before it is
+                                           cancelled. Defaults to None.
+            isolation (str, optional): 'thread' or 'process'. Defaults to "thread".
+            setup (Dict[str, Any], optional): The configuration of the child processes. Defaults to None.
+        """
+        if tenant_key not in TENANT_KEYS:
+            raise ValueError(f"Invalid tenant key: {tenant_key}. Must be 'reciever', 'domain' or null.")
+        if isolation not in ISOLATION_MODES:
+            raise ValueError(f"Invalid isolation: {isolation}. Must be 'thread' or 'process'.")
+        if isolation == "process" and max_batch and max_batch > 1:
+            warnings.warn("Batching is not supported with process isolation, the jobs are run one by one.")
+            max_batch = 1
+        self.workers = max(int(workers or 1), 1)
+        self.max_batch = max(int(max_batch or 1), 1)
+        self.window = window
+        self.max_duration = max_duration
+        self.tenant_key = tenant_key
+        self.weights = {str(k).lower(): float(v) for k, v in (weights or {}).items()}
+        self.max_running_per_tenant = max_running_per_tenant
+        self.max_queue_depth = max_queue_depth
+        self.max_wait = max_wait
+        self.job_timeout = job_timeout
+        self.isolation = isolation
+        self.setup = setup or {}
+
+        self._queues = OrderedDict() # tenant -> queued jobs
+        self._credit = {} # tenant -> current weight of the smooth weighted round-robin
+        self._active = Counter() # tenant -> running jobs
+        self._open = set() # batch keys of the batches which are being gathered
+        self._running = 0
+        self._started = {} # job id -> running job
+        self._stopped = False
+        self._threads = []
+        self._spawned = 0
+        self._watchdog = None
+        self._cond = Condition()
+
+    @property
+    def batching(self) -> bool:
+        """Whether short jobs are batched."""
+        return self.max_batch > 1
+
+    def tenant(self, reciever: str) -> str:
+        """Get the tenant of a job.
+
+        Args:
+            reciever (str): The mail address the result is sent to.
+
+        Returns:
+            str: The tenant, an empty string if all jobs share one tenant.
+        """
+        if self.tenant_key == "reciever":
+            return reciever.strip().lower()
+        if self.tenant_key == "domain":
+            return reciever.strip().rsplit("@", 1)[-1].lower()
+        return ""
+
+    def weight(self, tenant: str) -> float:
+        """Get the weight of a tenant.
+
+        Args:
+            tenant (str): The tenant.
+
+        Returns:
+            float: The weight, 1 if the tenant has no configured weight.
+        """
+        return max(self.weights.get(tenant, 1.0), 1e-6)
+
+    @staticmethod
+    def _model(runner: Any, job: Dict[str, Any]) -> Optional[str]:
+        """Get the expected model of a job. Routing by detected language is not known before the job runs."""
+        model = runner.scraibe_kwargs.get("whisper_model")
+        if gv.MODEL_POOL is not None:
+            model = gv.MODEL_POOL.router.route(job["language"], job["duration"], model)
+        return model
+
+    def _batch_key(self, runner: Any, job: Dict[str, Any]) -> Optional[str]:
+        """Get the key of the batches a job can join, None if it is not batched."""
+        if not self.batching or job["task"] not in BATCH_TASKS:
+            return None
+        if job["duration"] is None or job["duration"] > self.max_duration:
+            return None
+
+        return json.dumps({"scraibe": {**runner.scraibe_kwargs, "whisper_model": job["model"]},
+                           "threads": runner.threads_per_model,
+                           "mail": runner.mail_service_params,
+                           "translate": job["translate"],
+                           "language": job["language"]}, sort_keys=True, default=str)
+
+    def submit(self, runner: Any,
+               audio: Union[str, List[str]],
+               reciever: str,
+               task: str,
+               num_speakers: int,
+               translate: bool,
+               language: str,
+               error_format_options: Optional[dict] = None,
+               transcript_format_options: Optional[dict] = None,
+               job_id: Optional[str] = None,
+               submitted_at: Optional[float] = None,
+               check_limits: bool = True) -> Dict[str, Any]:
+        """Queue a job unless the queue is full.
+
+        Args:
+            runner (BackgroundThread): Runs the job and mails its result.
+            audio (Union[str, List[str]]): The media of the job.
+            reciever (str): The mail address the result is sent to.
+            task (str): The task to run. One of 'Auto Transcribe', 'Transcribe' or 'Diarisation'.
+            num_speakers (int): The number of speakers.
+            translate (bool): Whether to translate the transcription.
+            language (str): The language of the media.
+            error_format_options (dict, optional): Format options of the error mail. Defaults to None.
+            transcript_format_options (dict, optional): Format options of the result mail. Defaults to None.
+            job_id (str, optional): The id of a job which is submitted again. Defaults to a new id.
+            submitted_at (float, optional): When the job was first submitted. Defaults to now.
+            check_limits (bool, optional): Whether the queue limits apply. Defaults to True. Jobs
+                                           restored after a restart skip them: they were accepted
+                                           under the same limits before, and a refused restored
+                                           job would be lost without anyone being told.
+
+        Returns:
+            Dict[str, Any]: The queued job.
+
+        Raises:
+            QueueFullError: If the queue has `max_queue_depth` jobs or the new job would be
+                            done later than `max_wait` seconds from now.
+        """
+        job = {"job_id": job_id or uuid4().hex,
+               "runner": runner,
+               "audio": audio,
+               "reciever": reciever,
+               "task": task,
+               "num_speakers": num_speakers,
+               "translate": translate,
+               "language": language,
+               "error_format_options": error_format_options or {},
+               "transcript_format_options": transcript_format_options or {},
+               "tenant": self.tenant(reciever),
+               "duration": get_total_duration(audio),
+               "submitted_at": submitted_at or time(),
+               "cancel_secret": uuid4().hex}
+        job["model"] = self._model(runner, job)
+        job["batch_key"] = self._batch_key(runner, job)
+        job["flight_key"] = (flight_key(audio, task=task, model=job["model"],
+                                        translate=translate, language=language,
+                                        num_speakers=num_speakers if task != 'Transcribe' else None)
+                             if get_single_flight() is not None else None)
+
+        with self._cond:
+            leader = self._leader(job)
+            if leader is not None:
+                # done together with the identical job, it does not need a worker of its own
+                register_files(audio)
+                job["leader"] = leader
+                leader.setdefault("followers", []).append(job)
+                COALESCED_TOTAL.inc(level="job")
+                return job
+
+            depth = sum(len(queue) for queue in self._queues.values()) + self._running
+            if check_limits and self.max_queue_depth is not None and depth >= self.max_queue_depth:
+                eta = self._eta(job, new=True)
+                raise QueueFullError(f"The queue is full ({depth} jobs). A new job would be done in about "
+                                     f"{format_duration(eta)}. Please try again later.", eta)
+            if check_limits and self.max_wait is not None:
+                eta = self._eta(job, new=True)
+                if eta > self.max_wait:
+                    raise QueueFullError(f"The queue is full. A new job would be done in about "
+                                         f"{format_duration(eta)}. Please try again later.", eta)
+
+            register_files(audio) # protect the uploaded media from the janitor until the job is done
+            self._queues.setdefault(job["tenant"], deque()).append(job)
+            self._cond.notify_all()
+        return job
+
+    def depth(self) -> int:
+        """Get the number of queued and running jobs.
+
+        Returns:
+            int: The number of jobs.
+        """
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values()) + self._running
+
+    def _order(self, extra: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Project the order in which the queued jobs, and `extra` if given, are started, ignoring caps and batches."""
+        queues = {tenant: deque(queue) for tenant, queue in self._queues.items()}
+        if extra is not None:
+            queues.setdefault(extra["tenant"], deque()).append(extra)
+        credit = {tenant: self._credit.get(tenant, 0.0) for tenant in queues}
+        order = []
+        while queues:
+            total = sum(self.weight(tenant) for tenant in queues)
+            for tenant in queues:
+                credit[tenant] += self.weight(tenant)
+            tenant = max(queues, key=credit.get)
+            credit[tenant] -= total
+            order.append(queues[tenant].popleft())
+            if not queues[tenant]:
+                del queues[tenant]
+        return order
+
+    def rtf(self, job: Dict[str, Any]) -> float:
+        """Get the expected real-time factor of a job.
+
+        Args:
+            job (Dict[str, Any]): The job.
+
+        Returns:
+            float: The real-time factor of the model and task of the job from the `RTFStore`.
+        """
+        return get_rtf_store().estimate(job.get("model"), job.get("task"))
+
+    def _cost(self, job: Dict[str, Any]) -> float:
+        """Expected seconds of processing of a job, the remaining ones if it is running."""
+        cost = (job["duration"] or 0.0) * self.rtf(job)
+        if "started_at" in job:
+            cost = max(cost - (time() - job["started_at"]), 0.0)
+        return cost
+
+    def _eta(self, job: Dict[str, Any], new: bool = False) -> float:
+        """Estimated seconds until a running, queued or new job is done."""
+        if job.get("job_id") in self._started:
+            return self._cost(job)
+
+        ahead = sum(self._cost(running) for running in self._started.values())
+        for queued in self._order(job if new else None):
+            if queued is job:
+                break
+            ahead += self._cost(queued)
+        return ahead / self.workers + self._cost(job)
+
+    def estimate(self, reciever: str = "", duration: Optional[float] = None,
+                 task: Optional[str] = None, model: Optional[str] = None) -> float:
+        """Estimate the seconds until a new job would be done.
+
+        Args:
+            reciever (str, optional): The mail address of the new job. Defaults to "".
+            duration (float, optional): The media duration of the new job. Defaults to None.
+            task (str, optional): The task of the new job. Defaults to None.
+            model (str, optional): The model of the new job. Defaults to None.
+
+        Returns:
+            float: The estimated seconds.
+        """
+        with self._cond:
+            return self._eta({"job_id": None, "tenant": self.tenant(reciever), "duration": duration,
+                              "task": task, "model": model}, new=True)
+
+    def estimated_completion(self, job_id: str) -> Optional[float]:
+        """Estimate when a queued or running job is done.
+
+        The estimate changes as jobs finish faster or slower than expected and as the
+        real-time factors in the `RTFStore` are updated.
+
+        Args:
+            job_id (str): The id of the job.
+
+        Returns:
+            Optional[float]: The estimated UNIX time, None if the job is not queued or running.
+        """
+        with self._cond:
+            job = self.find(job_id)
+            if job is not None:
+                job = job.get("leader", job) # a following job is done with the job it follows
+            return time() + self._eta(job) if job is not None else None
+
+    def backlog(self) -> float:
+        """Estimate the seconds until all queued and running jobs are done.
+
+        Returns:
+            float: The estimated seconds.
+        """
+        with self._cond:
+            jobs = list(self._started.values()) + [job for queue in self._queues.values() for job in queue]
+            return sum(self._cost(job) for job in jobs) / self.workers
+
+    def queued(self) -> List[Dict[str, Any]]:
+        """Get the queued jobs in the order in which they are expected to start.
+
+        Returns:
+            List[Dict[str, Any]]: The queued jobs.
+        """
+        with self._cond:
+            return self._order()
+
+    def position(self, job_id: str) -> int:
+        """Get the expected position of a job, counting the running jobs and the job itself.
+
+        Args:
+            job_id (str): The id of the job.
+
+        Returns:
+            int: The position of the job or 0 if it is not queued anymore. A following job has the
+                 position of the job it follows.
+        """
+        with self._cond:
+            job = self.find(job_id)
+            if job is not None and "leader" in job:
+                job_id = job["leader"]["job_id"]
+            for i, job in enumerate(self._order()):
+                if job["job_id"] == job_id:
+                    return self._running + i + 1
+        return 0
+
+    def _leader(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Get a queued or running job which computes the same result and can still take followers."""
+        if job["flight_key"] is None:
+            return None
+        for other in [*self._started.values(), *(queued for queue in self._queues.values() for queued in queue)]:
+            if (other.get("flight_key") == job["flight_key"] and not other.get("sealed")
+                    and not other.get("released") and other.get("cancelled") is None):
+                return other
+        return None
+
+    def _seal(self, job: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Stop a job from taking followers and get its followers."""
+        with self._cond:
+            job["sealed"] = True
+            return list(job.get("followers", []))
+
+    def _promote(self, job: Dict[str, Any]) -> None:
+        """Queue the first follower of a cancelled job in its place, the others follow it."""
+        followers = job.pop("followers", [])
+        if job.get("sealed") or not followers:
+            return
+        leader, followers = followers[0], followers[1:]
+        del leader["leader"]
+        leader["followers"] = followers
+        for follower in followers:
+            follower["leader"] = leader
+        self._queues.setdefault(leader["tenant"], deque()).appendleft(leader)
+        self._cond.notify_all()
+
+    def find(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get a queued, running or following job.
+
+        Args:
+            job_id (str): The id of the job.
+
+        Returns:
+            Optional[Dict[str, Any]]: The job, None if it is not queued, running or following a job.
+        """
+        with self._cond:
+            jobs = [*self._started.values(), *(job for queue in self._queues.values() for job in queue)]
+            for job in jobs + [follower for job in jobs for follower in job.get("followers", [])]:
+                if job["job_id"] == job_id:
+                    return job
+            return None
+
+    def cancel(self, job_id: str, reason: str = "cancelled by the user", notify: bool = True) -> bool:
+        """Cancel a queued or running job.
+
+        A queued job is removed from the queue. A running job is stopped at its next checkpoint,
+        or killed with process isolation, and its worker takes the next job once it stopped. A
+        job of a batch is skipped when the batch is done,
+        the batch itself is only stopped once all its jobs are cancelled. A following job is
+        detached from the job it follows, unless that job already sends it the result. The
+        followers of a cancelled job are queued again, the first one in its place.
+
+        Args:
+            job_id (str): The id of the job.
+            reason (str, optional): Why the job is cancelled. Defaults to "cancelled by the user".
+            notify (bool, optional): Whether the reciever is told by mail. The mail of a queued
+                                     or following job is sent in the background. Defaults to True.
+
+        Returns:
+            bool: Whether the job was queued, running or following a job which can still be cancelled.
+        """
+        with self._cond:
+            job = self.find(job_id)
+            if job is not None and "leader" in job:
+                if job["leader"].get("sealed"):
+                    return False # the runner took it with its leader and sends it the result
+                job["leader"]["followers"].remove(job)
+            elif job is not None and job_id in self._started:
+                self._promote(job)
+                if job.get("cancelled") is None:
+                    job["cancelled"] = JobCancelled(reason, notify)
+                    if all(peer.get("cancelled") is not None for peer in job["batch"]):
+                        self._cancel_running(job["batch"], reason, notify)
+                return True
+            elif job is not None:
+                queue = self._queues[job["tenant"]]
+                queue.remove(job)
+                if not queue:
+                    del self._queues[job["tenant"]]
+                    self._credit.pop(job["tenant"], None)
+                self._promote(job)
+                self._cond.notify_all()
+            else:
+                return False
+
+        release_files(job["audio"])
+        gv.NUMBER_OF_QUEUE -= 1
+        if notify:
+            # called from the handlers of the cancel endpoint, which must not wait for the SMTP server
+            Thread(target=MailService.from_config(job["runner"].mail_service_params).send_error_notification,
+                   kwargs={"receiver_email": job["reciever"], "exception_message": JobCancelled(reason, notify),
+                           **job["error_format_options"]},
+                   name=f"scraibe-cancel-{job['job_id']}", daemon=True).start()
+        return True
+
+    def _cancel_running(self, batch: List[Dict[str, Any]], reason: str, notify: bool,
+                        requeue: bool = False) -> None:
+        """Stop a running job or batch. Its worker slot is freed once its worker thread is done with it."""
+        for job in batch:
+            if job.get("cancelled") is None:
+                job["cancelled"] = JobCancelled(reason, notify, requeue)
+        # no new worker is started in the meantime, a job which does not stop must not take
+        # more than its own share of the CPU, GPU and memory
+        batch[0]["token"].cancel(reason, notify, requeue)
+        self._cond.notify_all()
+
+    def _available(self, job: Dict[str, Any]) -> bool:
+        """Whether a job can be started, i.e. its tenant is below its cap and its batch is not being gathered."""
+        if self.max_running_per_tenant is not None and self._active[job["tenant"]] >= self.max_running_per_tenant:
+            return False
+        return job["batch_key"] is None or job["batch_key"] not in self._open
+
+    def _remove(self, job: Dict[str, Any], batch: List[Dict[str, Any]], token: CancelToken) -> None:
+        """Move a queued job to the running jobs as part of `batch`, which is cancelled with `token`."""
+        # a running job always has its batch and token, the watchdog and `cancel` rely on them
+        batch.append(job)
+        job["token"], job["batch"] = token, batch
+        queue = self._queues[job["tenant"]]
+        queue.remove(job)
+        if not queue:
+            # an idle tenant does not save up credit
+            del self._queues[job["tenant"]]
+            self._credit.pop(job["tenant"], None)
+        self._active[job["tenant"]] += 1
+        self._running += 1
+        job["started_at"] = time()
+        self._started[job["job_id"]] = job
+
+    def _release(self, job: Dict[str, Any]) -> None:
+        """Free the worker slot of a running job."""
+        if job.get("released"):
+            return
+        job["released"] = True
+        self._running -= 1
+        self._active[job["tenant"]] -= 1
+        self._started.pop(job["job_id"], None)
+
+    def _next(self) -> Optional[Dict[str, Any]]:
+        """Select the next job of the tenant selected by smooth weighted round-robin."""
+        candidates = {}
+        for tenant, queue in self._queues.items():
+            job = next((job for job in queue if self._available(job)), None)
+            if job is not None:
+                candidates[tenant] = job
+        if not candidates:
+            return None
+
+        total = sum(self.weight(tenant) for tenant in candidates)
+        for tenant in candidates:
+            self._credit[tenant] = self._credit.get(tenant, 0.0) + self.weight(tenant)
+        tenant = max(candidates, key=self._credit.get)
+        self._credit[tenant] -= total
+
+        return candidates[tenant]
+
+    def _take(self) -> Optional[List[Dict[str, Any]]]:
+        """Wait for the next job and gather the batch it belongs to. None once stopped."""
+        with self._cond:
+            job = None
+            while job is None:
+                if self._stopped:
+                    return None
+                job = self._next()
+                if job is None:
+                    self._cond.wait()
+
+            batch, token = [], CancelToken()
+            self._remove(job, batch, token)
+            key = job["batch_key"]
+            if key is None:
+                return self._arm(batch)
+
+            deadline = job["submitted_at"] + self.window
+            self._open.add(key)
+            try:
+                # a batch cancelled while it is gathered takes no further jobs
+                while not self._stopped and not token.cancelled:
+                    for queued in self._order():
+                        if len(batch) >= self.max_batch:
+                            break
+                        if queued["batch_key"] == key and self._available({**queued, "batch_key": None}):
+                            self._remove(queued, batch, token)
+                    remaining = deadline - time()
+                    if len(batch) >= self.max_batch or remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            finally:
+                self._open.discard(key)
+            return self._arm(batch)
+
+    def _arm(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Start the time limit of a gathered batch, its token expires `job_timeout` seconds from now."""
+        if self.job_timeout:
+            batch[0]["token"].deadline = time() + self.job_timeout
+        self._cond.notify_all() # the watchdog waits for the new deadline
+        return batch
+
+    def _run(self, batch: List[Dict[str, Any]]) -> List[Optional[Exception]]:
+        """Run a single job or a batch of short jobs and get the error of every job."""
+        for job in batch:
+            # the runner sends the result to the followers of the job, none can join afterwards
+            job["seal"] = lambda job=job: self._seal(job)
+
+        if len(batch) > 1:
+            return batch[0]["runner"].parrallel_batch(batch)
+
+        job = batch[0]
+        if self.isolation == "process":
+            return [run_isolated(job, self.setup)]
+        return [job["runner"].parrallel_task(job["audio"],
+                                     job["reciever"],
+                                     job["task"],
+                                     job["num_speakers"],
+                                     job["translate"],
+                                     job["language"],
+                                     job["error_format_options"],
+                                     job["transcript_format_options"],
+                                     submitted_at=job["submitted_at"],
+                                     job_id=job["job_id"],
+                                     followers=job["seal"])]
+
+    def _work(self) -> None:
+        while True:
+            batch = self._take()
+            if batch is None:
+                return
+            errors = [None] * len(batch)
+            try:
+                with bind(batch[0]["token"]):
+                    errors = self._run(batch) or errors
+            except Exception as e:
+                # the runner mails its own errors, this only keeps the worker alive
+                warnings.warn(f"Job {batch[0]['job_id']} failed: {e!r}")
+                errors = [e] * len(batch)
+            finally:
+                with self._cond:
+                    callbacks = []
+                    for job, error in zip(batch, errors):
+                        job["error"] = error
+                        self._release(job)
+                        callbacks.extend((callback, job) for callback in job.pop("callbacks", []))
+                    self._cond.notify_all() # a tenant may be below its cap again
+                for callback, job in callbacks:
+                    callback(job)
+
+    def when_done(self, job: Dict[str, Any], callback: Callable[[Dict[str, Any]], None]) -> None:
+        """Call `callback` with a started job once its worker is done with it, at once if it is done already.
+
+        The error the job failed or was cancelled with is in `job["error"]`, None if it succeeded.
+
+        Args:
+            job (Dict[str, Any]): A job which was started.
+            callback (Callable[[Dict[str, Any]], None]): Called with the job.
+        """
+        with self._cond:
+            if not job.get("released"):
+                job.setdefault("callbacks", []).append(callback)
+                return
+        callback(job)
+
+    def _watch(self) -> None:
+        """Cancel the jobs and batches which ran longer than `job_timeout`."""
+        with self._cond:
+            while not self._stopped:
+                now = time()
+                deadlines = []
+                for job in list(self._started.values()):
+                    if job["token"].reason is not None:
+                        continue # cancelled already, waiting for its worker to stop it
+                    deadline = job["token"].deadline # None while the batch is gathered
+                    if deadline is not None and now >= deadline:
+                        self._cancel_running(job["batch"], "the time limit was exceeded", True)
+                    elif deadline is not None:
+                        deadlines.append(deadline)
+                self._cond.wait(min(deadlines) - now if deadlines else None)
+
+    def _spawn(self) -> None:
+        """Start a new worker thread."""
+        thread = Thread(target=self._work, name=f"scraibe-scheduler-{self._spawned}", daemon=True)
+        self._spawned += 1
+        self._threads.append(thread)
+        thread.start()
+
+    def start(self) -> 'JobScheduler':
+        """Start the worker threads.
+
+        Returns:
+            JobScheduler: The scheduler itself.
+        """
+        with self._cond:
+            self._stopped = False
+            while len(self._threads) < self.workers:
+                self._spawn()
+            if self.job_timeout and (self._watchdog is None or not self._watchdog.is_alive()):
+                self._watchdog = Thread(target=self._watch, name="scraibe-scheduler-watchdog", daemon=True)
+                self._watchdog.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop the worker threads once their current job is done. Queued jobs stay queued."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for thread in list(self._threads):
+            thread.join()
+        self._threads = []
+
+    def drain(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Stop taking jobs and let the running ones finish for up to `timeout` seconds.
+
+        Running jobs which are not done by then are cancelled without notification and stop at
+        their next checkpoint, or are killed with process isolation. Their checkpoints are kept,
+        so they resume when submitted again.
+
+        Args:
+            timeout (float, optional): Seconds the running jobs may take. Defaults to None, which waits for them.
+
+        Returns:
+            List[Dict[str, Any]]: The queued jobs, the cancelled running jobs and their followers.
+        """
+        with self._cond:
+            self._stopped = True
+            queued = [job for queue in self._queues.values() for job in queue]
+            self._queues.clear()
+            self._credit.clear()
+            self._cond.notify_all()
+
+        deadline = time() + timeout if timeout is not None else None
+        for thread in list(self._threads):
+            thread.join(None if deadline is None else max(deadline - time(), 0))
+
+        with self._cond:
+            # jobs cancelled before, e.g. by their user, are not run again
+            running = [job for job in self._started.values() if job.get("cancelled") is None]
+            for batch in {id(job["batch"]): job["batch"] for job in running}.values():
+                self._cancel_running(batch, "the server is shutting down", notify=False, requeue=True)
+            followers = [follower for job in queued + running for follower in job.get("followers", [])]
+        return queued + running + followers
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], scraibe_params: Optional[Dict[str, Any]] = None) -> 'JobScheduler':
+        """Initialize the JobScheduler from a configuration dictionary.
+
+        Args:
+            config (dict): The `advanced` configuration section. Reads `concurrent_workers_async`
+                           and the `batching` and `scheduling` sections.
+            scraibe_params (dict, optional): The parameters used to load the models, used by the
+                                             child processes with process isolation. Defaults to None.
+
+        Returns:
+            JobScheduler: An instance of JobScheduler.
+        """
+        batching = config.get("batching") or {}
+        scheduling = config.get("scheduling") or {}
+        return cls(workers=config.get("concurrent_workers_async") or 1,
+                   max_batch=(batching.get("max_batch") or 8) if batching.get("enabled") else 1,
+                   window=batching.get("window") if batching.get("window") is not None else 2.0,
+                   max_duration=batching.get("max_duration") or 60.0,
+                   tenant_key=scheduling.get("tenant_key", "reciever"),
+                   weights=scheduling.get("weights"),
+                   max_running_per_tenant=scheduling.get("max_running_per_tenant"),
+                   max_queue_depth=scheduling.get("max_queue_depth"),
+                   max_wait=scheduling.get("max_wait"),
+                   job_timeout=scheduling.get("job_timeout"),
+                   isolation=scheduling.get("isolation") or "thread",
+                   setup={"advanced": config, "scraibe_params": scraibe_params or {}})
+
+    def __repr__(self) -> str:
+        return (f"JobScheduler(workers={self.workers}, max_batch={self.max_batch}, "
+                f"tenant_key={self.tenant_key}, isolation={self.isolation}, tenants={len(self._queues)}, running={self._running})")
@@ -0,0 +1,318 @@
+"""
+shutdown.py
+
+This module drains the app on SIGTERM, so rolling deploys neither waste compute nor lose jobs.
+
+On SIGTERM new submissions are refused and the status endpoint reports the app as not ready, so
+load balancers stop sending users. The signal handler only sets this flag, the drain runs in a
+thread of its own and stops the server once it is done. The running jobs may finish until
+`timeout` seconds have passed; the ones which are still running then are stopped at their next
+checkpoint, or killed with process isolation. The queued and the stopped jobs are written to a
+journal together with a copy of their media, and the mails which could not be sent are tried
+once more. The stopped jobs get `grace` more seconds to reach their checkpoint before the server
+stops. A journaled job which still finishes meanwhile, e.g. because it was past its last
+checkpoint, is removed from the journal again, so it is not run and mailed twice. On
+the next start the journaled jobs are queued again under their old ids, so jobs with
+checkpoints resume at their first unfinished file.
+
+Layout of the journal directory:
+    <job id>/job.json       The parameters of the job.
+    <job id>/media/<i>/     A copy of the i-th media file of the job.
+
+Classes:
+    JobJournal: Keeps the unfinished jobs of a stopped app for the next start.
+    GracefulShutdown: Drains the app on SIGTERM and restores the journaled jobs on start.
+"""
+import os
+import json
+import shutil
+import signal
+import warnings
+from time import time, sleep
+from threading import Event, Thread
+from _thread import interrupt_main
+from uuid import uuid4
+from typing import Any, Dict, List, Optional
+
+import scraibe_webui.global_var as gv
+from .mail import MailService
+from .janitor import get_upload_folder
+
+JOURNAL_FIELDS = ("job_id", "submitted_at", "reciever", "task", "num_speakers", "translate", "language",
+                  "error_format_options", "transcript_format_options")
+
+
+class JobJournal:
+    """
+    Keeps the unfinished jobs of a stopped app for the next start.
+
+    Attributes:
+        path (str): The journal directory.
+    """
+    def __init__(self, path: str = "pending_jobs") -> None:
+        """
+        Initializes the JobJournal.
+
+        Args:
+            path (str, optional): The journal directory. Defaults to "pending_jobs".
+        """
+        self.path = os.path.abspath(path)
+
+    def save(self, job: Dict[str, Any]) -> bool:
+        """Write a job and a copy of its media to the journal.
+
+        Args:
+            job (Dict[str, Any]): A job of the `JobScheduler`.
+
+        Returns:
+            bool: Whether the job was written.
+        """
+        target = os.path.join(self.path, job["job_id"])
+        sources = [job["audio"]] if isinstance(job["audio"], str) else list(job["audio"])
+        try:
+            media = []
+            for i, source in enumerate(sources):
+                # keep the original name, the results are named after the media
+                copy = os.path.join(target, "media", str(i), os.path.basename(source))
+                os.makedirs(os.path.dirname(copy), exist_ok=True)
+                shutil.copyfile(source, copy)
+                media.append(os.path.relpath(copy, target))
+
+            record = {key: job.get(key) for key in JOURNAL_FIELDS}
+            # the model selected in the settings, the other parameters are taken from the config
+            record.update({"media": media, "whisper_model": job["runner"].scraibe_kwargs.get("whisper_model")})
+            tmp = os.path.join(target, f"job.json.{uuid4().hex}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(record, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, os.path.join(target, "job.json"))
+            return True
+        except OSError as e:
+            warnings.warn(f"Could not keep job {job['job_id']} for the next start: {e}")
+            shutil.rmtree(target, ignore_errors=True)
+            return False
+
+    def discard(self, job_id: str) -> None:
+        """Remove a job from the journal.
+
+        Args:
+            job_id (str): The id of the job.
+        """
+        shutil.rmtree(os.path.join(self.path, job_id), ignore_errors=True)
+
+    def restore(self, folder: str) -> List[Dict[str, Any]]:
+        """Move the journaled jobs out of the journal.
+
+        Args:
+            folder (str): The directory the media is moved to, in a directory named after the job id.
+
+        Returns:
+            List[Dict[str, Any]]: The jobs in the order they were submitted, with the paths of
+                                  their media in `audio`.
+        """
+        if not os.path.isdir(self.path):
+            return []
+
+        records = []
+        for job_id in os.listdir(self.path):
+            source = os.path.join(self.path, job_id)
+            try:
+                with open(os.path.join(source, "job.json"), "r", encoding="utf-8") as f:
+                    record = json.load(f)
+            except (OSError, ValueError) as e:
+                warnings.warn(f"Could not restore job {job_id}: {e}")
+                continue
+
+            target = os.path.join(folder, job_id)
+            shutil.rmtree(target, ignore_errors=True)
+            os.makedirs(folder, exist_ok=True)
+            shutil.move(os.path.join(source, "media"), target)
+            media = [os.path.join(target, os.path.relpath(path, "media")) for path in record.pop("media")]
+            record["audio"] = media[0] if len(media) == 1 else media
+            records.append(record)
+            shutil.rmtree(source, ignore_errors=True)
+        return sorted(records, key=lambda record: record.get("submitted_at") or 0)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'JobJournal':
+        """Initialize the JobJournal from a configuration dictionary.
+
+        Args:
+            config (dict): The `advanced.shutdown` configuration section.
+
+        Returns:
+            JobJournal: An instance of JobJournal.
+        """
+        return cls(path=config.get("path") or "pending_jobs")
+
+    def __repr__(self) -> str:
+        return f"JobJournal(path={self.path})"
+
+
+class GracefulShutdown:
+    """
+    Drains the app on SIGTERM and restores the journaled jobs on start.
+
+    Attributes:
+        timeout (float): Seconds the running jobs may take after SIGTERM.
+        grace (float): Seconds the stopped jobs may take to reach their next checkpoint.
+        journal (JobJournal): The journal the unfinished jobs are written to.
+        mail_service_params (Dict[str, Any]): The mail configuration, used to flush the outbox.
+    """
+    def __init__(self, timeout: float = 300, journal: Optional[JobJournal] = None,
+                 mail_service_params: Optional[Dict[str, Any]] = None, grace: float = 30) -> None:
+        """
+        Initializes the GracefulShutdown.
+
+        Args:
+            timeout (float, optional): Seconds the running jobs may take after SIGTERM. Defaults to 300.
+            grace (float, optional): Seconds the stopped jobs may take to reach their next checkpoint
+                                     after the timeout. Defaults to 30.
+            journal (JobJournal, optional): The journal of the unfinished jobs. Defaults to `JobJournal()`.
+            mail_service_params (dict, optional): The mail configuration. Defaults to None.
+        """
+        self.timeout = timeout
+        self.grace = grace
+        self.journal = journal or JobJournal()
+        self.mail_service_params = mail_service_params or {}
+        self._thread = None
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Refuse new jobs, let the running ones finish until the timeout and journal the rest.
+
+        Returns once the stopped jobs reached their next checkpoint or finished, at most `grace`
+        seconds after the timeout, so the finished ones are removed from the journal again.
+
+        Returns:
+            List[Dict[str, Any]]: The journaled jobs.
+        """
+        gv.DRAINING = True
+        deadline = time() + self.timeout
+
+        unfinished = gv.SCHEDULER.drain(self.timeout) if gv.SCHEDULER is not None else []
+
+        saved = [job for job in unfinished if self.journal.save(job)]
+        stopped = {job["job_id"]: Event() for job in saved if "started_at" in job}
+
+        def forget(job: Dict[str, Any]) -> None:
+            try:
+                self._forget_finished(job)
+            finally:
+                stopped[job["job_id"]].set()
+
+        for job in saved:
+            if job["job_id"] in stopped:
+                # stopped jobs are only cancelled at their next checkpoint and may still finish
+                gv.SCHEDULER.when_done(job, forget)
+
+        # jobs of the simple interface may use the rest of the timeout, stopped jobs get the grace period
+        deadline = max(deadline, time() + self.grace) if stopped else deadline
+        for done in stopped.values():
+            done.wait(max(deadline - time(), 0))
+        while gv.ACTIVE_WORKERS > 0 and time() < deadline:
+            sleep(0.5)
+        if not all(done.is_set() for done in stopped.values()):
+            warnings.warn("Stopped jobs did not reach their next checkpoint in time, they stay in the journal.")
+        if saved:
+            print(f"Kept {len(saved)} unfinished jobs in {self.journal.path} for the next start.")
+
+        remaining = MailService.from_config(self.mail_service_params).flush_outbox()
+        if remaining:
+            warnings.warn(f"{remaining} mails could not be sent and stay in the outbox.")
+        return saved
+
+    def _forget_finished(self, job: Dict[str, Any]) -> None:
+        """Remove a journaled job and its followers from the journal unless it was stopped to be run again."""
+        if getattr(job.get("error"), "requeue", False):
+            return
+        for finished in [job, *job.get("followers", [])]:
+            self.journal.discard(finished["job_id"])
+
+    def restore(self, scraibe_params: Dict[str, Any], threads_per_model: Optional[int] = None) -> int:
+        """Queue the journaled jobs again and send the mails left in the outbox.
+
+        The restored jobs skip the queue limits of the scheduler. They were accepted under the
+        same limits before the restart, and a job refused now would be lost without its
+        reciever being told.
+
+        Args:
+            scraibe_params (dict): The parameters used to load the models.
+            threads_per_model (int, optional): The number of torch threads of a model. Defaults to None.
+
+        Returns:
+            int: The number of restored jobs.
+        """
+        from .background import BackgroundThread
+
+        MailService.from_config(self.mail_service_params).flush_outbox()
+        if gv.SCHEDULER is None:
+            return 0
+
+        records = self.journal.restore(os.path.join(get_upload_folder(), "restored"))
+        for record in records:
+            scraibe_kwargs = {**scraibe_params, "whisper_model": record.get("whisper_model") or scraibe_params.get("whisper_model")}
+            gv.SCHEDULER.submit(BackgroundThread(self.mail_service_params, scraibe_kwargs, threads_per_model),
+                                audio=record["audio"],
+                                reciever=record["reciever"],
+                                task=record["task"],
+                                num_speakers=record.get("num_speakers"),
+                                translate=record.get("translate", False),
+                                language=record.get("language"),
+                                error_format_options=record.get("error_format_options"),
+                                transcript_format_options=record.get("transcript_format_options"),
+                                job_id=record["job_id"],
+                                submitted_at=record.get("submitted_at"),
+                                check_limits=False)
+            gv.NUMBER_OF_QUEUE += 1
+        if records:
+            print(f"Restored {len(records)} unfinished jobs from {self.journal.path}.")
+        return len(records)
+
+    def _drain_and_stop(self) -> None:
+        try:
+            self.drain()
+        finally:
+            # raises KeyboardInterrupt in the main thread, which closes the Gradio server
+            interrupt_main()
+
+    def __call__(self, signum: int, frame: Any) -> None:
+        """Signal handler: refuse new jobs and drain in the background, the server stops once the drain is done."""
+        gv.DRAINING = True
+        if self._thread is not None:
+            return
+        print("Received SIGTERM, draining the running jobs.")
+        # the main thread keeps serving the status endpoint and the cancel links meanwhile
+        self._thread = Thread(target=self._drain_and_stop, name="scraibe-drain", daemon=True)
+        self._thread.start()
+
+    def install(self) -> 'GracefulShutdown':
+        """Drain the app on SIGTERM.
+
+        Returns:
+            GracefulShutdown: The handler itself.
+        """
+        try:
+            signal.signal(signal.SIGTERM, self)
+        except ValueError:
+            warnings.warn("Signal handlers can only be installed in the main thread.")
+        return self
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], mail_service_params: Optional[Dict[str, Any]] = None) -> 'GracefulShutdown':
+        """Initialize the GracefulShutdown from a configuration dictionary.
+
+        Args:
+            config (dict): The `advanced.shutdown` configuration section.
+            mail_service_params (dict, optional): The mail configuration. Defaults to None.
+
+        Returns:
+            GracefulShutdown: An instance of GracefulShutdown.
+        """
+        return cls(timeout=config.get("timeout") if config.get("timeout") is not None else 300,
+                   journal=JobJournal.from_config(config),
+                   mail_service_params=mail_service_params,
+                   grace=config.get("grace") if config.get("grace") is not None else 30)
+
+    def __repr__(self) -> str:
+        return f"GracefulShutdown(timeout={self.timeout}, grace={self.grace}, journal={self.journal})"
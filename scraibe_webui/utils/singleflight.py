@@ -0,0 +1,166 @@
+"""
+singleflight.py
+
+This module runs identical concurrent computations only once.
+
+When several users upload the same file at nearly the same time, e.g. the recording of a lecture
+shared in a class, every request would transcribe it again. Calls are therefore keyed by the
+hash of the content of their media and their parameters. A call with the key of a computation
+which is still running waits for it and gets its result instead of running the model again.
+Nothing is kept once the computation is done, so this is not a cache: only requests which
+overlap in time share a result.
+
+The async queue additionally attaches a job to an identical queued or running job, see
+`JobScheduler.submit`, so identical jobs do not even wait for a worker of their own.
+
+Classes:
+    SingleFlight: Runs the calls with the same key only once at a time.
+
+Functions:
+    flight_key: Get the key of a computation from its media and parameters.
+    configure: Configure single-flight from the `advanced.single_flight` configuration.
+    get_single_flight: Get the active instance, None if single-flight is disabled.
+    run_once: Run a computation or wait for the identical one in flight.
+"""
+import json
+import hashlib
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, Union
+
+from .media import media_hash
+from .metrics import COALESCED_TOTAL
+from .cancel import JobCancelled
+
+_single_flight = None
+
+
+def flight_key(sources: Union[str, Iterable[str]], **params: Any) -> str:
+    """Get the key of a computation from its media and parameters.
+
+    Args:
+        sources (Union[str, Iterable[str]]): The media of the computation.
+        **params (Any): The parameters which change the result, e.g. the task, model and language.
+
+    Returns:
+        str: The key.
+    """
+    sources = [sources] if isinstance(sources, str) else list(sources)
+    content = json.dumps({"media": [media_hash(source) for source in sources], **params},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self) -> None:
+        self.done = Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Runs the calls with the same key only once at a time.
+
+    Attributes:
+        in_flight (int): The number of keys which are currently computed.
+    """
+    def __init__(self) -> None:
+        """Initializes the SingleFlight."""
+        self._flights = {} # key -> running computation
+        self._lock = Lock()
+
+    @property
+    def in_flight(self) -> int:
+        """The number of keys which are currently computed."""
+        with self._lock:
+            return len(self._flights)
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Run `fn`, or wait for the running call with the same key and return its result.
+
+        A waiting call raises the error of the computation it waited for. If that computation
+        was cancelled, the waiting call runs `fn` itself, the cancellation was not its own.
+
+        Args:
+            key (str): The key of the computation, see `flight_key`.
+            fn (Callable[[], Any]): The computation.
+
+        Returns:
+            Tuple[Any, bool]: The result of the computation and whether this call ran it.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                else:
+                    flight.waiters += 1
+
+            if leader:
+                break
+
+            COALESCED_TOTAL.inc(level="call")
+            flight.done.wait()
+            if isinstance(flight.error, JobCancelled):
+                continue
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, False
+
+        try:
+            flight.result = fn()
+            return flight.result, True
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def __repr__(self) -> str:
+        return f"SingleFlight(in_flight={self.in_flight})"
+
+
+def configure(config: Optional[Dict[str, Any]]) -> Optional[SingleFlight]:
+    """Configure single-flight from the `advanced.single_flight` configuration.
+
+    Args:
+        config (Optional[Dict[str, Any]]): The `advanced.single_flight` configuration section.
+
+    Returns:
+        Optional[SingleFlight]: The active instance, None if single-flight is disabled.
+    """
+    global _single_flight
+    _single_flight = SingleFlight() if (config or {}).get("enabled") else None
+    return _single_flight
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Get the active instance.
+
+    Returns:
+        Optional[SingleFlight]: The active instance, None if single-flight is disabled.
+    """
+    return _single_flight
+
+
+def run_once(sources: Union[str, Iterable[str]], fn: Callable[[], Any], **params: Any) -> Tuple[Any, bool]:
+    """Run a computation or wait for the identical one in flight. Runs `fn` directly if single-flight is disabled.
+
+    Args:
+        sources (Union[str, Iterable[str]]): The media of the computation.
+        fn (Callable[[], Any]): The computation.
+        **params (Any): The parameters which change the result, see `flight_key`. The model must
+                        be the one which really runs, i.e. after model routing.
+
+    Returns:
+        Tuple[Any, bool]: The result of the computation and whether this call ran it, False if
+            it was served by the identical computation in flight.
+    """
+    single_flight = _single_flight
+    if single_flight is None:
+        return fn(), True
+    return single_flight.do(flight_key(sources, **params), fn)
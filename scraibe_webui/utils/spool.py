@@ -0,0 +1,238 @@
+"""
+spool.py
+
+This module provides a filesystem spool which decouples the async interface from the workers.
+
+The async interface writes each job, together with a copy of its media, into a spool directory.
+Workers started with `scraibe-webui worker` claim jobs from the spool and run them. Because the
+spool only relies on atomic renames within one directory tree, it can live on a shared volume
+(e.g. NFS) and workers on several machines can claim jobs from it without an external broker.
+
+Layout of the spool directory:
+    incoming/   Job records which are being written.
+    pending/    Job records waiting for a worker, processed in order of their file names.
+    running/    Job records claimed by a worker. The modification time is the heartbeat.
+    done/       Job records of finished jobs.
+    failed/     Job records of failed jobs.
+    media/      The media of every job in a directory named after the job id.
+
+Classes:
+    Spool: A job queue in a directory shared by the interface and the workers.
+"""
+import os
+import json
+import shutil
+from time import time
+from uuid import uuid4
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+SPOOL_DIRS = ("incoming", "pending", "running", "done", "failed", "media")
+
+
+class Spool:
+    """
+    A job queue in a directory shared by the interface and the workers.
+
+    A job is claimed by renaming its record from `pending/` to `running/`. The rename is
+    atomic, so exactly one worker wins when several try to claim the same job.
+
+    Attributes:
+        path (str): The spool directory.
+        stale_after (float): Seconds without heartbeat after which a running job is requeued.
+        keep_finished (bool): Whether records of finished jobs are kept in `done/` and `failed/`.
+    """
+    def __init__(self, path: str = "spool", stale_after: Optional[float] = 600,
+                 keep_finished: bool = True) -> None:
+        """
+        Initializes the Spool and creates its directories.
+
+        Args:
+            path (str, optional): The spool directory. Defaults to "spool".
+            stale_after (float, optional): Seconds without heartbeat after which a running job
+                                           is requeued. None disables requeuing. Defaults to 600.
+            keep_finished (bool, optional): Whether records of finished jobs are kept. Defaults to True.
+        """
+        self.path = os.path.abspath(path)
+        self.stale_after = stale_after
+        self.keep_finished = keep_finished
+
+        for name in SPOOL_DIRS:
+            os.makedirs(os.path.join(self.path, name), exist_ok=True)
+
+    def _dir(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @staticmethod
+    def _write(path: str, record: Dict[str, Any]) -> None:
+        tmp = f"{path}.{uuid4().hex}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def enqueue(self, sources: Union[str, Iterable[str]], **job: Any) -> Dict[str, Any]:
+        """Copy the media into the spool and add a pending job.
+
+        Args:
+            sources (Union[str, Iterable[str]]): The media of the job.
+            **job (Any): The parameters of the job, e.g. `reciever`, `task`, `num_speakers`,
+                         `translate`, `language` and the mail format options.
+
+        Returns:
+            Dict[str, Any]: The job record.
+        """
+        job_id = uuid4().hex
+        submitted_at = time()
+        media_dir = os.path.join(self._dir("media"), job_id)
+        os.makedirs(media_dir)
+
+        sources = [sources] if isinstance(sources, str) else list(sources)
+        media = []
+        for i, source in enumerate(sources):
+            # keep the original name, the results are named after the media
+            target = os.path.join(media_dir, str(i), os.path.basename(source))
+            os.makedirs(os.path.dirname(target))
+            shutil.copyfile(source, target)
+            # relative to the spool, the volume may be mounted at different paths
+            media.append(os.path.relpath(target, self.path))
+
+        record = {"job_id": job_id, "submitted_at": submitted_at, "media": media, **job}
+        name = f"{int(submitted_at * 1000):015d}-{job_id}.json"
+
+        incoming = os.path.join(self._dir("incoming"), name)
+        self._write(incoming, record)
+        os.rename(incoming, os.path.join(self._dir("pending"), name))
+        return record
+
+    def claim(self, worker_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Claim the oldest pending job.
+
+        Args:
+            worker_id (str, optional): Stored in the job record to identify the worker.
+
+        Returns:
+            Optional[Dict[str, Any]]: The job record or None if no job is pending.
+        """
+        for name in sorted(os.listdir(self._dir("pending"))):
+            if not name.endswith(".json"):
+                continue
+            running = os.path.join(self._dir("running"), name)
+            try:
+                os.rename(os.path.join(self._dir("pending"), name), running)
+            except FileNotFoundError:
+                continue  # claimed by another worker
+
+            with open(running, "r", encoding="utf-8") as f:
+                record = json.load(f)
+            record.update({"claimed_by": worker_id, "claimed_at": time(),
+                           "attempts": record.get("attempts", 0) + 1, "_name": name})
+            self._write(running, record)
+            return record
+        return None
+
+    def media(self, record: Dict[str, Any]) -> List[str]:
+        """Get the paths of the media of a job on this machine.
+
+        Args:
+            record (Dict[str, Any]): The job record.
+
+        Returns:
+            List[str]: The absolute paths of the media.
+        """
+        return [os.path.join(self.path, path) for path in record["media"]]
+
+    def heartbeat(self, record: Dict[str, Any]) -> None:
+        """Mark a claimed job as alive.
+
+        Args:
+            record (Dict[str, Any]): The job record returned by `claim`.
+        """
+        try:
+            os.utime(os.path.join(self._dir("running"), record["_name"]))
+        except FileNotFoundError:
+            pass
+
+    def finish(self, record: Dict[str, Any], status: str = "done", **info: Any) -> None:
+        """Move a claimed job to `done/` or `failed/` and remove its media.
+
+        Args:
+            record (Dict[str, Any]): The job record returned by `claim`.
+            status (str, optional): Either "done" or "failed". Defaults to "done".
+            **info (Any): Additional information stored in the record, e.g. the error.
+        """
+        if status not in ("done", "failed"):
+            raise ValueError(f"Invalid status: {status}. Must be 'done' or 'failed'.")
+
+        running = os.path.join(self._dir("running"), record["_name"])
+        if self.keep_finished:
+            self._write(running, {**record, **info, "status": status, "finished_at": time()})
+            os.replace(running, os.path.join(self._dir(status), record["_name"]))
+        elif os.path.exists(running):
+            os.remove(running)
+
+        shutil.rmtree(os.path.join(self._dir("media"), record["job_id"]), ignore_errors=True)
+
+    def requeue_stale(self) -> List[str]:
+        """Move running jobs without heartbeat for `stale_after` seconds back to `pending/`.
+
+        Returns:
+            List[str]: The ids of the requeued jobs.
+        """
+        if self.stale_after is None:
+            return []
+
+        requeued = []
+        now = time()
+        for name in os.listdir(self._dir("running")):
+            path = os.path.join(self._dir("running"), name)
+            try:
+                if not name.endswith(".json") or now - os.path.getmtime(path) < self.stale_after:
+                    continue
+                os.rename(path, os.path.join(self._dir("pending"), name))
+            except FileNotFoundError:
+                continue
+            requeued.append(name[:-5].split("-", 1)[-1])
+        return requeued
+
+    def depth(self) -> int:
+        """Get the number of pending and running jobs.
+
+        Returns:
+            int: The number of pending and running jobs.
+        """
+        return sum(1 for d in ("pending", "running")
+                   for name in os.listdir(self._dir(d)) if name.endswith(".json"))
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Get the position of a job in the queue, counting running jobs first.
+
+        Args:
+            job_id (str): The id of the job.
+
+        Returns:
+            Optional[int]: The 1-based position or None if the job is not pending.
+        """
+        running = sum(1 for name in os.listdir(self._dir("running")) if name.endswith(".json"))
+        pending = sorted(name for name in os.listdir(self._dir("pending")) if name.endswith(".json"))
+        for i, name in enumerate(pending):
+            if name.endswith(f"-{job_id}.json"):
+                return running + i + 1
+        return None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'Spool':
+        """Initialize the Spool from a configuration dictionary.
+
+        Args:
+            config (dict): The `advanced.spool` configuration section.
+
+        Returns:
+            Spool: An instance of Spool.
+        """
+        return cls(path=config.get("path") or "spool",
+                   stale_after=config.get("stale_after", 600),
+                   keep_finished=config.get("keep_finished", True))
+
+    def __repr__(self) -> str:
+        return f"Spool(path={self.path}, stale_after={self.stale_after})"
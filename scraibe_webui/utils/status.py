@@ -0,0 +1,127 @@
+"""
+status.py
+
+This module keeps track of the load of a WebUI instance and exposes it as a JSON endpoint.
+
+The endpoint is meant to be polled by load balancers to route requests to the replica with a
+warm model and the least load. It only reads counters which are kept up to date by the jobs
+themselves and is therefore cheap enough to be polled every second.
+
+Functions:
+    track_job: Context manager counting a running job and recording its real-time factor.
+    get_status: Get the current readiness and load report.
+    status_route: Create the starlette route serving the load report.
+"""
+from time import time
+from datetime import datetime, timezone
+from uuid import uuid4
+from threading import Lock
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Optional, Union
+
+from starlette.routing import Route
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+import scraibe_webui.global_var as gv
+from .media import get_total_duration
+from .metrics import JOB_SECONDS, JOBS_TOTAL, queue_depth
+from .eta import get_rtf_store
+from .tracing import trace_job
+from .profiling import profile_job
+
+_status_lock = Lock()
+
+
+@contextmanager
+def track_job(source: Union[str, Iterable[str], None], interface: str = "simple",
+              job_id: Optional[str] = None, **attributes: Any):
+    """Count a running job and record its real-time factor once it finished successfully.
+
+    The real-time factor is the processing time divided by the duration of the media. It is
+    recorded per model and task in the `RTFStore` used for the estimated completion times.
+    If tracing or profiling is enabled the job is traced or profiled as well.
+
+    Args:
+        source (Union[str, Iterable[str], None]): The media processed by the job.
+        interface (str, optional): The interface which submitted the job. Defaults to "simple".
+        job_id (str, optional): The id of the job used in the trace. Defaults to a random id.
+        **attributes (Any): Additional information stored with the trace record.
+
+    Yields:
+        Dict[str, Any]: The attributes of the job. The job sets `model` once its model is known.
+    """
+    duration = get_total_duration(source)
+
+    with _status_lock:
+        gv.ACTIVE_WORKERS += 1
+    start = time()
+    job_id = job_id or uuid4().hex
+    status = "error"
+    try:
+        with trace_job(job_id, media_duration=duration, interface=interface, **attributes), \
+             profile_job(job_id, task=attributes.get("task"), media_duration=duration):
+            yield attributes
+        status = "success"
+        # a resumed job skipped the files of its checkpoint and a coalesced one waited for an
+        # identical job, their real-time factors are too low
+        if duration and not attributes.get("resumed") and not attributes.get("coalesced"):
+            rtf = (time() - start) / duration
+            gv.RECENT_RTF.append(rtf)
+            get_rtf_store().record(attributes.get("model"), attributes.get("task"), rtf)
+    finally:
+        with _status_lock:
+            gv.ACTIVE_WORKERS -= 1
+        JOB_SECONDS.observe(time() - start, interface=interface)
+        JOBS_TOTAL.inc(interface=interface, status=status)
+
+
+def get_status() -> Dict[str, Any]:
+    """Get the current readiness and load report.
+
+    Returns:
+        Dict[str, Any]: The load report with the keys
+            - ready: Whether the models are preloaded and warmed up and the app is not shutting down.
+            - preload_failed: Whether preloading the models failed, so the app never becomes ready.
+            - models_loaded: Names of the Whisper models currently held in memory.
+            - queue_depth: Number of async jobs which are queued or running.
+            - active_workers: Number of jobs currently running.
+            - max_workers: Number of concurrent workers of the async interface.
+            - rtf: Mean real-time factor of the recently finished jobs.
+            - estimated_completion: ISO time at which the queued and running async jobs are
+              estimated to be done, None without the in-process async queue.
+    """
+    from .wrapper import ScraibeWrapper
+
+    recent_rtf = list(gv.RECENT_RTF)
+
+    return {
+        "ready": gv.READY and not gv.DRAINING,
+        "preload_failed": gv.PRELOAD_FAILED,
+        "models_loaded": ScraibeWrapper.get_loaded_models(),
+        "queue_depth": queue_depth(),
+        "active_workers": gv.ACTIVE_WORKERS,
+        "max_workers": gv.MAX_CONCURRENT_MODELS,
+        "rtf": sum(recent_rtf) / len(recent_rtf) if recent_rtf else None,
+        "estimated_completion": (datetime.fromtimestamp(time() + gv.SCHEDULER.backlog(), timezone.utc).isoformat()
+                                 if gv.SCHEDULER is not None else None),
+    }
+
+
+def _status_endpoint(request: Request) -> JSONResponse:
+    # a plain function runs in the threadpool, the locks of the scheduler never block the event loop
+    status = get_status()
+    # load balancers only send traffic to replicas which answer with 200
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+def status_route(path: str = "/status") -> Route:
+    """Create the starlette route serving the load report.
+
+    Args:
+        path (str, optional): The path of the endpoint. Defaults to "/status".
+
+    Returns:
+        Route: The route which can be added to the Gradio app.
+    """
+    return Route(path, _status_endpoint, methods=["GET"])
@@ -0,0 +1,412 @@
+"""
+stub.py
+
+This module provides stand-ins for the heavy external parts of the WebUI, so the overhead of the
+WebUI itself can be measured without Whisper or pyannote dominating the results.
+
+`StubScraibe` mimics the parts of `scraibe.Scraibe` used by `ScraibeWrapper`. It returns
+deterministic transcripts and sleeps for a configurable latency instead of running a model.
+`SMTPSink` is a minimal local SMTP server which accepts and stores every message.
+
+Classes:
+    StubWaveform: A waveform which only knows its length.
+    StubAudio: Mimics the `AudioProcessor` returned by `Scraibe.get_audio_file`.
+    StubTranscriber: Mimics a Whisper transcriber.
+    StubDiariser: Mimics the pyannote diariser.
+    StubScraibe: Mimics `scraibe.Scraibe`.
+    SMTPSink: A local SMTP server which stores all received messages.
+
+Functions:
+    use_stub_backend: Replace the Scraibe model of `ScraibeWrapper` by `StubScraibe`.
+"""
+import os
+import wave
+import socketserver
+from time import sleep, time
+from threading import Thread, Lock
+from typing import Any, Dict, List, Optional
+
+from .media import get_media_duration
+
+STUB_SAMPLE_RATE = 16000
+
+_WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit",
+          "sed", "do", "eiusmod", "tempor", "incididunt", "ut", "labore", "et", "dolore")
+
+
+class StubWaveform:
+    """A waveform which only knows its length. Supports the tensor calls used by `ScraibeWrapper`."""
+    __slots__ = ("length",)
+
+    def __init__(self, length: int) -> None:
+        self.length = int(length)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: slice) -> 'StubWaveform':
+        return StubWaveform(len(range(*index.indices(self.length))))
+
+    def reshape(self, *shape: int) -> 'StubWaveform':
+        return self
+
+    def to(self, device: Any) -> 'StubWaveform':
+        return self
+
+
+class StubAudio:
+    """
+    Mimics the `AudioProcessor` returned by `Scraibe.get_audio_file`.
+
+    Attributes:
+        waveform (StubWaveform): The waveform of the audio.
+        sr (int): The sample rate.
+    """
+    def __init__(self, duration: float, sr: int = STUB_SAMPLE_RATE) -> None:
+        self.waveform = StubWaveform(duration * sr)
+        self.sr = sr
+
+    def cut(self, start: float, end: float) -> StubWaveform:
+        """Cut a segment out of the audio.
+
+        Args:
+            start (float): The start of the segment in seconds.
+            end (float): The end of the segment in seconds.
+
+        Returns:
+            StubWaveform: The waveform of the segment.
+        """
+        return StubWaveform((end - start) * self.sr)
+
+
+def _simulate(latency: float, rtf: float, duration: float) -> None:
+    delay = latency + rtf * duration
+    if delay > 0:
+        sleep(delay)
+
+
+def _text(duration: float) -> str:
+    return " ".join(_WORDS[i % len(_WORDS)] for i in range(max(int(duration), 1)))
+
+
+class StubTranscriber:
+    """
+    Mimics a Whisper transcriber.
+
+    The transcript is a fixed text with one word per second of audio.
+
+    Attributes:
+        model_name (str): The name reported as loaded model.
+        latency (float): Fixed seconds per call.
+        rtf (float): Additional seconds per second of audio.
+    """
+    def __init__(self, model_name: str = "stub", latency: float = 0.0, rtf: float = 0.0,
+                 sr: int = STUB_SAMPLE_RATE) -> None:
+        self.model_name = model_name
+        self.latency = latency
+        self.rtf = rtf
+        self.sr = sr
+
+    def transcribe(self, audio: StubWaveform, **kwargs: Any) -> str:
+        """Return a deterministic transcript after the simulated latency.
+
+        Args:
+            audio (StubWaveform): The audio to transcribe.
+            **kwargs (Any): Ignored.
+
+        Returns:
+            str: The transcript.
+        """
+        duration = len(audio) / self.sr
+        _simulate(self.latency, self.rtf, duration)
+        return _text(duration)
+
+    def transcribe_batch(self, audios: List[StubWaveform], **kwargs: Any) -> List[str]:
+        """Return the transcripts of several clips after the latency of a single call.
+
+        Args:
+            audios (List[StubWaveform]): The clips to transcribe.
+            **kwargs (Any): Ignored.
+
+        Returns:
+            List[str]: The transcript of every clip.
+        """
+        _simulate(self.latency, self.rtf, sum(len(audio) for audio in audios) / self.sr)
+        return [_text(len(audio) / self.sr) for audio in audios]
+
+    def detect_language(self, audio: StubWaveform) -> str:
+        """Return English after the simulated latency.
+
+        Args:
+            audio (StubWaveform): The sample to detect the language of.
+
+        Returns:
+            str: The language code.
+        """
+        _simulate(self.latency, self.rtf, len(audio) / self.sr)
+        return "en"
+
+    def __repr__(self) -> str:
+        return f"StubTranscriber(model_name={self.model_name}, latency={self.latency}, rtf={self.rtf})"
+
+
+class StubDiariser:
+    """
+    Mimics the pyannote diariser.
+
+    The audio is split into segments of a fixed length which are assigned to the speakers in turn.
+
+    Attributes:
+        latency (float): Fixed seconds per call.
+        rtf (float): Additional seconds per second of audio.
+        segment_length (float): The length of a segment in seconds.
+        num_speakers (int): The number of speakers if not given in the call.
+    """
+    def __init__(self, latency: float = 0.0, rtf: float = 0.0, segment_length: float = 5.0,
+                 num_speakers: int = 2) -> None:
+        self.latency = latency
+        self.rtf = rtf
+        self.segment_length = segment_length
+        self.num_speakers = num_speakers
+
+    def diarization(self, audio: Dict[str, Any], num_speakers: Optional[int] = None,
+                    **kwargs: Any) -> Dict[str, List]:
+        """Return deterministic segments after the simulated latency.
+
+        Args:
+            audio (Dict[str, Any]): The waveform and sample rate of the audio.
+            num_speakers (int, optional): The number of speakers. Defaults to `self.num_speakers`.
+            **kwargs (Any): Ignored.
+
+        Returns:
+            Dict[str, List]: The segments and their speakers.
+        """
+        duration = len(audio["waveform"]) / audio["sample_rate"]
+        _simulate(self.latency, self.rtf, duration)
+
+        num_speakers = num_speakers or self.num_speakers
+        segments, speakers = [], []
+        start = 0.0
+        while start < duration:
+            end = min(start + self.segment_length, duration)
+            segments.append([round(start, 3), round(end, 3)])
+            speakers.append(f"SPEAKER_{len(speakers) % num_speakers:02d}")
+            start = end
+        return {"segments": segments, "speakers": speakers}
+
+
+class StubScraibe:
+    """
+    Mimics `scraibe.Scraibe` with a deterministic backend of configurable latency.
+
+    Attributes:
+        transcriber (StubTranscriber): The stub transcriber.
+        diariser (StubDiariser): The stub diariser.
+        device (str): The device reported to the wrapper.
+        default_duration (float): Duration assumed for media whose duration cannot be read.
+        load_latency (float): Seconds spent when loading the model.
+    """
+    def __init__(self,
+                 whisper_model: Optional[str] = None,
+                 whisper_type: Optional[str] = None,
+                 dia_model: Optional[str] = None,
+                 latency: float = 0.0,
+                 rtf: float = 0.0,
+                 load_latency: float = 0.0,
+                 default_duration: float = 10.0,
+                 device: Optional[str] = "cpu",
+                 **kwargs: Any) -> None:
+        """
+        Initializes the StubScraibe. Takes the same arguments as `scraibe.Scraibe`, unknown ones are ignored.
+
+        Args:
+            whisper_model (str, optional): Reported as name of the loaded model. Defaults to "stub".
+            whisper_type (str, optional): Ignored.
+            dia_model (str, optional): Ignored.
+            latency (float, optional): Fixed seconds per transcription or diarisation call. Defaults to 0.0.
+            rtf (float, optional): Additional seconds per second of audio. Defaults to 0.0.
+            load_latency (float, optional): Seconds spent when loading the model. Defaults to 0.0.
+            default_duration (float, optional): Duration assumed for media whose duration cannot be read.
+                                                Defaults to 10.0.
+            device (str, optional): The device reported to the wrapper. Defaults to "cpu".
+        """
+        if load_latency > 0:
+            sleep(load_latency)
+        self.transcriber = StubTranscriber(whisper_model or "stub", latency, rtf)
+        self.diariser = StubDiariser(latency, rtf)
+        self.device = device or "cpu"
+        self.default_duration = default_duration
+        self.load_latency = load_latency
+
+    def get_audio_file(self, audio_file: str) -> StubAudio:
+        """Create stub audio with the duration of the media file.
+
+        Args:
+            audio_file (str): The path to the media file.
+
+        Returns:
+            StubAudio: The stub audio.
+        """
+        duration = None
+        if audio_file.lower().endswith(".wav"):
+            try:
+                with wave.open(audio_file, "rb") as f:
+                    duration = f.getnframes() / f.getframerate()
+            except (wave.Error, EOFError, OSError):
+                duration = None
+        if duration is None and os.path.exists(audio_file):
+            duration = get_media_duration(audio_file)
+        return StubAudio(duration or self.default_duration)
+
+    def autotranscribe(self, audio_file: str, **kwargs: Any) -> str:
+        """Mimics `Scraibe.autotranscribe`, used by the warm-up."""
+        audio = self.get_audio_file(audio_file)
+        self.diariser.diarization({"waveform": audio.waveform, "sample_rate": audio.sr}, **kwargs)
+        return self.transcriber.transcribe(audio.waveform, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"StubScraibe(transcriber={self.transcriber}, device={self.device})"
+
+
+def use_stub_backend(**stub_kwargs: Any) -> type:
+    """Replace the Scraibe model of `ScraibeWrapper` by `StubScraibe`.
+
+    Args:
+        **stub_kwargs (Any): Keyword arguments of `StubScraibe` like `latency` or `rtf`. They take
+                             precedence over the `scraibe_params` of the configuration.
+
+    Returns:
+        type: The previous model class, which can be used to restore the real backend.
+    """
+    from .wrapper import ScraibeWrapper
+
+    previous = ScraibeWrapper.model_class
+
+    def _factory(**config: Any) -> StubScraibe:
+        return StubScraibe(**{**config, **stub_kwargs})
+
+    ScraibeWrapper.model_class = _factory
+    return previous
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for `smtplib` to deliver a message."""
+
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self) -> None:
+        sink = self.server.sink
+        mail_from, rcpt_to = None, []
+        self.reply("220 scraibe-sink ESMTP")
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+
+            if verb in ("EHLO", "HELO"):
+                self.reply("250-scraibe-sink" if verb == "EHLO" else "250 scraibe-sink")
+                if verb == "EHLO":
+                    self.reply("250 8BITMIME")
+            elif verb == "MAIL":
+                mail_from, rcpt_to = command.partition(":")[2].strip(" <>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                rcpt_to.append(command.partition(":")[2].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data[1:] if data.startswith(b"..") else data)
+                if sink.latency > 0:
+                    sleep(sink.latency)
+                sink.store(mail_from, rcpt_to, b"".join(lines))
+                self.reply("250 OK")
+            elif verb in ("RSET", "NOOP"):
+                if verb == "RSET":
+                    mail_from, rcpt_to = None, []
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class _SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """
+    A local SMTP server which accepts and stores all received messages.
+
+    Use `connection_type: PLAIN` and `context: null` in the mail configuration to send to the sink.
+
+    Attributes:
+        host (str): The address the sink is bound to.
+        port (int): The port the sink is listening on.
+        latency (float): Seconds the sink waits before accepting a message.
+        messages (List[Dict[str, Any]]): The received messages with sender, recipients, data and arrival time.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0) -> None:
+        """
+        Initializes the SMTPSink.
+
+        Args:
+            host (str, optional): The address to bind to. Defaults to "127.0.0.1".
+            port (int, optional): The port to listen on, 0 picks a free port. Defaults to 0.
+            latency (float, optional): Seconds to wait before accepting a message. Defaults to 0.0.
+        """
+        self.latency = latency
+        self.messages = []
+        self._lock = Lock()
+        self._server = _SMTPServer((host, port), _SMTPHandler)
+        self._server.sink = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = None
+
+    def store(self, mail_from: str, rcpt_to: List[str], data: bytes) -> None:
+        """Store a received message."""
+        with self._lock:
+            self.messages.append({"from": mail_from, "to": list(rcpt_to), "data": data, "received_at": time()})
+
+    def start(self) -> 'SMTPSink':
+        """Start serving in a daemon thread."""
+        self._thread = Thread(target=self._server.serve_forever, name="scraibe-smtp-sink", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def mail_config(self, **overrides: Any) -> Dict[str, Any]:
+        """Get a mail configuration which sends to the sink.
+
+        Args:
+            **overrides (Any): Additional mail options.
+
+        Returns:
+            Dict[str, Any]: The mail configuration.
+        """
+        return {"sender_email": "scraibe@localhost", "smtp_server": self.host, "smtp_port": self.port,
+                "sender_password": None, "connection_type": "PLAIN", "context": None, **overrides}
+
+    def __enter__(self) -> 'SMTPSink':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def __repr__(self) -> str:
+        return f"SMTPSink(host={self.host}, port={self.port}, messages={len(self.messages)})"
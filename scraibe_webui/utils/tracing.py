@@ -0,0 +1,246 @@
+"""
+tracing.py
+
+This module writes structured per-job trace records to a rotating JSON lines file.
+
+Each job opens a trace, and every instrumented stage of the job (model loading, decoding,
+diarisation, transcription, result writing, sending mails) opens a span nested in the span
+that is currently active in the same thread. When the job finishes, a single JSON record
+with the job id, the media duration, the real-time factor and the tree of spans is written.
+
+Tracing is disabled by default, in which case opening a span returns immediately.
+
+Classes:
+    Span: A timed section of a job.
+    Tracer: Writes finished traces to a rotating JSON lines file.
+
+Functions:
+    configure: Enable tracing from the `advanced.tracing` configuration.
+    trace_job: Context manager tracing a whole job.
+    span: Context manager tracing a section of a job.
+"""
+import json
+import logging
+from time import time
+from datetime import datetime, timezone
+from threading import local
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, Optional
+
+_local = local()
+_tracer = None
+
+
+class Span:
+    """
+    A timed section of a job.
+
+    Attributes:
+        name (str): The name of the span.
+        attributes (Dict[str, Any]): Additional information about the span.
+        start (float): The start time as unix timestamp.
+        end (float): The end time as unix timestamp.
+        children (List[Span]): The spans nested in this span.
+    """
+    __slots__ = ("name", "attributes", "start", "end", "children")
+
+    def __init__(self, name: str, **attributes: Any) -> None:
+        self.name = name
+        self.attributes = attributes
+        self.start = time()
+        self.end = None
+        self.children = []
+
+    def to_dict(self, origin: float) -> Dict[str, Any]:
+        """Convert the span and its children into a dictionary.
+
+        Args:
+            origin (float): The start of the trace, span start times are relative to it.
+
+        Returns:
+            Dict[str, Any]: The span as dictionary.
+        """
+        out = {"name": self.name,
+               "start": round(self.start - origin, 6),
+               "duration": round((self.end or time()) - self.start, 6)}
+        if self.attributes:
+            out["attributes"] = self.attributes
+        if self.children:
+            out["children"] = [c.to_dict(origin) for c in self.children]
+        return out
+
+
+class Tracer:
+    """
+    Writes finished traces to a rotating JSON lines file.
+
+    Attributes:
+        path (str): The path to the JSON lines file.
+        max_bytes (int): Size at which the file is rotated.
+        backup_count (int): Number of rotated files to keep.
+    """
+    def __init__(self, path: str = "traces.jsonl",
+                 max_bytes: int = 10485760,
+                 backup_count: int = 5) -> None:
+        """
+        Initializes the Tracer.
+
+        Args:
+            path (str, optional): The path to the JSON lines file. Defaults to "traces.jsonl".
+            max_bytes (int, optional): Size at which the file is rotated. Defaults to 10 MiB.
+            backup_count (int, optional): Number of rotated files to keep. Defaults to 5.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+        self.logger = logging.getLogger(f"scraibe_webui.tracing.{path}")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            handler = RotatingFileHandler(path, maxBytes=max_bytes,
+                                          backupCount=backup_count, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger.addHandler(handler)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        """Write a trace record as a single JSON line.
+
+        Args:
+            record (Dict[str, Any]): The trace record.
+        """
+        self.logger.info(json.dumps(record, default=str))
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'Tracer':
+        """Initialize the Tracer from a configuration dictionary.
+
+        Args:
+            config (dict): The `advanced.tracing` configuration section.
+
+        Returns:
+            Tracer: An instance of Tracer.
+        """
+        return cls(path=config.get("path") or "traces.jsonl",
+                   max_bytes=config.get("max_bytes") or 10485760,
+                   backup_count=config.get("backup_count") or 5)
+
+
+def configure(config: Optional[Dict[str, Any]]) -> Optional[Tracer]:
+    """Enable tracing from the `advanced.tracing` configuration.
+
+    Args:
+        config (Optional[Dict[str, Any]]): The `advanced.tracing` configuration section.
+
+    Returns:
+        Optional[Tracer]: The active tracer or None if tracing is disabled.
+    """
+    global _tracer
+    if config and config.get("enabled"):
+        _tracer = Tracer.from_config(config)
+    else:
+        _tracer = None
+    return _tracer
+
+
+def is_enabled() -> bool:
+    """Check if traces are recorded.
+
+    Returns:
+        bool: True if traces are recorded, False otherwise.
+    """
+    return _tracer is not None
+
+
+@contextmanager
+def trace_job(job_id: str, media_duration: Optional[float] = None, **attributes: Any):
+    """Trace a whole job and write its record once it finished.
+
+    Args:
+        job_id (str): The id of the job.
+        media_duration (float, optional): The duration of the processed media in seconds.
+        **attributes (Any): Additional information stored with the record e.g. the task.
+
+    Yields:
+        Optional[Span]: The root span of the job or None if tracing is disabled.
+    """
+    if _tracer is None or getattr(_local, "stack", None):
+        # tracing disabled or already inside a traced job
+        yield None
+        return
+
+    root = Span("job")
+    _local.stack = [root]
+    status, error = "success", None
+    try:
+        yield root
+    except BaseException as e:
+        status, error = "error", repr(e)
+        raise
+    finally:
+        _local.stack = []
+        root.end = time()
+        duration = root.end - root.start
+        _tracer.write({
+            "job_id": job_id,
+            "timestamp": datetime.fromtimestamp(root.start, timezone.utc).isoformat(),
+            "status": status,
+            "error": error,
+            "duration": round(duration, 6),
+            "media_duration": media_duration,
+            "rtf": round(duration / media_duration, 6) if media_duration else None,
+            "attributes": attributes,
+            "spans": [c.to_dict(root.start) for c in root.children],
+        })
+
+
+def open_span(name: str, **attributes: Any) -> Optional[Span]:
+    """Open a span nested in the currently active span of this thread.
+
+    Args:
+        name (str): The name of the span.
+        **attributes (Any): Additional information about the span.
+
+    Returns:
+        Optional[Span]: The opened span or None if no job is traced in this thread.
+    """
+    stack = getattr(_local, "stack", None)
+    if not stack:
+        return None
+    _span = Span(name, **attributes)
+    stack[-1].children.append(_span)
+    stack.append(_span)
+    return _span
+
+
+def close_span(_span: Optional[Span]) -> None:
+    """Close a span opened by `open_span`.
+
+    Args:
+        _span (Optional[Span]): The span to close.
+    """
+    if _span is None:
+        return
+    _span.end = time()
+    stack = getattr(_local, "stack", None)
+    if stack and stack[-1] is _span:
+        stack.pop()
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """Trace a section of a job.
+
+    Args:
+        name (str): The name of the span.
+        **attributes (Any): Additional information about the span.
+
+    Yields:
+        Optional[Span]: The span or None if no job is traced in this thread.
+    """
+    _span = open_span(name, **attributes)
+    try:
+        yield _span
+    finally:
+        close_span(_span)
@@ -0,0 +1,339 @@
+"""
+tune.py
+
+This module provides the auto-tuner behind `scraibe-webui tune`.
+
+A short clip is transcribed under candidate configurations: the Whisper backend, the compute
+type (quantization) of faster-whisper, and the number of worker processes, where each worker is
+pinned to its share of the CPU cores and uses that many threads. For every candidate the
+real-time factor, the throughput of all workers together and the peak memory are measured.
+The configuration with the highest throughput within the memory limit is written to a config
+overlay, which can be passed to `scraibe-webui start -c` or loaded with `ConfigLoader.load_config`.
+
+The measured workers are pinned processes like the ones of `scraibe-webui worker`, so the worker
+count of the best candidate is only written as `advanced.spool.processes`. The in-process async
+workers and `num_threads`, which the simple interface uses as well, are left as configured.
+
+Classes:
+    TuneCandidate: A configuration tried by the tuner.
+
+Functions:
+    get_candidates: Build the candidate configurations for this host.
+    measure_candidate: Measure real-time factor, throughput and memory of a candidate.
+    tune: Measure all candidates and pick the best one.
+    write_overlay: Write the best candidate as config overlay.
+    load_overlay: Load a config overlay written by the tuner.
+    auto_tune: Load the overlay of `advanced.auto_tune` and run the tuner first if it is missing.
+"""
+import os
+import yaml
+import warnings
+import multiprocessing
+from time import perf_counter
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from .affinity import available_cores, partition_cores, pin_process
+from .warmup import create_warmup_clip
+
+BACKENDS = ("whisper", "faster-whisper")
+COMPUTE_TYPES = {"cpu": ("int8", "float32"), "cuda": ("float16", "int8_float16")}
+
+
+class TuneCandidate:
+    """
+    A configuration tried by the tuner.
+
+    Attributes:
+        whisper_type (str): The Whisper backend.
+        compute_type (str): The compute type of faster-whisper, None for whisper.
+        workers (int): The number of worker processes.
+        threads (int): The number of threads per worker.
+        result (Dict[str, Any]): The measurements, None until measured.
+    """
+    def __init__(self, whisper_type: str, compute_type: Optional[str], workers: int, threads: int) -> None:
+        self.whisper_type = whisper_type
+        self.compute_type = compute_type
+        self.workers = workers
+        self.threads = threads
+        self.result = None
+
+    def model_kwargs(self) -> Dict[str, Any]:
+        """Keyword arguments for the transcriber of this candidate."""
+        return {"compute_type": self.compute_type} if self.compute_type else {}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"whisper_type": self.whisper_type, "compute_type": self.compute_type,
+                "workers": self.workers, "threads": self.threads, **(self.result or {})}
+
+    def __repr__(self) -> str:
+        return (f"TuneCandidate(whisper_type={self.whisper_type}, compute_type={self.compute_type}, "
+                f"workers={self.workers}, threads={self.threads})")
+
+
+def get_candidates(device: str = "cpu",
+                   backends: Optional[List[str]] = None,
+                   workers: Optional[List[int]] = None,
+                   cores: Optional[int] = None) -> List[TuneCandidate]:
+    """Build the candidate configurations for this host.
+
+    Args:
+        device (str, optional): "cpu" or "cuda". Defaults to "cpu".
+        backends (List[str], optional): The backends to try. Defaults to BACKENDS.
+        workers (List[int], optional): The worker counts to try. Defaults to 1, 2 and 4 on the CPU
+                                       (limited by the number of cores) and 1 on the GPU.
+        cores (int, optional): The number of cores. Defaults to the cores available to this process.
+
+    Returns:
+        List[TuneCandidate]: The candidates.
+    """
+    cores = cores or len(available_cores())
+    device = "cuda" if str(device).startswith("cuda") else "cpu"
+    if workers is None:
+        workers = [w for w in (1, 2, 4) if w <= cores] if device == "cpu" else [1]
+
+    candidates = []
+    for backend in backends or BACKENDS:
+        compute_types = COMPUTE_TYPES[device] if backend == "faster-whisper" else (None,)
+        for compute_type in compute_types:
+            for n in workers:
+                candidates.append(TuneCandidate(backend, compute_type, n, max(cores // n, 1)))
+    return candidates
+
+
+def _peak_rss() -> int:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if os.uname().sysname == "Darwin" else rss * 1024
+
+
+def _measure_worker(candidate: Dict[str, Any], cores: Optional[List[int]], clip: str,
+                    repeats: int, start_barrier: Any, results: Any) -> None:
+    """Load the model and transcribe the clip. Runs in a worker process."""
+    try:
+        if cores is not None:
+            pin_process(cores)
+
+        from scraibe import AudioProcessor, load_transcriber
+
+        load_start = perf_counter()
+        transcriber = load_transcriber(candidate["model"],
+                                       whisper_type=candidate["whisper_type"],
+                                       device=candidate["device"],
+                                       **candidate["model_kwargs"])
+        load_time = perf_counter() - load_start
+        audio = AudioProcessor.from_file(clip)
+
+        # warm up before all workers start measuring together
+        transcriber.transcribe(audio.waveform)
+        start_barrier.wait()
+
+        start = perf_counter()
+        for _ in range(repeats):
+            transcriber.transcribe(audio.waveform)
+        results.put({"elapsed": perf_counter() - start, "load_time": load_time, "peak_rss": _peak_rss()})
+    except Exception as e:
+        try:
+            start_barrier.abort()
+        except Exception:
+            pass
+        results.put({"error": repr(e)})
+
+
+def measure_candidate(candidate: TuneCandidate, clip: str, clip_duration: float,
+                      model: Optional[str] = None, device: str = "cpu", repeats: int = 2,
+                      timeout: float = 1800.0) -> Dict[str, Any]:
+    """Measure real-time factor, throughput and memory of a candidate.
+
+    All workers of the candidate are started as pinned processes and transcribe the clip
+    `repeats` times at the same time after a warm-up run.
+
+    Args:
+        candidate (TuneCandidate): The candidate to measure.
+        clip (str): The path to the clip.
+        clip_duration (float): The duration of the clip in seconds.
+        model (str, optional): The Whisper model. Defaults to the scraibe default.
+        device (str, optional): The device. Defaults to "cpu".
+        repeats (int, optional): Number of measured transcriptions per worker. Defaults to 2.
+        timeout (float, optional): Seconds to wait for the workers. Defaults to 1800.0.
+
+    Returns:
+        Dict[str, Any]: `rtf` (seconds per second of audio per worker), `throughput` (seconds of
+            audio per second of all workers), `memory` (sum of the peak RSS in bytes), `load_time`,
+            or `error` if the candidate failed.
+    """
+    context = multiprocessing.get_context("spawn")
+    pinned = device == "cpu"
+    core_sets = partition_cores(candidate.workers) if pinned else [None] * candidate.workers
+    start_barrier = context.Barrier(candidate.workers)
+    results = context.Queue()
+    spec = {"model": model or "medium", "whisper_type": candidate.whisper_type, "device": device,
+            "model_kwargs": candidate.model_kwargs()}
+
+    processes = [context.Process(target=_measure_worker,
+                                 args=(spec, cores, clip, repeats, start_barrier, results), daemon=True)
+                 for cores in core_sets]
+    for process in processes:
+        process.start()
+
+    measurements = []
+    try:
+        for _ in processes:
+            measurements.append(results.get(timeout=timeout))
+    except Exception:
+        measurements.append({"error": "timeout"})
+    finally:
+        for process in processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+
+    errors = [m["error"] for m in measurements if "error" in m]
+    if errors:
+        candidate.result = {"error": errors[0]}
+        return candidate.result
+
+    audio_seconds = clip_duration * repeats
+    wall = max(m["elapsed"] for m in measurements)
+    candidate.result = {
+        "rtf": sum(m["elapsed"] for m in measurements) / len(measurements) / audio_seconds,
+        "throughput": audio_seconds * candidate.workers / wall,
+        "memory": sum(m["peak_rss"] for m in measurements),
+        "load_time": max(m["load_time"] for m in measurements),
+    }
+    return candidate.result
+
+
+def tune(model: Optional[str] = None, device: str = "cpu", clip: Optional[str] = None,
+         clip_duration: float = 30.0, repeats: int = 2, max_memory: Optional[int] = None,
+         candidates: Optional[List[TuneCandidate]] = None, verbose: bool = True) -> Dict[str, Any]:
+    """Measure all candidates and pick the one with the highest throughput.
+
+    Args:
+        model (str, optional): The Whisper model. Defaults to the scraibe default.
+        device (str, optional): The device. Defaults to "cpu".
+        clip (str, optional): A representative clip. Defaults to a synthetic clip of `clip_duration`.
+        clip_duration (float, optional): Duration of the synthetic clip in seconds. Defaults to 30.0.
+        repeats (int, optional): Number of measured transcriptions per worker. Defaults to 2.
+        max_memory (int, optional): Candidates using more bytes of memory are not selected. Defaults to None.
+        candidates (List[TuneCandidate], optional): The candidates. Defaults to `get_candidates(device)`.
+        verbose (bool, optional): Print every measurement. Defaults to True.
+
+    Returns:
+        Dict[str, Any]: The `best` candidate and all `candidates` with their measurements.
+    """
+    from .media import get_media_duration
+
+    own_clip = clip is None
+    if own_clip:
+        clip = create_warmup_clip(duration=clip_duration)
+    else:
+        clip_duration = get_media_duration(clip) or clip_duration
+
+    candidates = candidates or get_candidates(device)
+    try:
+        for candidate in candidates:
+            result = measure_candidate(candidate, clip, clip_duration, model, device, repeats)
+            if verbose:
+                if "error" in result:
+                    print(f"{candidate}: failed with {result['error']}")
+                else:
+                    print(f"{candidate}: rtf {result['rtf']:.3f}, throughput {result['throughput']:.2f} s/s, "
+                          f"memory {result['memory'] / 2**20:.0f} MiB")
+    finally:
+        if own_clip:
+            os.remove(clip)
+
+    valid = [c for c in candidates if c.result and "error" not in c.result
+             and (max_memory is None or c.result["memory"] <= max_memory)]
+    best = max(valid, key=lambda c: c.result["throughput"]) if valid else None
+    if best is None:
+        warnings.warn("No candidate configuration succeeded within the memory limit.")
+
+    return {"best": best.to_dict() if best else None,
+            "candidates": [c.to_dict() for c in candidates],
+            "model": model, "device": device, "clip_duration": clip_duration}
+
+
+def write_overlay(result: Dict[str, Any], path: str = "tuned.yaml") -> Optional[Dict[str, Any]]:
+    """Write the best candidate as config overlay.
+
+    The overlay sets the backend and compute type in `scraibe_params` and the number of pinned
+    worker processes of `scraibe-webui worker` in `advanced.spool.processes`. The number of
+    threads is not written, a pinned worker uses its share of the cores.
+
+    Args:
+        result (Dict[str, Any]): The result of `tune`.
+        path (str, optional): The path of the overlay. Defaults to "tuned.yaml".
+
+    Returns:
+        Optional[Dict[str, Any]]: The overlay or None if there is no best candidate.
+    """
+    best = result.get("best")
+    if best is None:
+        return None
+
+    scraibe_params = {"whisper_type": best["whisper_type"]}
+    if best["compute_type"]:
+        scraibe_params["compute_type"] = best["compute_type"]
+    # measured with pinned processes, which only `scraibe-webui worker` runs
+    overlay = {"scraibe_params": scraibe_params,
+               "advanced": {"spool": {"processes": best["workers"]}}}
+
+    header = (f"# Written by `scraibe-webui tune` on {datetime.now(timezone.utc).isoformat()}\n"
+              f"# model: {result.get('model')}, device: {result.get('device')}\n"
+              f"# rtf: {best['rtf']:.3f}, throughput: {best['throughput']:.2f} s of audio per s, "
+              f"memory: {best['memory'] / 2**20:.0f} MiB\n")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(header)
+        yaml.safe_dump(overlay, f, sort_keys=False)
+    return overlay
+
+
+def load_overlay(path: str) -> Dict[str, Any]:
+    """Load a config overlay written by the tuner.
+
+    Args:
+        path (str): The path of the overlay.
+
+    Returns:
+        Dict[str, Any]: The overlay, empty if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def auto_tune(config: Optional[str] = None) -> Dict[str, Any]:
+    """Load the overlay of `advanced.auto_tune` and run the tuner first if it does not exist yet.
+
+    Args:
+        config (str, optional): Path to the customized config.yaml. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: The overlay, empty if auto tuning is disabled or no candidate succeeded.
+    """
+    from .configloader import ConfigLoader
+
+    loaded = ConfigLoader.load_config(config).config
+    settings = (loaded.get("advanced") or {}).get("auto_tune") or {}
+    if not settings.get("enabled"):
+        return {}
+
+    path = settings.get("overlay") or "tuned.yaml"
+    if os.path.exists(path):
+        return load_overlay(path)
+
+    scraibe_params = loaded.get("scraibe_params") or {}
+    device = scraibe_params.get("device")
+    if device is None:
+        from scraibe.misc import SCRAIBE_TORCH_DEVICE
+        device = SCRAIBE_TORCH_DEVICE
+
+    print(f"Tuning the backend for this host, the result is written to {path}.")
+    result = tune(model=scraibe_params.get("whisper_model"), device=str(device),
+                  clip=settings.get("clip"),
+                  max_memory=settings["max_memory"] * 2**20 if settings.get("max_memory") else None) # MiB like the CLI
+    return write_overlay(result, path) or {}
@@ -0,0 +1,286 @@
+"""
+vad.py
+
+This module removes non-speech regions from decoded audio before transcription and diarisation.
+
+Meetings often contain long silences or hold music which are otherwise fed to the models. With
+the filter enabled, speech regions are detected, padded and concatenated, and only the
+concatenated speech is diarised and transcribed. A `SpeechMap` remembers where each kept region
+came from, so the segment times of the transcript are mapped back to times in the original media.
+
+Two detectors are available:
+    silero: The Silero VAD model bundled with faster-whisper. Tells speech from music and noise.
+    energy: Frames whose energy is close to the noise floor of the file are non-speech. Needs
+            no model but only removes silence.
+
+Classes:
+    SpeechMap: Maps times in the stripped audio back to times in the original media.
+    VoiceActivityFilter: Detects speech and removes the regions without speech.
+
+Functions:
+    configure: Enable the filter from the `advanced.vad` configuration.
+    get_vad: Get the active filter.
+"""
+import warnings
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+_vad = None
+
+ENERGY_FRAME = 0.03 # seconds per frame of the energy detector
+ENERGY_MARGIN_DB = 15.0 # frames this far above the noise floor are speech
+ENERGY_FLOOR_DB = -60.0 # frames below this level are never speech
+
+
+class SpeechMap:
+    """
+    Maps times in the stripped audio back to times in the original media.
+
+    Attributes:
+        regions (List[Tuple[float, float]]): The kept regions in original time, in order.
+        offsets (List[float]): The start of each region in stripped time.
+        duration (float): The duration of the original audio in seconds.
+    """
+    def __init__(self, regions: Sequence[Tuple[float, float]], duration: float) -> None:
+        self.regions = [(float(start), float(end)) for start, end in regions]
+        self.duration = float(duration)
+        self.offsets = []
+        position = 0.0
+        for start, end in self.regions:
+            self.offsets.append(position)
+            position += end - start
+
+    @property
+    def kept(self) -> float:
+        """Seconds of audio which are kept."""
+        return sum(end - start for start, end in self.regions)
+
+    @property
+    def skipped_fraction(self) -> float:
+        """Fraction of the original audio which is removed."""
+        return 1.0 - self.kept / self.duration if self.duration else 0.0
+
+    def to_original(self, time: float, end: bool = False) -> float:
+        """Map a time in the stripped audio to the original media.
+
+        Args:
+            time (float): Seconds in the stripped audio.
+            end (bool, optional): Whether the time ends a segment. A time exactly at the
+                                  joint of two regions then maps to the end of the first
+                                  region instead of the start of the second. Defaults to False.
+
+        Returns:
+            float: Seconds in the original media.
+        """
+        if not self.regions:
+            return time
+        index = (bisect_left if end else bisect_right)(self.offsets, time) - 1
+        index = min(max(index, 0), len(self.regions) - 1)
+        start, stop = self.regions[index]
+        return min(start + max(time - self.offsets[index], 0.0), stop)
+
+    def remap(self, segment: Sequence[float]) -> List[float]:
+        """Map a segment `[start, end]` in the stripped audio to the original media.
+
+        Args:
+            segment (Sequence[float]): The segment in stripped time.
+
+        Returns:
+            List[float]: The segment in original time.
+        """
+        return [self.to_original(segment[0]), self.to_original(segment[1], end=True)]
+
+    def __repr__(self) -> str:
+        return (f"SpeechMap(regions={len(self.regions)}, kept={self.kept:.1f}s, "
+                f"skipped_fraction={self.skipped_fraction:.2f})")
+
+
+def _merge(regions: List[Tuple[float, float]], min_silence: float, min_speech: float,
+           padding: float, duration: float) -> List[Tuple[float, float]]:
+    """Close short pauses, drop short speech, pad and clip the regions."""
+    merged = []
+    for start, end in regions:
+        if merged and start - merged[-1][1] < min_silence:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    padded = []
+    for start, end in merged:
+        if end - start < min_speech:
+            continue
+        start, end = max(start - padding, 0.0), min(end + padding, duration)
+        if padded and start <= padded[-1][1]:
+            padded[-1] = (padded[-1][0], end)
+        else:
+            padded.append((start, end))
+    return padded
+
+
+class VoiceActivityFilter:
+    """
+    Detects speech and removes the regions without speech.
+
+    Attributes:
+        method (str): 'silero', 'energy' or 'auto' (silero if faster-whisper is installed).
+        threshold (float): The speech probability above which silero reports speech.
+        min_speech (float): Speech regions shorter than this many seconds are dropped.
+        min_silence (float): Only pauses of at least this many seconds are removed.
+        padding (float): Seconds of audio kept before and after each speech region.
+        min_skipped (float): The audio is kept unchanged if less than this fraction would be removed.
+    """
+    def __init__(self, method: str = "auto", threshold: float = 0.5, min_speech: float = 0.25,
+                 min_silence: float = 1.0, padding: float = 0.2, min_skipped: float = 0.05) -> None:
+        """
+        Initializes the VoiceActivityFilter.
+
+        Args:
+            method (str, optional): 'silero', 'energy' or 'auto'. Defaults to "auto".
+            threshold (float, optional): The speech probability threshold of silero. Defaults to 0.5.
+            min_speech (float, optional): Minimum seconds of a speech region. Defaults to 0.25.
+            min_silence (float, optional): Minimum seconds of a removed pause. Defaults to 1.0.
+            padding (float, optional): Seconds kept around each speech region. Defaults to 0.2.
+            min_skipped (float, optional): Minimum fraction removed, otherwise the audio is kept
+                                           unchanged. Defaults to 0.05.
+        """
+        if method not in ("auto", "silero", "energy"):
+            raise ValueError(f"Invalid VAD method: {method}. Must be 'auto', 'silero' or 'energy'.")
+        self.method = method
+        self.threshold = threshold
+        self.min_speech = min_speech
+        self.min_silence = min_silence
+        self.padding = padding
+        self.min_skipped = min_skipped
+
+    def _silero(self, samples: np.ndarray, sr: int) -> Optional[List[Tuple[float, float]]]:
+        try:
+            from faster_whisper.vad import get_speech_timestamps
+        except ImportError:
+            if self.method == "silero":
+                warnings.warn("faster-whisper is not installed, falling back to the energy VAD.")
+            return None
+        if sr != 16000:
+            return None # the bundled model only supports 16 kHz
+
+        timestamps = get_speech_timestamps(samples,
+                                           threshold=self.threshold,
+                                           min_speech_duration_ms=int(self.min_speech * 1000),
+                                           min_silence_duration_ms=int(self.min_silence * 1000),
+                                           speech_pad_ms=0)
+        return [(t["start"] / sr, t["end"] / sr) for t in timestamps]
+
+    def _energy(self, samples: np.ndarray, sr: int) -> List[Tuple[float, float]]:
+        frame = max(int(ENERGY_FRAME * sr), 1)
+        n_frames = len(samples) // frame
+        if n_frames == 0:
+            return [(0.0, len(samples) / sr)]
+
+        frames = samples[:n_frames * frame].reshape(n_frames, frame)
+        level = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+        threshold = max(np.percentile(level, 10) + ENERGY_MARGIN_DB, ENERGY_FLOOR_DB)
+
+        regions, start = [], None
+        for i, is_speech in enumerate(level > threshold):
+            if is_speech and start is None:
+                start = i
+            elif not is_speech and start is not None:
+                regions.append((start * frame / sr, i * frame / sr))
+                start = None
+        if start is not None:
+            regions.append((start * frame / sr, len(samples) / sr))
+        return regions
+
+    def detect(self, waveform: Any, sr: int) -> List[Tuple[float, float]]:
+        """Detect the speech regions of a waveform.
+
+        Args:
+            waveform (Union[torch.Tensor, np.ndarray]): The mono waveform.
+            sr (int): The sample rate.
+
+        Returns:
+            List[Tuple[float, float]]: The padded speech regions in seconds.
+        """
+        samples = waveform.cpu().numpy() if hasattr(waveform, "cpu") else np.asarray(waveform)
+        samples = samples.astype(np.float32, copy=False).reshape(-1)
+        duration = len(samples) / sr
+
+        regions = self._silero(samples, sr) if self.method != "energy" else None
+        if regions is None:
+            regions = self._energy(samples, sr)
+        return _merge(regions, self.min_silence, self.min_speech, self.padding, duration)
+
+    def strip(self, audio: Any) -> Tuple[Any, Optional[SpeechMap]]:
+        """Remove the regions without speech from decoded audio.
+
+        Args:
+            audio (AudioProcessor): The decoded audio.
+
+        Returns:
+            Tuple[AudioProcessor, Optional[SpeechMap]]: The audio with only the speech regions
+                and the map back to the original times, or the unchanged audio and None if
+                there is no speech or not enough to remove.
+        """
+        waveform = audio.waveform
+        if not hasattr(waveform, "cpu") and not isinstance(waveform, np.ndarray):
+            return audio, None # e.g. the waveforms of the stub backend carry no samples
+
+        duration = len(waveform) / audio.sr
+        regions = self.detect(waveform, audio.sr)
+        speech_map = SpeechMap(regions, duration)
+        if not regions or speech_map.skipped_fraction < self.min_skipped:
+            return audio, None
+
+        pieces = [waveform[int(start * audio.sr):int(end * audio.sr)] for start, end in regions]
+        if hasattr(waveform, "cpu"):
+            import torch
+            stripped = torch.cat(pieces)
+        else:
+            stripped = np.concatenate(pieces)
+        return type(audio)(stripped, audio.sr), speech_map
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'VoiceActivityFilter':
+        """Initialize the VoiceActivityFilter from a configuration dictionary.
+
+        Args:
+            config (dict): The `advanced.vad` configuration section.
+
+        Returns:
+            VoiceActivityFilter: An instance of VoiceActivityFilter.
+        """
+        defaults = {"method": "auto", "threshold": 0.5, "min_speech": 0.25,
+                    "min_silence": 1.0, "padding": 0.2, "min_skipped": 0.05}
+        return cls(**{key: config[key] if config.get(key) is not None else value
+                      for key, value in defaults.items()})
+
+    def __repr__(self) -> str:
+        return (f"VoiceActivityFilter(method={self.method}, min_silence={self.min_silence}, "
+                f"padding={self.padding})")
+
+
+def configure(config: Optional[Dict[str, Any]]) -> Optional[VoiceActivityFilter]:
+    """Enable the filter from the `advanced.vad` configuration.
+
+    Args:
+        config (Optional[Dict[str, Any]]): The `advanced.vad` configuration section.
+
+    Returns:
+        Optional[VoiceActivityFilter]: The active filter or None if it is disabled.
+    """
+    global _vad
+    if config and config.get("enabled"):
+        _vad = VoiceActivityFilter.from_config(config)
+    else:
+        _vad = None
+    return _vad
+
+
+def get_vad() -> Optional[VoiceActivityFilter]:
+    """Get the active filter.
+
+    Returns:
+        Optional[VoiceActivityFilter]: The active filter or None if it is disabled.
+    """
+    return _vad
@@ -0,0 +1,126 @@
+"""
+warmup.py
+
+This module preloads the configured Scraibe pipeline when the server starts.
+
+Loading the models (including a potential download) and the first inference, which pays for
+memory allocation and kernel initialisation, are moved from the first user request to the
+start of the server. With model routing the models of the `ModelPool` are preloaded instead,
+as many as it keeps in memory. The readiness flag `global_var.READY` is set once the warm-up
+succeeded. If it failed, `global_var.PRELOAD_FAILED` is set and the app is never ready.
+
+Functions:
+    create_warmup_clip: Write a short synthetic audio clip to disk.
+    preload_models: Load the pipeline and run a warm-up clip through it.
+    start_preload: Run `preload_models` in a daemon thread.
+"""
+import os
+import math
+import wave
+import struct
+import tempfile
+import warnings
+from time import time
+from threading import Thread
+from typing import Any, Dict, Optional
+
+import scraibe_webui.global_var as gv
+
+WARMUP_SAMPLE_RATE = 16000
+
+
+def create_warmup_clip(path: Optional[str] = None, duration: float = 3.0) -> str:
+    """Write a short synthetic audio clip to disk.
+
+    The clip is a mono 16 kHz WAV file with amplitude modulated tones, which is enough
+    to run every stage of the pipeline once.
+
+    Args:
+        path (str, optional): Where to write the clip. Defaults to a temporary file.
+        duration (float, optional): Length of the clip in seconds. Defaults to 3.0.
+
+    Returns:
+        str: The path to the written clip.
+    """
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix=".wav", prefix="scraibe_warmup_")
+        os.close(fd)
+
+    n_samples = int(duration * WARMUP_SAMPLE_RATE)
+    frames = bytearray()
+    for i in range(n_samples):
+        t = i / WARMUP_SAMPLE_RATE
+        envelope = 0.5 * (1 + math.sin(2 * math.pi * 3 * t))
+        sample = envelope * (0.4 * math.sin(2 * math.pi * 220 * t) + 0.2 * math.sin(2 * math.pi * 660 * t))
+        frames += struct.pack("<h", int(sample * 32767))
+
+    with wave.open(path, "wb") as clip:
+        clip.setnchannels(1)
+        clip.setsampwidth(2)
+        clip.setframerate(WARMUP_SAMPLE_RATE)
+        clip.writeframes(bytes(frames))
+
+    return path
+
+
+def preload_models(scraibe_params: Dict[str, Any], keep_model_alive: bool = False) -> None:
+    """Load the configured pipeline and run a warm-up clip through it.
+
+    If `keep_model_alive` is set the warmed pipeline is kept as `global_var.PIPE`
+    and used by the first request. Otherwise the warm-up still downloads the models
+    and fills the file system caches. If `global_var.MODEL_POOL` is set, the default
+    and routed models are loaded into the pool instead, which serves the requests.
+    The readiness flag is only set if the warm-up succeeded.
+
+    Args:
+        scraibe_params (dict): The parameters used to load the Scraibe model.
+        keep_model_alive (bool, optional): Keep the warmed pipeline in memory. Defaults to False.
+    """
+    start = time()
+    clip = None
+    pool = gv.MODEL_POOL
+    try:
+        print("Preloading models.")
+        if pool is not None:
+            # loading more models than the pool keeps would drop the first ones again
+            pipes = [pool.get(model) for model in pool.routed_models[:pool.max_models]]
+        else:
+            from .wrapper import ScraibeWrapper
+            pipes = [ScraibeWrapper.load_from_dict(scraibe_params)]
+        clip = create_warmup_clip()
+        for pipe in pipes:
+            try:
+                pipe.model.autotranscribe(clip)
+            except ValueError:
+                # no speech found in the synthetic clip, the models ran nevertheless
+                pass
+
+        if keep_model_alive and pool is None:
+            gv.PIPE = pipes[0]
+        print(f"Models preloaded and warmed up in {time() - start:.1f}s.")
+        gv.READY = True
+
+    except Exception as e:
+        gv.PRELOAD_FAILED = True
+        warnings.warn(f"Preloading the models failed, the app does not report itself ready: {e}")
+
+    finally:
+        if clip is not None and os.path.exists(clip):
+            os.remove(clip)
+
+
+def start_preload(scraibe_params: Dict[str, Any], keep_model_alive: bool = False) -> Thread:
+    """Run `preload_models` in a daemon thread.
+
+    Args:
+        scraibe_params (dict): The parameters used to load the Scraibe model.
+        keep_model_alive (bool, optional): Keep the warmed pipeline in memory. Defaults to False.
+
+    Returns:
+        Thread: The started thread.
+    """
+    gv.READY, gv.PRELOAD_FAILED = False, False
+    thread = Thread(target=preload_models, args=(scraibe_params, keep_model_alive),
+                    name="scraibe-preload", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,235 @@
+"""
+windowed.py
+
+This module diarises very long audio in bounded windows.
+
+The pyannote pipeline processes a file in one pass, and its memory and time grow with the
+length of the recording. For long files the audio is split into windows of equal length, each
+window is diarised on its own together with the embedding of each of its speakers, and the local
+speakers of all windows are re-clustered globally, so the same person keeps the same label
+across windows. The memory of the diarisation is bounded by the window length.
+
+The global clustering is agglomerative on the cosine distance of the speaker embeddings. Two
+speakers found in the same window are never merged, since the pipeline already told them apart.
+
+Classes:
+    WindowedDiariser: Diarises long audio window by window and re-clusters the speakers.
+
+Functions:
+    configure: Enable windowed diarisation from the `advanced.windowed_diarisation` configuration.
+    get_windowed_diariser: Get the active windowed diariser.
+"""
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .cancel import checkpoint
+
+_windowed = None
+
+
+def _cluster(embeddings: np.ndarray, weights: np.ndarray, windows: List[int],
+             threshold: float, num_speakers: Optional[int] = None) -> List[int]:
+    """Agglomerative clustering of local speakers with a cannot-link constraint per window.
+
+    Args:
+        embeddings (np.ndarray): The speaker embeddings, one row per local speaker.
+        weights (np.ndarray): Seconds of speech of each local speaker, used to weight the centroids.
+        windows (List[int]): The window of each local speaker.
+        threshold (float): Clusters closer than this cosine distance are merged.
+        num_speakers (int, optional): Merge until this many clusters are left, ignoring the threshold.
+
+    Returns:
+        List[int]: The cluster of each local speaker.
+    """
+    normed = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-10)
+    clusters = [{"members": [i], "windows": {windows[i]}, "sum": normed[i] * max(weights[i], 1e-3)}
+                for i in range(len(normed))]
+
+    while len(clusters) > 1 and (num_speakers is None or len(clusters) > num_speakers):
+        centroids = np.stack([c["sum"] / max(np.linalg.norm(c["sum"]), 1e-10) for c in clusters])
+        distance = 1.0 - centroids @ centroids.T
+        for a in range(len(clusters)):
+            distance[a, a] = np.inf
+            for b in range(a + 1, len(clusters)):
+                if clusters[a]["windows"] & clusters[b]["windows"]:
+                    distance[a, b] = distance[b, a] = np.inf
+
+        a, b = np.unravel_index(np.argmin(distance), distance.shape)
+        if not np.isfinite(distance[a, b]) or (num_speakers is None and distance[a, b] > threshold):
+            break
+        a, b = min(a, b), max(a, b)
+        clusters[a] = {"members": clusters[a]["members"] + clusters[b]["members"],
+                       "windows": clusters[a]["windows"] | clusters[b]["windows"],
+                       "sum": clusters[a]["sum"] + clusters[b]["sum"]}
+        del clusters[b]
+
+    labels = [0] * len(normed)
+    for k, cluster in enumerate(clusters):
+        for i in cluster["members"]:
+            labels[i] = k
+    return labels
+
+
+class WindowedDiariser:
+    """
+    Diarises long audio window by window and re-clusters the speakers globally.
+
+    Attributes:
+        min_duration (float): Files with at least this many seconds are diarised in windows.
+        window (float): The maximum length of a window in seconds.
+        threshold (float): Speakers of different windows closer than this cosine distance are merged.
+    """
+    def __init__(self, min_duration: float = 1800.0, window: float = 600.0, threshold: float = 0.7) -> None:
+        """
+        Initializes the WindowedDiariser.
+
+        Args:
+            min_duration (float, optional): Files with at least this many seconds are diarised
+                                            in windows. Defaults to 1800.0.
+            window (float, optional): The maximum length of a window in seconds. Defaults to 600.0.
+            threshold (float, optional): Speakers of different windows closer than this cosine
+                                         distance are merged. Defaults to 0.7.
+        """
+        self.min_duration = min_duration
+        self.window = window
+        self.threshold = threshold
+
+    def applies(self, diariser: Any, audio: Any) -> bool:
+        """Check if the audio is long enough and the diariser supports embeddings.
+
+        Args:
+            diariser (Diariser): The diariser of a Scraibe model.
+            audio (AudioProcessor): The decoded audio.
+
+        Returns:
+            bool: True if the audio should be diarised in windows.
+        """
+        # the stub backend has no pyannote pipeline
+        return hasattr(diariser, "model") and len(audio.waveform) / audio.sr >= self.min_duration
+
+    def windows(self, duration: float) -> List[Tuple[float, float]]:
+        """Split the audio into windows of equal length of at most `window` seconds.
+
+        Args:
+            duration (float): The duration of the audio in seconds.
+
+        Returns:
+            List[Tuple[float, float]]: The start and end of each window in seconds.
+        """
+        n = max(math.ceil(duration / self.window), 1)
+        size = duration / n
+        return [(i * size, duration if i == n - 1 else (i + 1) * size) for i in range(n)]
+
+    def diarise(self, diariser: Any, audio: Any, device: Any = None, **kwargs: Any) -> Dict[str, list]:
+        """Diarise the audio window by window and re-cluster the speakers.
+
+        Args:
+            diariser (Diariser): The diariser of a Scraibe model.
+            audio (AudioProcessor): The decoded audio.
+            device (Union[str, torch.device], optional): The device of the model.
+            **kwargs (Any): Keyword arguments for the diarisation, e.g. `num_speakers`.
+
+        Returns:
+            Dict[str, list]: The speakers and segments in the format of `Diariser.diarization`.
+        """
+        from pyannote.core import Annotation, Segment
+
+        kwargs = diariser._get_diarisation_kwargs(**kwargs)
+        num_speakers = kwargs.pop("num_speakers", None)
+        kwargs.pop("min_speakers", None)
+        if num_speakers is not None:
+            # a window may contain only some of the speakers
+            kwargs["max_speakers"] = num_speakers
+
+        duration = len(audio.waveform) / audio.sr
+        local = [] # (offset, annotation, {label: index of local speaker})
+        embeddings, weights, windows, orphans = [], [], [], []
+        for w, (start, end) in enumerate(self.windows(duration)):
+            checkpoint()
+            chunk = audio.cut(start, end)
+            chunk = chunk.reshape(1, len(chunk))
+            if device is not None:
+                chunk = chunk.to(device)
+            annotation, centroids = diariser.model({"waveform": chunk, "sample_rate": audio.sr},
+                                                   return_embeddings=True, **kwargs)
+
+            speakers = {}
+            for k, label in enumerate(annotation.labels()):
+                embedding = centroids[k] if centroids is not None and k < len(centroids) else None
+                if embedding is None or not np.all(np.isfinite(embedding)):
+                    # too little speech for an embedding, keep the speaker on its own
+                    speakers[label] = -1 - len(orphans)
+                    orphans.append(label)
+                    continue
+                speakers[label] = len(embeddings)
+                embeddings.append(np.asarray(embedding, dtype=np.float64))
+                weights.append(annotation.label_duration(label))
+                windows.append(w)
+            local.append((start, annotation, speakers))
+
+        labels = _cluster(np.stack(embeddings), np.asarray(weights), windows,
+                          self.threshold, num_speakers) if embeddings else []
+        n_clusters = max(labels) + 1 if labels else 0
+
+        # label the global speakers in the order of their first appearance
+        tracks = []
+        for offset, annotation, speakers in local:
+            for segment, _, label in annotation.itertracks(yield_label=True):
+                index = speakers[label]
+                cluster = labels[index] if index >= 0 else n_clusters + (-1 - index)
+                tracks.append((float(segment.start + offset), float(segment.end + offset), cluster))
+        tracks.sort()
+
+        names, merged = {}, Annotation()
+        for i, (start, end, cluster) in enumerate(tracks):
+            if cluster not in names:
+                names[cluster] = f"SPEAKER_{len(names):02d}"
+            merged[Segment(start, end), i] = names[cluster]
+
+        return diariser.format_diarization_output(merged)
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'WindowedDiariser':
+        """Initialize the WindowedDiariser from a configuration dictionary.
+
+        Args:
+            config (dict): The `advanced.windowed_diarisation` configuration section.
+
+        Returns:
+            WindowedDiariser: An instance of WindowedDiariser.
+        """
+        return cls(min_duration=config.get("min_duration") or 1800.0,
+                   window=config.get("window") or 600.0,
+                   threshold=config.get("threshold") or 0.7)
+
+    def __repr__(self) -> str:
+        return (f"WindowedDiariser(min_duration={self.min_duration}, window={self.window}, "
+                f"threshold={self.threshold})")
+
+
+def configure(config: Optional[Dict[str, Any]]) -> Optional[WindowedDiariser]:
+    """Enable windowed diarisation from the `advanced.windowed_diarisation` configuration.
+
+    Args:
+        config (Optional[Dict[str, Any]]): The `advanced.windowed_diarisation` configuration section.
+
+    Returns:
+        Optional[WindowedDiariser]: The active windowed diariser or None if it is disabled.
+    """
+    global _windowed
+    if config and config.get("enabled"):
+        _windowed = WindowedDiariser.from_config(config)
+    else:
+        _windowed = None
+    return _windowed
+
+
+def get_windowed_diariser() -> Optional[WindowedDiariser]:
+    """Get the active windowed diariser.
+
+    Returns:
+        Optional[WindowedDiariser]: The active windowed diariser or None if it is disabled.
+    """
+    return _windowed
@@ -0,0 +1,281 @@
+"""
+worker.py
+
+This module provides the standalone worker behind `scraibe-webui worker`.
+
+A worker claims jobs from the spool written by the async interface, runs them with a model
+which is loaded once and kept in memory, and mails the results. Any number of workers, on the
+same or on different machines sharing the spool directory, can run side by side.
+
+Several worker processes can be started on one machine with `run_worker_processes`. Each of
+them is pinned to its own share of the CPU cores, see `affinity.py`. Like the app, the workers
+apply the overlay of `advanced.auto_tune`, see `tune.py`.
+
+Classes:
+    SpoolWorker: Claims jobs from a spool and runs them with a resident model.
+
+Functions:
+    run_worker_processes: Run several worker processes, each pinned to its own cores.
+"""
+import os
+import signal
+import socket
+import warnings
+import multiprocessing
+from uuid import uuid4
+from threading import Thread, Event
+from typing import Any, Dict, List, Optional
+
+from .spool import Spool
+from .affinity import partition_cores, pin_process
+
+
+class SpoolWorker:
+    """
+    Claims jobs from a spool and runs them with a resident model.
+
+    Attributes:
+        spool (Spool): The spool the jobs are claimed from.
+        scraibe_params (Dict[str, Any]): The parameters used to load the model.
+        mail_service_params (Dict[str, Any]): The mail configuration used to send the results.
+        threads_per_model (int): The number of torch threads of the model.
+        poll_interval (float): Seconds to wait when no job is pending.
+        worker_id (str): Identifies the worker in the job records.
+        jobs_done (int): Number of jobs run by this worker.
+    """
+    def __init__(self,
+                 spool: Spool,
+                 scraibe_params: Dict[str, Any],
+                 mail_service_params: Dict[str, Any],
+                 threads_per_model: Optional[int] = None,
+                 poll_interval: float = 1.0,
+                 worker_id: Optional[str] = None) -> None:
+        """
+        Initializes the SpoolWorker.
+
+        Args:
+            spool (Spool): The spool the jobs are claimed from.
+            scraibe_params (dict): The parameters used to load the model.
+            mail_service_params (dict): The mail configuration used to send the results.
+            threads_per_model (int, optional): The number of torch threads of the model. Defaults to None.
+            poll_interval (float, optional): Seconds to wait when no job is pending. Defaults to 1.0.
+            worker_id (str, optional): Identifies the worker. Defaults to `<hostname>-<pid>-<random>`.
+        """
+        self.spool = spool
+        self.scraibe_params = scraibe_params
+        self.mail_service_params = mail_service_params
+        self.threads_per_model = threads_per_model
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid4().hex[:6]}"
+        self.jobs_done = 0
+
+        self._runner = None
+        self._stop_event = Event()
+
+    def load(self) -> None:
+        """Load the resident model."""
+        from .wrapper import ScraibeWrapper
+        from .background import BackgroundThread
+        import scraibe_webui.global_var as gv
+
+        # with model routing the jobs take their model from the pool
+        pipe = ScraibeWrapper.load_from_dict(self.scraibe_params) if gv.MODEL_POOL is None else None
+        self._runner = BackgroundThread(self.mail_service_params, self.scraibe_params,
+                                        self.threads_per_model, pipe=pipe)
+
+    def _heartbeat(self, record: Dict[str, Any], done: Event) -> None:
+        interval = min(self.spool.stale_after / 3, 30) if self.spool.stale_after else 30
+        while not done.wait(interval):
+            self.spool.heartbeat(record)
+
+    def run_job(self, record: Dict[str, Any]) -> bool:
+        """Run a claimed job and move it to `done/` or `failed/`.
+
+        Args:
+            record (Dict[str, Any]): The job record returned by `Spool.claim`.
+
+        Returns:
+            bool: True if the job succeeded.
+        """
+        if self._runner is None:
+            self.load()
+
+        done = Event()
+        Thread(target=self._heartbeat, args=(record, done), daemon=True).start()
+        try:
+            media = self.spool.media(record)
+            error = self._runner.parrallel_task(media if len(media) > 1 else media[0],
+                                                record["reciever"],
+                                                record["task"],
+                                                record.get("num_speakers"),
+                                                record.get("translate", False),
+                                                record.get("language"),
+                                                record.get("error_format_options") or {},
+                                                record.get("transcript_format_options") or {},
+                                                submitted_at=record.get("submitted_at"),
+                                                job_id=record["job_id"])
+        except Exception as e:
+            error = e
+        finally:
+            done.set()
+
+        self.jobs_done += 1
+        if error is None:
+            self.spool.finish(record, "done", worker=self.worker_id)
+        else:
+            self.spool.finish(record, "failed", worker=self.worker_id, error=repr(error))
+        return error is None
+
+    def run_once(self) -> bool:
+        """Requeue stale jobs and run the next pending job if there is one.
+
+        Returns:
+            bool: True if a job was run.
+        """
+        self.spool.requeue_stale()
+        record = self.spool.claim(self.worker_id)
+        if record is None:
+            return False
+        self.run_job(record)
+        return True
+
+    def run_forever(self, max_jobs: Optional[int] = None) -> None:
+        """Run jobs until `stop` is called or `max_jobs` jobs are done.
+
+        Args:
+            max_jobs (int, optional): Stop after this many jobs. Defaults to None.
+        """
+        if self._runner is None:
+            self.load()
+
+        while not self._stop_event.is_set():
+            if max_jobs is not None and self.jobs_done >= max_jobs:
+                break
+            if not self.run_once():
+                self._stop_event.wait(self.poll_interval)
+
+    def stop(self, *args: Any) -> None:
+        """Stop after the current job. Can be used as signal handler."""
+        self._stop_event.set()
+
+    def install_signal_handlers(self) -> None:
+        """Finish the current job and stop on SIGTERM and SIGINT."""
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                signal.signal(sig, self.stop)
+            except ValueError:
+                warnings.warn("Signal handlers can only be installed in the main thread.")
+                return
+
+    @classmethod
+    def from_config(cls, config: Any, **kwargs: Any) -> 'SpoolWorker':
+        """Initialize the SpoolWorker from an AppConfigLoader.
+
+        Args:
+            config (AppConfigLoader): The loaded configuration.
+            **kwargs (Any): Overrides of the worker arguments.
+
+        Returns:
+            SpoolWorker: An instance of SpoolWorker.
+        """
+        import scraibe_webui.global_var as gv
+        from .pool import ModelPool
+        from .langdetect import configure as configure_language_detection
+        from .vad import configure as configure_vad
+        from .windowed import configure as configure_windowed_diarisation
+        from .eta import configure as configure_eta
+        from .resume import configure as configure_checkpoints
+        from .singleflight import configure as configure_single_flight
+
+        configure_language_detection(config.advanced.get("language_detection"))
+        configure_vad(config.advanced.get("vad"))
+        configure_windowed_diarisation(config.advanced.get("windowed_diarisation"))
+        configure_eta(config.advanced.get("eta"))
+        configure_single_flight(config.advanced.get("single_flight"))
+
+        routing_config = config.advanced.get("model_routing") or {}
+        if routing_config.get("enabled") and gv.MODEL_POOL is None:
+            gv.MODEL_POOL = ModelPool.from_config(routing_config, config.scraibe_params)
+
+        spool_config = config.advanced.get("spool") or {}
+        spool = Spool.from_config(spool_config)
+        configure_checkpoints(config.advanced.get("checkpoints"), spool.path)
+
+        params = {"spool": spool,
+                  "scraibe_params": config.scraibe_params,
+                  "mail_service_params": config.mail,
+                  "poll_interval": spool_config.get("poll_interval") or 1.0}
+        params.update({k: v for k, v in kwargs.items() if v is not None and k != "max_jobs"})
+        return cls(**params)
+
+    def __repr__(self) -> str:
+        return f"SpoolWorker(worker_id={self.worker_id}, spool={self.spool}, jobs_done={self.jobs_done})"
+
+
+def _worker_main(config: Optional[str], cores: Optional[List[int]], overrides: Dict[str, Any],
+                 overlay: Optional[Dict[str, Any]] = None) -> None:
+    """Entry point of a worker process."""
+    if cores is not None:
+        overrides.setdefault("threads_per_model", pin_process(cores))
+
+    from .appconfigloader import AppConfigLoader
+
+    spool_path = overrides.pop("spool_path", None)
+    app_config = AppConfigLoader.load_config(config, **(overlay or {}))
+    if spool_path is not None:
+        overrides["spool"] = Spool.from_config({**(app_config.advanced.get("spool") or {}), "path": spool_path})
+
+    worker = SpoolWorker.from_config(app_config, **overrides)
+    worker.install_signal_handlers()
+    print(f"Worker {worker.worker_id} is processing jobs from {worker.spool.path}"
+          + (f" on cores {cores}" if cores is not None else ""))
+    worker.run_forever(max_jobs=overrides.get("max_jobs"))
+
+
+def run_worker_processes(config: Optional[str] = None, processes: Optional[int] = None, pin: bool = True,
+                         **overrides: Any) -> None:
+    """Run several worker processes, each pinned to its own share of the CPU cores.
+
+    SIGTERM and SIGINT are forwarded to the workers, which finish their current job and stop.
+    The overlay of `advanced.auto_tune` is loaded, or tuned, once before the workers start.
+
+    Args:
+        config (str, optional): Path to the config.yaml loaded by every worker. Defaults to None.
+        processes (int, optional): The number of worker processes. Defaults to `advanced.spool.processes`
+                                   of the config and the overlay, or 1.
+        pin (bool, optional): Whether the workers are pinned to disjoint sets of cores. Defaults to True.
+        **overrides (Any): `spool_path`, `poll_interval`, `threads_per_model` and `max_jobs`.
+    """
+    from .configloader import ConfigLoader
+    from .tune import auto_tune
+
+    overlay = auto_tune(config)
+    if processes is None:
+        advanced = ConfigLoader.load_config(config, **overlay).config.get("advanced") or {}
+        processes = (advanced.get("spool") or {}).get("processes") or 1
+
+    overrides = {k: v for k, v in overrides.items() if v is not None}
+    max_jobs = overrides.pop("max_jobs", None)
+    core_sets = partition_cores(processes) if pin else [None] * max(processes, 1)
+
+    if len(core_sets) == 1:
+        _worker_main(config, core_sets[0], {**overrides, "max_jobs": max_jobs}, overlay)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_worker_main, args=(config, cores, {**overrides, "max_jobs": max_jobs}, overlay),
+                               name=f"scraibe-worker-{i}")
+               for i, cores in enumerate(core_sets)]
+    for worker in workers:
+        worker.start()
+
+    def _forward(signum, frame):
+        for worker in workers:
+            if worker.is_alive():
+                os.kill(worker.pid, signal.SIGTERM)
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, _forward)
+
+    for worker in workers:
+        worker.join()
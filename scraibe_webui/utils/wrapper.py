@@ -11,11 +11,21 @@ Modules:
     scraibe.app.global_var as gv: Contains global variables for the Scraibe app.
 """
 import json
+from weakref import WeakSet
 import gradio as gr
 from tqdm import tqdm
 from typing import Any, Dict, Union, Tuple, List
 
-from scraibe import Scraibe, Transcriber
+from scraibe import Scraibe, Transcriber, Transcript
+
+from .metrics import time_stage, VAD_SKIPPED_RATIO, VAD_SKIPPED_SECONDS_TOTAL
+from .tracing import span
+from .media import media_hash
+from .langdetect import get_detector
+from .vad import get_vad
+from .windowed import get_windowed_diariser
+from .batching import transcribe_batch
+from .cancel import checkpoint, JobCancelled
 
 class ScraibeWrapper:
     """
@@ -26,7 +36,13 @@ class ScraibeWrapper:
 
     Attributes:
         model (Scraibe): The Scraibe model for performing transcription tasks.
+        instances (WeakSet): All ScraibeWrapper objects which are currently alive.
+        model_class (type): The class used by `load_from_dict` to create the model. Can be replaced
+                            by a stub backend for benchmarks and load tests.
     """
+    
+    instances = WeakSet()
+    model_class = Scraibe
 
     def __init__(self, model) -> None:
         """
@@ -39,6 +55,7 @@ class ScraibeWrapper:
         """
             
         self.model = model
+        ScraibeWrapper.instances.add(self)
 
     def autotranscribe(self, source: Union[str, List[str]],
                         num_speakers: int,
@@ -68,7 +85,7 @@ class ScraibeWrapper:
         }
         if isinstance(source, str):
             try:
-                result = self.model.autotranscribe(source, **_kwargs)
+                result = self.autotranscribe_file(source, **_kwargs)
             except ValueError:
                 raise gr.Error("Couldn't detect any speech in the provided audio. \
                         Please try again!")
@@ -80,7 +97,8 @@ class ScraibeWrapper:
             result = []
             for s in tqdm(source, total=len(source),desc = "Transcribing audio files"):
                 try:
-                    res = self.model.autotranscribe(s, **_kwargs)
+                    with span("file", file=s.split("/")[-1]):
+                        res = self.autotranscribe_file(s, **_kwargs)
                 except ValueError:
                     _name = s.split("/")[-1]
                     res = f"NO TRANSCRIPT FOUND FOR {_name}"
@@ -130,7 +148,7 @@ class ScraibeWrapper:
         }
     
         if isinstance(source, str):
-            result = self.model.transcribe(source, **_kwargs)
+            result = self.transcribe_file(source, **_kwargs)
 
             return str(result)
         
@@ -138,7 +156,8 @@ class ScraibeWrapper:
             source_names = [s.split("/")[-1] for s in source]
             result = []
             for s in tqdm(source, total=len(source),desc = "Transcribing audio files"):
-                res = self.model.transcribe(s, **_kwargs)
+                with span("file", file=s.split("/")[-1]):
+                    res = self.transcribe_file(s, **_kwargs)
                 result.append(res)
             
             out = ''
@@ -177,7 +196,7 @@ class ScraibeWrapper:
         
         if isinstance(source, str):
             try:
-                result = self.model.diarization(source, **_kwargs)
+                result = self.diarise_file(source, **_kwargs)
             except ValueError:
                 raise gr.Error("Couldn't detect any speech in the provided audio. \
                         Please try again!")
@@ -188,7 +207,8 @@ class ScraibeWrapper:
             result = []
             for s in tqdm(source, total=len(source),desc = "Performing diarisation"):
                 try:
-                    res = self.model.diarization(s, **_kwargs)
+                    with span("file", file=s.split("/")[-1]):
+                        res = self.diarise_file(s, **_kwargs)
                 except ValueError:
     
                     res = f"NO DIARISATION FOUND FOR {s}"
@@ -205,6 +225,226 @@ class ScraibeWrapper:
         else:
             gr.Error("Please provide a valid audio file.")
     
+    def decode(self, source: str):
+        """
+        Decodes a media file into a mono waveform.
+
+        Args:
+            source (str): The path to the media file.
+
+        Returns:
+            AudioProcessor: The decoded audio.
+        """
+        checkpoint()
+        with time_stage("decode"):
+            return self.model.get_audio_file(source)
+
+    def strip_silence(self, audio: Any) -> Tuple[Any, Any]:
+        """
+        Removes the regions without speech from decoded audio, if the voice activity filter is enabled.
+
+        Args:
+            audio (AudioProcessor): The decoded audio.
+
+        Returns:
+            Tuple[AudioProcessor, Union[SpeechMap, None]]: The audio with only the speech and the map
+                back to the original times, or the unchanged audio and None if nothing was removed.
+        """
+        vad = get_vad()
+        if vad is None:
+            return audio, None
+
+        with time_stage("vad") as stage:
+            audio, speech_map = vad.strip(audio)
+            skipped = speech_map.skipped_fraction if speech_map is not None else 0.0
+            if stage.span is not None:
+                stage.span.attributes["skipped_fraction"] = round(skipped, 4)
+
+        VAD_SKIPPED_RATIO.observe(skipped)
+        if speech_map is not None:
+            VAD_SKIPPED_SECONDS_TOTAL.inc(speech_map.duration - speech_map.kept)
+        return audio, speech_map
+
+    def diarise_audio(self, audio: Any, **kwargs: Dict[str, Any]) -> dict:
+        """
+        Performs diarisation on decoded audio.
+
+        Long audio is diarised window by window if windowed diarisation is enabled.
+
+        Args:
+            audio (AudioProcessor): The decoded audio.
+            **kwargs (Dict[str, Any]): Keyword arguments for the diarisation.
+
+        Returns:
+            dict: The speakers and segments found by the diarisation.
+        """
+        checkpoint()
+        windowed = get_windowed_diariser()
+        if windowed is not None and windowed.applies(self.model.diariser, audio):
+            with time_stage("diarisation", windowed=True):
+                return windowed.diarise(self.model.diariser, audio, device=self.model.device, **kwargs)
+
+        dia_audio = {
+            "waveform": audio.waveform.reshape(1, len(audio.waveform)).to(self.model.device),
+            "sample_rate": audio.sr
+        }
+        with time_stage("diarisation"):
+            return self.model.diariser.diarization(dia_audio, **kwargs)
+
+    def detect_language(self, source: str, audio: Any = None) -> Union[str, None]:
+        """
+        Detects the language of a media file on a short sample, if language detection is enabled.
+
+        The result is cached by the hash of the media, so later calls for the same content,
+        e.g. from other chunk workers or re-runs, do not detect it again.
+
+        Args:
+            source (str): The path to the media file.
+            audio (AudioProcessor, optional): The decoded audio. Decoded from `source` if not given.
+
+        Returns:
+            Union[str, None]: The name of the language or None if detection is disabled.
+        """
+        detector = get_detector()
+        if detector is None:
+            return None
+
+        key = media_hash(source)
+        language = detector.cached(key)
+        if language is None:
+            if audio is None:
+                audio = self.decode(source)
+            with time_stage("language_detection"):
+                language = detector.detect(self.model.transcriber, audio)
+            detector.store(key, language)
+        return language
+
+    def autotranscribe_file(self, source: str, **kwargs: Dict[str, Any]) -> Transcript:
+        """
+        Performs diarisation and transcription on a single file.
+
+        This follows `Scraibe.autotranscribe` but runs the decoding, diarisation and
+        transcription as separate stages, so each of them can be timed. If the voice activity
+        filter is enabled, only the speech is processed and the segment times are mapped back
+        to the original media.
+
+        Args:
+            source (str): The path to the media file.
+            **kwargs (Dict[str, Any]): Keyword arguments for the diarisation and transcription.
+
+        Returns:
+            Transcript: The diarised transcript.
+        """
+        decoded = self.decode(source)
+        audio, speech_map = self.strip_silence(decoded)
+        if kwargs.get("language") is None:
+            # detect once instead of in every segment
+            kwargs["language"] = self.detect_language(source, audio)
+        diarisation = self.diarise_audio(audio, **kwargs)
+
+        with time_stage("transcription"):
+            if not diarisation["segments"]:
+                # no speakers found, transcribe the whole file as a single speaker
+                text = self.model.transcriber.transcribe(audio.waveform, **kwargs)
+                # like `Scraibe.autotranscribe`, the segment spans the samples of the media
+                return Transcript({0: {"speakers": 'SPEAKER_01',
+                                       "segments": [0, len(decoded.waveform)],
+                                       "text": text}})
+
+            final_transcript = {}
+            for i, seg in enumerate(diarisation["segments"]):
+                checkpoint()
+                text = self.model.transcriber.transcribe(audio.cut(seg[0], seg[1]), **kwargs)
+                final_transcript[i] = {"speakers": diarisation["speakers"][i],
+                                       "segments": speech_map.remap(seg) if speech_map is not None else seg,
+                                       "text": text}
+
+        return Transcript(final_transcript)
+
+    def transcribe_file(self, source: str, **kwargs: Dict[str, Any]) -> str:
+        """
+        Performs transcription on a single file.
+
+        Args:
+            source (str): The path to the media file.
+            **kwargs (Dict[str, Any]): Keyword arguments for the transcription.
+
+        Returns:
+            str: The transcribed text.
+        """
+        audio, _ = self.strip_silence(self.decode(source))
+        if kwargs.get("language") is None:
+            kwargs["language"] = self.detect_language(source, audio)
+
+        checkpoint()
+        with time_stage("transcription"):
+            return self.model.transcriber.transcribe(audio.waveform, **kwargs)
+
+    def transcribe_batch(self, sources: List[str],
+                         translate: bool,
+                         language: str) -> List[Union[str, Exception]]:
+        """
+        Transcribes several short files with one batched inference call where the backend supports it.
+
+        This is used for batches of short jobs of different users, so a file which fails does
+        not fail the others. Files are batched per language; without a language and language
+        detection they are transcribed one by one.
+
+        Args:
+            sources (List[str]): The paths to the media files.
+            translate (bool): Whether to translate the transcriptions.
+            language (str): The language of the files.
+
+        Returns:
+            List[Union[str, Exception]]: The transcript of every file or the exception it failed with.
+        """
+        _kwargs = {
+            "language": language if language != "Unspecified" else None,
+            "task": 'translate' if translate else 'transcribe'
+        }
+
+        results = [None] * len(sources)
+        groups = {} # language -> [(index, audio)]
+        for i, s in enumerate(sources):
+            try:
+                with span("file", file=s.split("/")[-1]):
+                    audio, _ = self.strip_silence(self.decode(s))
+                    _language = _kwargs["language"] or self.detect_language(s, audio)
+                groups.setdefault(_language, []).append((i, audio))
+            except JobCancelled:
+                raise
+            except Exception as e:
+                results[i] = e
+
+        with time_stage("transcription", files=len(sources)):
+            for _language, items in groups.items():
+                checkpoint()
+                texts = transcribe_batch(self.model.transcriber,
+                                         [audio.waveform for _, audio in items],
+                                         items[0][1].sr,
+                                         **{**_kwargs, "language": _language})
+                for (i, _), text in zip(items, texts):
+                    results[i] = text
+        return results
+
+    def diarise_file(self, source: str, **kwargs: Dict[str, Any]) -> dict:
+        """
+        Performs diarisation on a single file.
+
+        Args:
+            source (str): The path to the media file.
+            **kwargs (Dict[str, Any]): Keyword arguments for the diarisation.
+
+        Returns:
+            dict: The speakers and segments found by the diarisation.
+        """
+        audio, speech_map = self.strip_silence(self.decode(source))
+        diarisation = self.diarise_audio(audio, **kwargs)
+
+        if speech_map is not None:
+            diarisation["segments"] = [speech_map.remap(seg) for seg in diarisation["segments"]]
+        return diarisation
+
     def get_task_from_str(self, task: str) -> callable:
         """
         Returns the corresponding task function based on the given task string.
@@ -236,6 +476,20 @@ class ScraibeWrapper:
         
         self.model.transcriber = Transcriber.load_model(model, **kwargs)
     
+    @property
+    def model_name(self) -> str:
+        """ The name of the loaded Whisper model. """
+        return getattr(self.model.transcriber, 'model_name', str(self.model.transcriber))
+    
+    @classmethod
+    def get_loaded_models(cls) -> List[str]:
+        """ Get the names of the Whisper models which are currently held in memory.
+        
+        Returns:
+            List[str]: The model names of all alive ScraibeWrapper objects.
+        """
+        return [w.model_name for w in list(cls.instances)]
+    
     @classmethod
     def load_from_dict(cls, config: Dict[str, Any]) -> 'ScraibeWrapper':
         """ Load the ScraibeWrapper from a dictionary configuration.
@@ -247,7 +501,7 @@ class ScraibeWrapper:
             ScraibeWrapper: The ScraibeWrapper object.
         
         """
-        model = Scraibe(**config)
+        model = cls.model_class(**config)
         
         return cls(model)
 
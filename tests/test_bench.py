@@ -0,0 +1,47 @@
+import pytest
+
+from scraibe_webui.utils.bench import compare_results, run_benchmarks
+from scraibe_webui.utils.configloader import ConfigLoader
+from scraibe_webui.utils.mail import MailService
+from scraibe_webui.utils.stub import SMTPSink
+
+
+@pytest.fixture
+def bench(request):
+    """The `benchmark` fixture of pytest-benchmark, run with `pytest tests/test_bench.py`."""
+    pytest.importorskip("pytest_benchmark")
+    return request.getfixturevalue("benchmark")
+
+
+@pytest.fixture
+def mail(tmp_path):
+    transcript = tmp_path / "transcript.txt"
+    transcript.write_text("lorem ipsum dolor sit amet " * 2500, encoding="utf-8")
+    with SMTPSink() as sink:
+        service = MailService.from_config(sink.mail_config())
+        yield service, str(transcript), sink
+        if service.mailserver:
+            service.mailserver.quit()
+
+
+def test_config_load(bench):
+    bench(ConfigLoader.load_config)
+
+
+def test_mail_build_message(bench, mail):
+    service, transcript, _ = mail
+    bench(lambda: service.setup_message("Bench", "user@localhost", "<p>Bench</p>", [transcript]).as_string())
+
+
+def test_mail_send_transcript(bench, mail):
+    service, transcript, sink = mail
+    bench(service.send_transcript, "user@localhost", transcript)
+    assert sink.messages
+
+
+def test_bench_command_results():
+    result = run_benchmarks(["config"], rounds=3)
+    names = [benchmark["name"] for benchmark in result["benchmarks"]]
+    assert names == ["config_load"]
+    assert result["benchmarks"][0]["stats"]["ops"] > 0
+    assert [c["ratio"] for c in compare_results(result, result)] == [1.0]
@@ -0,0 +1,28 @@
+from scraibe_webui.utils.eta import RTFStore
+
+
+def test_processes_sharing_the_file_keep_each_others_samples(tmp_path):
+    path = str(tmp_path / "rtf.json")
+    cpu = RTFStore(path=path, hardware="cpu:8")
+    gpu = RTFStore(path=path, hardware="cuda:A100") # loaded before the first one saved
+
+    cpu.record("medium", "Transcribe", 0.5)
+    gpu.record("medium", "Transcribe", 0.1)
+    cpu.record("medium", "Transcribe", 0.7)
+
+    restarted = RTFStore(path=path, hardware="cpu:8")
+    assert restarted.estimate("medium", "Transcribe") == 0.6
+    assert RTFStore(path=path, hardware="cuda:A100").estimate("medium", "Transcribe") == 0.1
+    # a save loads the samples other processes saved meanwhile
+    assert gpu._samples.keys() == restarted._samples.keys()
+
+
+def test_workers_on_the_same_hardware_share_the_window(tmp_path):
+    path = str(tmp_path / "rtf.json")
+    first, second = RTFStore(window=3, path=path, hardware="cpu:8"), RTFStore(window=3, path=path, hardware="cpu:8")
+    for rtf in (1.0, 2.0):
+        first.record("tiny", "Transcribe", rtf)
+        second.record("tiny", "Transcribe", rtf + 2)
+
+    # the last three of 1, 3, 2, 4 in the order they were saved
+    assert list(RTFStore(window=3, path=path, hardware="cpu:8")._samples["tiny|Transcribe|cpu:8"]) == [3.0, 2.0, 4.0]
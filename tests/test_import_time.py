@@ -0,0 +1,31 @@
+import os
+import json
+import subprocess
+import sys
+
+HEAVY_MODULES = ("gradio", "scraibe", "torch")
+
+IMPORT_BUDGET = 2.0 # seconds, the heavy modules alone take far longer
+
+# runs `python -m scraibe_webui.cli version` and reports what it imported
+SCRIPT = """
+import json, runpy, sys
+from time import perf_counter
+start = perf_counter()
+sys.argv = ["scraibe-webui", "version"]
+runpy.run_module("scraibe_webui.cli", run_name="__main__", alter_sys=True)
+print(json.dumps({"elapsed": perf_counter() - start,
+                  "loaded": [name for name in %r if name in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def test_version_command_does_not_import_heavy_modules():
+    # a fresh interpreter, the tests may already have imported them
+    output = subprocess.run([sys.executable, "-c", SCRIPT], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout
+    lines = output.strip().splitlines()
+    result = json.loads(lines[-1])
+
+    assert lines[0].startswith("Scraibe WebUI CLI version")
+    assert result["loaded"] == []
+    assert result["elapsed"] < IMPORT_BUDGET
@@ -0,0 +1,22 @@
+import scraibe_webui.global_var as gv
+from scraibe_webui.utils import metrics
+from scraibe_webui.utils.metrics import Counter, queue_depth
+
+
+class FakeSpool:
+    def depth(self):
+        return 7
+
+
+def test_label_values_are_escaped(monkeypatch):
+    monkeypatch.setattr(metrics, "_enabled", True)
+    counter = Counter("scraibe_test_total", "Test.", ("tenant",))
+    counter.inc(tenant='a "b"\\c\nd')
+
+    assert 'scraibe_test_total{tenant="a \\"b\\"\\\\c\\nd"} 1' in counter.render()
+
+
+def test_queue_depth_counts_the_spool(monkeypatch):
+    monkeypatch.setattr(gv, "SPOOL", FakeSpool())
+    assert queue_depth() == 7
+    assert "scraibe_queue_depth 7" in metrics.QUEUE_DEPTH.render()
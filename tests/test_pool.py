@@ -0,0 +1,56 @@
+from threading import Event, Thread
+
+import pytest
+
+pytest.importorskip("scraibe")
+
+import scraibe_webui.utils.pool as pool_module
+from scraibe_webui.utils.pool import ModelPool
+
+from test_scheduler import wait_for
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    """Loads models by name, "large" blocks until `release` is set."""
+    release, started = Event(), []
+
+    def load_from_dict(params):
+        started.append(params["whisper_model"])
+        if params["whisper_model"] == "large":
+            release.wait(5)
+        return params["whisper_model"]
+
+    monkeypatch.setattr(pool_module.ScraibeWrapper, "load_from_dict", load_from_dict)
+    return release, started
+
+
+def test_resident_model_is_served_while_another_loads(loads):
+    release, started = loads
+    pool = ModelPool({"whisper_model": "small"})
+    assert pool.get("small") == "small"
+
+    loading = Thread(target=pool.get, args=("large",))
+    loading.start()
+    wait_for(lambda: "large" in started)
+    try:
+        assert pool.get("small") == "small" # not blocked by the load of "large"
+    finally:
+        release.set()
+        loading.join(5)
+
+
+def test_concurrent_requests_load_a_model_once(loads):
+    release, started = loads
+    pool = ModelPool({"whisper_model": "small"})
+    results = []
+    threads = [Thread(target=lambda: results.append(pool.get("large"))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: "large" in started)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert started == ["large"]
+    assert results == ["large"] * 3
@@ -0,0 +1,47 @@
+import os
+from threading import Event, Thread
+
+import pytest
+
+from scraibe_webui.utils.profiling import JobProfiler
+
+
+def busy(n=20000):
+    return sum(i * i for i in range(n))
+
+
+def test_concurrent_cprofile_jobs_do_not_fail(tmp_path):
+    profiler = JobProfiler(output_dir=str(tmp_path), mode="cprofile")
+    inside, release, errors = Event(), Event(), []
+
+    def first():
+        try:
+            with profiler.profile("first"):
+                inside.set()
+                release.wait(5)
+                busy()
+        except Exception as e:
+            errors.append(e)
+
+    thread = Thread(target=first)
+    thread.start()
+    assert inside.wait(5)
+    with profiler.profile("second"): # sampled, cProfile is taken by the first job
+        busy()
+    release.set()
+    thread.join(5)
+
+    assert errors == []
+    assert sorted(os.listdir(tmp_path)) == ["first.collapsed", "first.prof", "second.collapsed"]
+
+    with profiler.profile("third"): # cProfile is free again
+        busy()
+    assert os.path.exists(tmp_path / "third.prof")
+
+
+def test_failed_write_does_not_fail_the_job(tmp_path):
+    profiler = JobProfiler(output_dir=str(tmp_path / "profiles"), mode="sampler")
+    os.rmdir(tmp_path / "profiles")
+    with pytest.warns(UserWarning, match="Could not write the profile"):
+        with profiler.profile("job"):
+            busy()
@@ -0,0 +1,185 @@
+import os
+
+import pytest
+
+import scraibe_webui.utils.resume as resume
+from scraibe_webui.utils.resume import CheckpointStore, PartialResultError
+
+
+def media(tmp_path, count=3):
+    paths = []
+    for i in range(count):
+        path = tmp_path / "media" / f"part{i}.wav"
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"audio")
+        paths.append(str(path))
+    return paths
+
+
+def result_of(source, text="transcript"):
+    path = f"{os.path.splitext(source)[0]}.txt"
+    with open(path, "w") as f:
+        f.write(f"{text} of {os.path.basename(source)}")
+    return path
+
+
+def test_job_resumes_after_the_finished_files(tmp_path):
+    sources = media(tmp_path)
+    store = CheckpointStore(str(tmp_path / "checkpoints"))
+    result = result_of(sources[0])
+    store.save("job", 0, sources[0], [result])
+    os.remove(result) # the worker removes its temporary results, the checkpoint keeps a copy
+
+    # e.g. a new worker after a crash
+    finished = CheckpointStore(str(tmp_path / "checkpoints")).load("job", sources)
+
+    assert list(finished) == [0]
+    assert next(i for i in range(len(sources)) if i not in finished) == 1
+    [path] = finished[0]
+    assert os.path.basename(path) == "part0.txt"
+    with open(path) as f:
+        assert f.read() == "transcript of part0.wav"
+
+
+def test_checkpoint_only_counts_the_same_media_with_all_results(tmp_path):
+    sources = media(tmp_path)
+    store = CheckpointStore(str(tmp_path / "checkpoints"))
+    store.save("job", 0, sources[0], [result_of(sources[0])])
+    store.save("job", 1, sources[1], [result_of(sources[1])])
+
+    # another file at index 0, and a result file of index 1 which got lost
+    renamed = [str(tmp_path / "other.wav")] + sources[1:]
+    os.remove(os.path.join(store.path, "job", "1", "part1.txt"))
+    assert store.load("job", renamed) == {}
+    assert store.load("job", sources[:1]) == {0: [os.path.join(store.path, "job", "0", "part0.txt")]}
+
+    store.clear("job")
+    assert store.load("job", sources) == {}
+    assert store.load("unknown", sources) == {}
+
+
+def test_saving_a_file_again_replaces_its_entry(tmp_path):
+    sources = media(tmp_path)
+    store = CheckpointStore(str(tmp_path / "checkpoints"))
+    store.save("job", 2, sources[2], [result_of(sources[2], "first")])
+    store.save("job", 2, sources[2], [result_of(sources[2], "second")])
+
+    [path] = store.load("job", sources)[2]
+    with open(path) as f:
+        assert f.read() == "second of part2.wav"
+    assert len(store._read("job")) == 1
+
+
+def test_checkpoints_default_to_the_spool(tmp_path):
+    assert resume.configure({"enabled": False}, spool_path=str(tmp_path)) is None
+    assert resume.get_checkpoint_store() is None
+
+    store = resume.configure({"enabled": True, "retries": 2, "partial_results": True}, spool_path=str(tmp_path))
+    try:
+        assert store is resume.get_checkpoint_store()
+        assert store.path == str(tmp_path / "checkpoints")
+        assert (store.retries, store.partial_results) == (2, True)
+    finally:
+        resume.configure(None)
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    """A BackgroundThread whose files fail as often as `failures[name]` says."""
+    pytest.importorskip("scraibe")
+    import scraibe_webui.utils.background as background
+
+    calls, mails, failures = [], [], {}
+
+    class FakeMailService:
+        @classmethod
+        def from_config(cls, params):
+            return cls()
+
+        def send_transcript(self, receiver_email, transcript_paths, **kwargs):
+            contents = []
+            for path in transcript_paths:
+                with open(path) as f:
+                    contents.append(f.read())
+            mails.append(("transcript", contents))
+
+        def send_error_notification(self, receiver_email, exception_message, **kwargs):
+            mails.append(("error", exception_message))
+
+    def process_file(self, _scraibe, audio, *args, **kwargs):
+        name = os.path.basename(audio)
+        calls.append(name)
+        if failures.get(name, 0):
+            failures[name] -= 1
+            raise RuntimeError(f"{name} failed")
+        return [result_of(audio)]
+
+    class Pipe:
+        model_name = "tiny"
+
+    monkeypatch.setattr(background, "MailService", FakeMailService)
+    monkeypatch.setattr(background.BackgroundThread, "process_file", process_file)
+    thread = background.BackgroundThread({}, {"whisper_model": "tiny"}, threads_per_model=None, pipe=Pipe())
+    return thread, calls, mails, failures
+
+
+def run(thread, sources):
+    return thread.parrallel_task(sources, "user@example.com", "Transcribe", None, False, "english",
+                                 job_id="job")
+
+
+def test_resumed_job_mails_the_checkpointed_results(tmp_path, runner):
+    thread, calls, mails, _ = runner
+    sources = media(tmp_path)
+    store = resume.configure({"enabled": True, "path": str(tmp_path / "checkpoints")})
+    try:
+        store.save("job", 0, sources[0], [result_of(sources[0], "before the crash")])
+
+        assert run(thread, sources) is None
+        assert calls == ["part1.wav", "part2.wav"]
+        assert mails == [("transcript", ["before the crash of part0.wav", "transcript of part1.wav",
+                                         "transcript of part2.wav"])]
+        assert store.load("job", sources) == {} # cleared once the job is done
+    finally:
+        resume.configure(None)
+
+
+def test_failed_file_is_tried_again(tmp_path, runner):
+    thread, calls, mails, failures = runner
+    sources = media(tmp_path, count=2)
+    resume.configure({"enabled": True, "path": str(tmp_path / "checkpoints"), "retries": 2})
+    try:
+        failures["part1.wav"] = 2
+        with pytest.warns(UserWarning, match="trying again"):
+            assert run(thread, sources) is None
+        assert calls == ["part0.wav", "part1.wav", "part1.wav", "part1.wav"]
+        assert mails[0][0] == "transcript"
+
+        # one failure more than retries fails the job
+        calls.clear()
+        mails.clear()
+        failures["part1.wav"] = 3
+        with pytest.warns(UserWarning, match="trying again"):
+            error = run(thread, sources)
+        assert isinstance(error, RuntimeError)
+        assert calls == ["part0.wav"] + ["part1.wav"] * 3
+        assert [kind for kind, _ in mails] == ["error"]
+    finally:
+        resume.configure(None)
+
+
+def test_partial_results_mail_the_other_files(tmp_path, runner):
+    thread, calls, mails, failures = runner
+    sources = media(tmp_path)
+    resume.configure({"enabled": True, "path": str(tmp_path / "checkpoints"), "partial_results": True})
+    try:
+        failures["part1.wav"] = 1
+        error = run(thread, sources)
+
+        assert isinstance(error, PartialResultError)
+        assert [name for name, _ in error.failed] == ["part1.wav"]
+        assert error.total == 3
+        assert mails[0] == ("transcript", ["transcript of part0.wav", "transcript of part2.wav"])
+        assert mails[1] == ("error", error)
+    finally:
+        resume.configure(None)
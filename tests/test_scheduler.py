@@ -0,0 +1,128 @@
+from time import sleep, time
+from threading import Event
+
+import pytest
+
+import scraibe_webui.utils.scheduler as scheduler
+from scraibe_webui.utils.scheduler import JobScheduler
+
+
+class FakeRunner:
+    """Records the jobs it is given instead of running a model."""
+    scraibe_kwargs = {"whisper_model": "tiny"}
+    threads_per_model = None
+    mail_service_params = {}
+
+    def __init__(self):
+        self.batches = []
+        self.done = Event()
+
+    def parrallel_batch(self, jobs):
+        self.batches.append([job["job_id"] for job in jobs])
+        self.done.set()
+
+    def parrallel_task(self, *args, **kwargs):
+        self.batches.append([kwargs["job_id"]])
+        self.done.set()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time() + timeout
+    while not condition():
+        if time() > deadline:
+            raise AssertionError("timed out")
+        sleep(0.01)
+
+
+@pytest.fixture
+def batching_scheduler(monkeypatch, tmp_path):
+    # short clips, so both jobs are batched
+    monkeypatch.setattr(scheduler, "get_total_duration", lambda audio: 10.0)
+    jobs = JobScheduler(workers=1, max_batch=4, window=1.0, job_timeout=60).start()
+    yield jobs, [str(tmp_path / f"{i}.wav") for i in range(2)]
+    jobs.stop()
+
+
+def submit(jobs, runner, audio):
+    return jobs.submit(runner, audio, "user@example.com", "Transcribe", None, False, "english")
+
+
+def test_watchdog_survives_batch_window(batching_scheduler):
+    jobs, audio = batching_scheduler
+    runner = FakeRunner()
+    first = submit(jobs, runner, audio[0])
+    wait_for(lambda: "started_at" in first)
+    submit(jobs, runner, audio[1])
+
+    assert runner.done.wait(5)
+    assert runner.batches == [[first["job_id"], runner.batches[0][1]]]
+    assert jobs._watchdog.is_alive()
+
+
+def test_cancel_during_batch_window(batching_scheduler):
+    jobs, audio = batching_scheduler
+    runner = FakeRunner()
+    first = submit(jobs, runner, audio[0])
+    wait_for(lambda: "started_at" in first)
+    second = submit(jobs, runner, audio[1])
+    wait_for(lambda: "started_at" in second)
+
+    assert jobs.cancel(first["job_id"], notify=False)
+    assert jobs.cancel(second["job_id"], notify=False)
+    assert jobs._watchdog.is_alive()
+    wait_for(lambda: jobs.depth() == 0)
+    assert first["token"].cancelled
+
+
+def test_drain_during_batch_window(batching_scheduler):
+    jobs, audio = batching_scheduler
+    runner = FakeRunner()
+    first = submit(jobs, runner, audio[0])
+    wait_for(lambda: "started_at" in first)
+
+    unfinished = jobs.drain(timeout=0)
+    assert [job["job_id"] for job in unfinished] == [first["job_id"]]
+
+
+def test_timed_out_job_keeps_its_worker(monkeypatch, tmp_path):
+    monkeypatch.setattr(scheduler, "get_total_duration", lambda audio: 10.0)
+    jobs = JobScheduler(workers=1, job_timeout=0.2).start()
+    release, started = Event(), []
+
+    class BlockingRunner(FakeRunner):
+        def parrallel_task(self, *args, **kwargs):
+            started.append(kwargs["job_id"])
+            release.wait(5) # a stage which never reaches a checkpoint
+
+    runner = BlockingRunner()
+    first = submit(jobs, runner, str(tmp_path / "0.wav"))
+    second = submit(jobs, runner, str(tmp_path / "1.wav"))
+    wait_for(lambda: "token" in first and first["token"].reason is not None)
+    sleep(0.3)
+
+    # the cancelled job is still running, no second worker may start the next job
+    assert started == [first["job_id"]]
+    assert len(jobs._threads) == 1
+
+    release.set()
+    wait_for(lambda: started == [first["job_id"], second["job_id"]])
+    jobs.stop()
+
+
+def test_cancel_does_not_wait_for_the_mail(monkeypatch, tmp_path):
+    release, sent = Event(), Event()
+
+    def send_error_notification(self, **kwargs):
+        release.wait(5) # a slow SMTP server
+        sent.set()
+
+    monkeypatch.setattr(scheduler, "get_total_duration", lambda audio: 10.0)
+    monkeypatch.setattr(scheduler.MailService, "send_error_notification", send_error_notification)
+    jobs = JobScheduler(workers=1) # not started, the job stays queued
+    job = submit(jobs, FakeRunner(), str(tmp_path / "0.wav"))
+
+    started = time()
+    assert jobs.cancel(job["job_id"], notify=True)
+    assert time() - started < 1
+    release.set()
+    assert sent.wait(5)
@@ -0,0 +1,78 @@
+import os
+from threading import Event, Timer
+
+import pytest
+
+import scraibe_webui.global_var as gv
+import scraibe_webui.utils.scheduler as scheduler
+from scraibe_webui.utils.cancel import checkpoint
+from scraibe_webui.utils.scheduler import JobScheduler
+from scraibe_webui.utils.shutdown import GracefulShutdown, JobJournal
+
+from test_scheduler import FakeRunner, submit, wait_for
+
+
+class SlowRunner(FakeRunner):
+    """Runs until it is released, then checks for cancellation if `checks` is set."""
+    def __init__(self, checks):
+        super().__init__()
+        self.checks = checks
+        self.started = Event()
+        self.release = Event()
+
+    def parrallel_task(self, *args, **kwargs):
+        self.started.set()
+        self.release.wait(5)
+        if self.checks:
+            checkpoint()
+
+
+@pytest.fixture
+def shutdown(monkeypatch, tmp_path):
+    monkeypatch.setattr(scheduler, "get_total_duration", lambda audio: 10.0)
+    monkeypatch.setattr(gv, "SCHEDULER", JobScheduler(workers=1).start())
+    monkeypatch.setattr(gv, "DRAINING", False)
+    audio = tmp_path / "a.wav"
+    audio.write_bytes(b"RIFF")
+    yield GracefulShutdown(timeout=0.1, grace=5, journal=JobJournal(str(tmp_path / "journal"))), str(audio)
+    gv.SCHEDULER.stop()
+
+
+def test_job_finishing_in_the_grace_period_is_not_restored(shutdown):
+    drain, audio = shutdown
+    runner = SlowRunner(checks=False) # past its last checkpoint
+    job = submit(gv.SCHEDULER, runner, audio)
+    assert runner.started.wait(5)
+
+    Timer(0.3, runner.release.set).start()
+    # the drain waits for the stopped job, it finishes and is removed from the journal again
+    assert [saved["job_id"] for saved in drain.drain()] == [job["job_id"]]
+    assert job.get("released")
+    assert os.listdir(drain.journal.path) == []
+
+
+def test_job_stopped_by_the_drain_is_restored(shutdown):
+    drain, audio = shutdown
+    runner = SlowRunner(checks=True)
+    job = submit(gv.SCHEDULER, runner, audio)
+    assert runner.started.wait(5)
+
+    Timer(0.3, runner.release.set).start()
+    drain.drain()
+    assert job.get("released")
+    assert os.listdir(drain.journal.path) == [job["job_id"]]
+
+
+def test_job_running_past_the_grace_period_stays_journaled(shutdown):
+    drain, audio = shutdown
+    drain.grace = 0.1
+    runner = SlowRunner(checks=False)
+    job = submit(gv.SCHEDULER, runner, audio)
+    assert runner.started.wait(5)
+
+    with pytest.warns(UserWarning, match="did not reach their next checkpoint"):
+        drain.drain()
+    assert os.listdir(drain.journal.path) == [job["job_id"]]
+
+    runner.release.set()
+    wait_for(lambda: not os.listdir(drain.journal.path))
@@ -0,0 +1,129 @@
+from threading import Event, Thread
+
+import pytest
+
+import scraibe_webui.global_var as gv
+import scraibe_webui.utils.scheduler as scheduler
+import scraibe_webui.utils.singleflight as singleflight
+from scraibe_webui.utils.scheduler import JobScheduler
+from scraibe_webui.utils.singleflight import flight_key, run_once
+
+from test_scheduler import FakeRunner, submit, wait_for
+
+
+@pytest.fixture
+def media(tmp_path):
+    singleflight.configure({"enabled": True})
+    audio = tmp_path / "a.wav"
+    audio.write_bytes(b"RIFF")
+    yield str(audio)
+    singleflight.configure(None)
+
+
+def blocking(release, result):
+    def compute():
+        release.wait(5)
+        return result
+    return compute
+
+
+def test_follower_is_told_it_was_coalesced(media):
+    release, results = Event(), {}
+    compute = blocking(release, "transcript")
+    flights = singleflight.get_single_flight()._flights
+
+    leader = Thread(target=lambda: results.setdefault("leader", run_once(media, compute, model="tiny")))
+    leader.start()
+    wait_for(lambda: flights)
+    follower = Thread(target=lambda: results.setdefault("follower", run_once(media, compute, model="tiny")))
+    follower.start()
+    wait_for(lambda: flights[flight_key(media, model="tiny")].waiters == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert results == {"leader": ("transcript", True), "follower": ("transcript", False)}
+
+
+def test_other_model_is_not_coalesced(media):
+    release = Event()
+    first = Thread(target=run_once, args=(media, blocking(release, "tiny")), kwargs={"model": "tiny"})
+    first.start()
+    try:
+        # a request routed to another model must not get the result of the first one
+        assert run_once(media, lambda: "large", model="large") == ("large", True)
+    finally:
+        release.set()
+        first.join(5)
+
+
+def test_disabled_runs_every_call(media):
+    singleflight.configure(None)
+    assert run_once(media, lambda: "transcript", model="tiny") == ("transcript", True)
+
+
+@pytest.fixture
+def coalescing_scheduler(monkeypatch, media):
+    monkeypatch.setattr(scheduler, "get_total_duration", lambda audio: 10.0)
+    monkeypatch.setattr(gv, "NUMBER_OF_QUEUE", 0)
+    jobs = JobScheduler(workers=1).start()
+    yield jobs
+    jobs.stop()
+
+
+class SealingRunner(FakeRunner):
+    """Takes the followers of its job like `BackgroundThread` and sends them the result once released."""
+    def __init__(self):
+        super().__init__()
+        self.sealed = Event()
+        self.release = Event()
+        self.sent = []
+
+    def parrallel_task(self, *args, **kwargs):
+        followers = kwargs["followers"]()
+        self.sealed.set()
+        self.release.wait(5)
+        self.sent.extend(follower["job_id"] for follower in followers)
+
+
+def keep_busy(jobs, media):
+    """Occupies the only worker, so the next jobs stay queued until `release` is set."""
+    other = media + ".other"
+    with open(other, "wb") as f:
+        f.write(b"RIFF other")
+    runner = SealingRunner()
+    blocker = submit(jobs, runner, other)
+    assert runner.sealed.wait(5)
+    return blocker, runner.release
+
+
+def test_follower_cannot_be_cancelled_after_its_leader_is_sealed(coalescing_scheduler, media):
+    jobs, runner = coalescing_scheduler, SealingRunner()
+    blocker, unblock = keep_busy(jobs, media)
+    leader = submit(jobs, runner, media)
+    follower = submit(jobs, runner, media)
+    gv.NUMBER_OF_QUEUE += 2
+    assert follower["leader"] is leader
+    unblock.set()
+    assert runner.sealed.wait(5)
+
+    assert not jobs.cancel(follower["job_id"], notify=False)
+    runner.release.set()
+    wait_for(lambda: leader.get("released") and blocker.get("released"))
+    # the follower got the result once and is not counted twice
+    assert runner.sent == [follower["job_id"]]
+    assert leader["followers"] == [follower]
+
+
+def test_follower_cancelled_before_the_seal_gets_no_result(coalescing_scheduler, media):
+    jobs, runner = coalescing_scheduler, SealingRunner()
+    blocker, unblock = keep_busy(jobs, media)
+    leader = submit(jobs, runner, media)
+    follower = submit(jobs, runner, media)
+    assert follower["leader"] is leader
+
+    assert jobs.cancel(follower["job_id"], notify=False)
+    unblock.set()
+    runner.release.set()
+    wait_for(lambda: leader.get("released") and blocker.get("released"))
+    assert runner.sent == []
@@ -0,0 +1,111 @@
+import os
+from time import sleep, time
+from threading import Barrier, Event, Thread
+
+from scraibe_webui.utils.spool import Spool
+from scraibe_webui.utils.worker import SpoolWorker
+
+
+def enqueue(spool, tmp_path, name="audio.wav"):
+    source = tmp_path / name
+    source.write_bytes(b"audio")
+    return spool.enqueue(str(source), reciever="user@example.com", task="Transcribe")
+
+
+def running_path(spool, record):
+    return os.path.join(spool.path, "running", record["_name"])
+
+
+def test_only_one_of_two_concurrent_claims_wins(tmp_path):
+    path = str(tmp_path / "spool")
+    enqueue(Spool(path), tmp_path)
+    # two workers, each with its own view of the shared directory
+    workers = [Spool(path), Spool(path)]
+    barrier, claims = Barrier(2), [None, None]
+
+    def claim(i):
+        barrier.wait()
+        claims[i] = workers[i].claim(worker_id=f"worker-{i}")
+
+    threads = [Thread(target=claim, args=(i,)) for i in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    won = [claim for claim in claims if claim is not None]
+    assert len(won) == 1
+    assert won[0]["attempts"] == 1
+    assert os.listdir(os.path.join(path, "pending")) == []
+    assert os.listdir(os.path.join(path, "running")) == [won[0]["_name"]]
+
+
+def test_only_the_stale_job_is_requeued(tmp_path):
+    spool = Spool(str(tmp_path / "spool"), stale_after=60)
+    stale_id = enqueue(spool, tmp_path, "stale.wav")["job_id"]
+    fresh_id = enqueue(spool, tmp_path, "fresh.wav")["job_id"]
+    claimed = {record["job_id"]: record for record in (spool.claim(), spool.claim())}
+    stale, fresh = claimed[stale_id], claimed[fresh_id]
+
+    old = time() - 120
+    os.utime(running_path(spool, stale), (old, old))
+    spool.heartbeat(fresh)
+
+    assert spool.requeue_stale() == [stale_id]
+    assert spool.position(stale_id) == 2 # behind the fresh job which is still running
+    # the next claim counts the attempt
+    assert spool.claim()["attempts"] == 2
+
+
+def test_requeuing_is_disabled_without_stale_after(tmp_path):
+    spool = Spool(str(tmp_path / "spool"), stale_after=None)
+    enqueue(spool, tmp_path)
+    record = spool.claim()
+    old = time() - 3600
+    os.utime(running_path(spool, record), (old, old))
+
+    assert spool.requeue_stale() == []
+
+
+def test_position_counts_the_running_jobs_first(tmp_path):
+    spool = Spool(str(tmp_path / "spool"))
+    ids = []
+    for i in range(3):
+        ids.append(enqueue(spool, tmp_path, f"{i}.wav")["job_id"])
+        sleep(0.002) # the records are ordered by their millisecond timestamp
+    assert [spool.position(job_id) for job_id in ids] == [1, 2, 3]
+
+    claimed = spool.claim()
+    assert claimed["job_id"] == ids[0]
+    # a claimed job has no position in the queue but still counts for the others
+    assert spool.position(ids[0]) is None
+    assert [spool.position(job_id) for job_id in ids[1:]] == [2, 3]
+    assert spool.depth() == 3
+
+    spool.finish(claimed)
+    assert [spool.position(job_id) for job_id in ids[1:]] == [1, 2]
+    assert spool.position("unknown") is None
+
+
+def test_worker_heartbeat_keeps_the_job_from_being_requeued(tmp_path):
+    # the worker beats every stale_after / 3 seconds
+    spool = Spool(str(tmp_path / "spool"), stale_after=0.3)
+    worker = SpoolWorker(spool, scraibe_params={}, mail_service_params={})
+    enqueue(spool, tmp_path)
+    record = spool.claim()
+
+    done = Event()
+    heartbeat = Thread(target=worker._heartbeat, args=(record, done), daemon=True)
+    heartbeat.start()
+    try:
+        for _ in range(5):
+            sleep(0.15)
+            assert spool.requeue_stale() == []
+    finally:
+        done.set()
+        heartbeat.join(1)
+    assert not heartbeat.is_alive()
+
+    # without the heartbeat the job goes stale
+    sleep(0.4)
+    assert spool.requeue_stale() == [record["job_id"]]
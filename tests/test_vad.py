@@ -0,0 +1,62 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from scraibe_webui.utils.vad import SpeechMap, _merge
+
+
+@pytest.fixture
+def speech_map():
+    # stripped 0-3 is original 2-5, stripped 3-5 is original 10-12
+    return SpeechMap([(2, 5), (10, 12)], duration=20)
+
+
+def test_times_inside_a_region_are_shifted(speech_map):
+    assert speech_map.offsets == [0.0, 3.0]
+    assert speech_map.to_original(0) == 2
+    assert speech_map.to_original(1) == 3
+    assert speech_map.to_original(4) == 11
+    assert speech_map.to_original(4, end=True) == 11
+
+
+def test_a_time_at_the_joint_depends_on_whether_it_ends_a_segment(speech_map):
+    # a start belongs to the second region, an end to the first one
+    assert speech_map.to_original(3) == 10
+    assert speech_map.to_original(3, end=True) == 5
+    assert speech_map.remap([1, 3]) == [3, 5]
+    assert speech_map.remap([3, 4]) == [10, 11]
+
+
+def test_times_outside_the_stripped_audio_are_clipped(speech_map):
+    assert speech_map.to_original(-1) == 2
+    assert speech_map.to_original(6) == 12
+    assert speech_map.to_original(6, end=True) == 12
+    assert speech_map.remap([4.5, 7]) == [11.5, 12]
+
+
+def test_an_empty_map_keeps_the_times():
+    speech_map = SpeechMap([], duration=20)
+    assert speech_map.remap([1, 7]) == [1, 7]
+    assert speech_map.skipped_fraction == 1.0
+
+
+def test_merge_closes_short_pauses_drops_short_speech_and_clips():
+    regions = [(1, 2), (2.5, 3), (5, 5.1), (8, 9)]
+    merged = _merge(regions, min_silence=1.0, min_speech=0.25, padding=0.2, duration=9.1)
+
+    # 1-2 and 2.5-3 are joined, 5-5.1 is too short, 8-9 is padded up to the end of the audio
+    assert merged == pytest.approx([(0.8, 3.2), (7.8, 9.1)])
+
+
+def test_merge_keeps_a_pause_of_min_silence():
+    regions = [(1, 2), (3, 4)]
+    assert _merge(regions, min_silence=1.0, min_speech=0, padding=0, duration=10) == [(1, 2), (3, 4)]
+    assert _merge(regions, min_silence=1.01, min_speech=0, padding=0, duration=10) == [(1, 4)]
+
+
+def test_merge_joins_regions_whose_padding_overlaps():
+    regions = [(0.1, 1), (2.2, 3)]
+    merged = _merge(regions, min_silence=1.0, min_speech=0, padding=0.7, duration=10)
+
+    # the padding is clipped at 0 and 1.7 overlaps 1.5
+    assert merged == pytest.approx([(0.0, 3.7)])
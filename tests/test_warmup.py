@@ -0,0 +1,60 @@
+import pytest
+
+import scraibe_webui.global_var as gv
+from scraibe_webui.utils.warmup import preload_models
+
+
+class FakePipe:
+    def __init__(self, name):
+        self.name = name
+        self.model = self
+        self.warmed = 0
+
+    def autotranscribe(self, clip):
+        self.warmed += 1
+        raise ValueError("no speech") # like the synthetic clip
+
+
+class FakePool:
+    """Records the models loaded into it like `ModelPool.get`."""
+    max_models = 2
+    routed_models = ["medium", "small.en", "tiny"]
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.models = {}
+
+    def get(self, model=None):
+        if self.fail:
+            raise RuntimeError("out of memory")
+        return self.models.setdefault(model, FakePipe(model))
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(gv, "READY", False)
+    monkeypatch.setattr(gv, "PRELOAD_FAILED", False)
+    monkeypatch.setattr(gv, "PIPE", None)
+    def install(pool):
+        monkeypatch.setattr(gv, "MODEL_POOL", pool)
+        return pool
+    return install
+
+
+def test_preload_warms_the_models_of_the_pool(pool):
+    models = pool(FakePool()).models
+    preload_models({"whisper_model": "medium"}, keep_model_alive=True)
+
+    assert list(models) == ["medium", "small.en"]
+    assert all(pipe.warmed == 1 for pipe in models.values())
+    assert gv.PIPE is None # requests are served by the pool
+    assert gv.READY and not gv.PRELOAD_FAILED
+
+
+def test_failed_preload_is_not_ready(pool):
+    pool(FakePool(fail=True))
+    with pytest.warns(UserWarning, match="Preloading the models failed"):
+        preload_models({"whisper_model": "medium"})
+
+    assert not gv.READY
+    assert gv.PRELOAD_FAILED
@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import numpy as np
+from scraibe_webui.utils.windowed import WindowedDiariser, _cluster
+
+
+def cluster(embeddings, windows, threshold=0.5, num_speakers=None, weights=None):
+    embeddings = np.array(embeddings, dtype=float)
+    weights = np.ones(len(embeddings)) if weights is None else np.array(weights, dtype=float)
+    return _cluster(embeddings, weights, windows, threshold, num_speakers)
+
+
+def test_the_same_speaker_keeps_the_label_across_windows():
+    # two speakers, each found in both windows with slightly different embeddings
+    embeddings = [[1.0, 0.05, 0.0], [0.0, 1.0, 0.1], [0.95, 0.0, 0.1], [0.1, 0.9, 0.0]]
+    labels = cluster(embeddings, windows=[0, 0, 1, 1])
+
+    assert labels[0] == labels[2]
+    assert labels[1] == labels[3]
+    assert labels[0] != labels[1]
+
+
+def test_speakers_of_the_same_window_are_never_merged():
+    embeddings = [[1.0, 0.0], [1.0, 0.01]] # all but identical
+    assert cluster(embeddings, windows=[0, 0], threshold=2.0) == [0, 1]
+    # not even to reach num_speakers
+    assert cluster(embeddings, windows=[0, 0], num_speakers=1) == [0, 1]
+    assert cluster(embeddings, windows=[0, 1], threshold=0.1) == [0, 0]
+
+
+def test_a_merged_cluster_inherits_the_windows_of_its_members():
+    # 0 and 1 are merged first, 2 shares a window with 1 and must not join them
+    embeddings = [[1.0, 0.0], [1.0, 0.01], [1.0, 0.05]]
+    assert cluster(embeddings, windows=[0, 1, 1], threshold=0.5) == [0, 0, 1]
+
+
+def test_only_speakers_closer_than_the_threshold_are_merged():
+    # cosine distance of 0.2 between 0 and 1, 0.4 between 1 and 2, 1.0 between 0 and 2
+    embeddings = [[1.0, 0.0], [0.8, 0.6], [0.0, 1.0]]
+    assert cluster(embeddings, windows=[0, 1, 2], threshold=0.1) == [0, 1, 2]
+    assert cluster(embeddings, windows=[0, 1, 2], threshold=0.3) == [0, 0, 1]
+
+
+def test_num_speakers_overrides_the_threshold():
+    embeddings = [[1.0, 0.0], [0.8, 0.6], [0.0, 1.0]]
+    assert cluster(embeddings, windows=[0, 1, 2], threshold=0.1, num_speakers=2) == [0, 0, 1]
+    assert cluster(embeddings, windows=[0, 1, 2], threshold=0.1, num_speakers=1) == [0, 0, 0]
+    # stops merging once num_speakers is reached, even below the threshold
+    assert cluster(embeddings, windows=[0, 1, 2], threshold=2.0, num_speakers=2) == [0, 0, 1]
+
+
+def test_windows_have_equal_length():
+    diariser = WindowedDiariser(window=600)
+    assert diariser.windows(1500) == [(0, 500), (500, 1000), (1000, 1500)]
+    assert diariser.windows(1200) == [(0, 600), (600, 1200)]
+    assert diariser.windows(10) == [(0, 10)]
+
+
+@pytest.mark.parametrize("duration", [1000.1, 3601.7, 7 / 3 * 600])
+def test_the_last_window_ends_exactly_at_the_duration(duration):
+    windows = WindowedDiariser(window=100).windows(duration)
+
+    assert windows[0][0] == 0
+    assert windows[-1][1] == duration
+    assert all(prev[1] == nxt[0] for prev, nxt in zip(windows, windows[1:]))
+    assert all(end - start <= 100 + 1e-9 for start, end in windows)